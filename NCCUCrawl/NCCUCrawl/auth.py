@@ -6,12 +6,13 @@ import ssl
 import requests
 from requests.adapters import HTTPAdapter
 from pyDes import des, ECB, PAD_PKCS5
-from .config import Config
+from .config import get_config
+from .metrics import AUTH_REFRESHES
 
 
 class Authenticate:
     def __init__(self, username: Optional[str] = None, password: Optional[str] = None):
-        self.config = Config()
+        self.config = get_config()
         self._username = username or self.config.USERNAME
         self._password = password or self.config.PASSWORD
         self._token: Optional[str] = None
@@ -124,14 +125,17 @@ class Authenticate:
             if not token:
                 raise Exception("Token not found in response")
             self._token = token
+            AUTH_REFRESHES.inc(result="success")
 
         except requests.exceptions.SSLError as e:
+            AUTH_REFRESHES.inc(result="tls_error")
             if "UNSAFE_LEGACY_RENEGOTIATION_DISABLED" in str(e):
                 raise Exception(
                     "TLS requires UnsafeLegacyRenegotiation. Set OPENSSL_CONF to a config with 'Options = UnsafeLegacyRenegotiation' and rerun."
                 ) from e
             raise
         except Exception as e:
+            AUTH_REFRESHES.inc(result="failure")
             raise Exception(f"Authentication failed: {e}. Trace={self._auth_debug}")
         
     def _extract_token(self, resp: requests.Response) -> Optional[str]:
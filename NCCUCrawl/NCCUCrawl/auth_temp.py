@@ -10,7 +10,7 @@ from requests.adapters import HTTPAdapter
 project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 sys.path.insert(0, project_root)
 
-from NCCUCrawl.NCCUCrawl.config import Config
+from NCCUCrawl.NCCUCrawl.config import get_config
 
 
 class Auth:
@@ -28,7 +28,7 @@ class Auth:
             return res.status_code == 200
 
     def _login_api_endpoint(self):
-        return Config().PERSON_API + self.username + "!!)" + self.password
+        return get_config().PERSON_API + self.username + "!!)" + self.password
 
 
 class AuthClient:
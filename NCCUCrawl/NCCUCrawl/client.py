@@ -1,12 +1,12 @@
 from typing import Optional, Dict, Any, List
 import requests
 from .auth import Authenticate
-from .config import Config
+from .config import get_config
 
 
 class NCCUAPIClient:
     def __init__(self, username: Optional[str] = None, password: Optional[str] = None):
-        self.config = Config()
+        self.config = get_config()
         self.auth = Authenticate(username, password)
         self.session = requests.Session()
 
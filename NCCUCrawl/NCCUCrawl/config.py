@@ -1,48 +1,193 @@
 import os
-from typing import List
+from dataclasses import dataclass
+from functools import cache
+from typing import List, Optional, Tuple
+
+import toml
 from dotenv import load_dotenv
 
-load_dotenv()
+# repository-level config.toml, overridable with NCCU_CONFIG
+CONFIG_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "..", "config.toml"
+)
+
+# Scrapy setting -> Config field; settings win over env, env over config.toml
+SETTINGS_OVERRIDES = {
+    "NCCU_YEAR": "YEAR",
+    "NCCU_SEM": "SEM",
+    "NCCU_SEMESTERS": "SEMESTERS",
+    "NCCU_SERVER_URL": "SERVER_URL",
+    "SQLITE_PATH": "DB",
+}
+
+
+def load_file_config(path: Optional[str] = None) -> dict:
+    """Parse config.toml; a missing file yields an empty mapping."""
+    path = path or os.getenv("NCCU_CONFIG", CONFIG_PATH)
+    if not os.path.exists(path):
+        return {}
+    return toml.load(path)
+
 
+def semester_range(first: str, last: str) -> Tuple[str, ...]:
+    """Every "<year><sem>" from first to last inclusive, two per year."""
+    if not first or not last:
+        return (last,) if last else ()
+    year, sem = int(first[:-1]), int(first[-1])
+    end = (int(last[:-1]), int(last[-1]))
+    semesters = []
+    while (year, sem) <= end:
+        semesters.append(f"{year}{sem}")
+        year, sem = (year, 2) if sem == 1 else (year + 1, 1)
+    return tuple(semesters)
 
+
+def _as_tuple(value) -> Tuple[str, ...]:
+    if isinstance(value, str):
+        value = value.split(",")
+    return tuple(str(v).strip() for v in value or () if str(v).strip())
+
+
+@dataclass(frozen=True)
 class Config:
-    def __init__(self):
-        # Environment variables
-        self.YEAR = os.getenv("YEAR", "")
-        self.SEM = os.getenv("SEM", "")
-        self.USERNAME = os.getenv("USERNAME", "")
-        self.PASSWORD = os.getenv("PASSWORD", "")
+    # Environment variables
+    YEAR: str = ""
+    SEM: str = ""
+    USERNAME: str = ""
+    PASSWORD: str = ""
+
+    # Server configuration
+    SERVER_URL: str = "http://es.nccu.edu.tw/"
+    KEY: str = "vvvdwbvv"
+    SEM_PATH: str = "semester/"
+    PERSON_PATH: str = "person/"
+    COURSE_PATH: str = "course/"
+    TRACE_PATH: str = "tracing/"
+    COURSE_LIST_API: str = "https://es.nccu.edu.tw/course/"
+    UNIT_API: str = "https://qrysub.nccu.edu.tw/assets/api/unit.json"
+    TEACHER_SCHM_BASE_URL: str = "http://newdoc.nccu.edu.tw/teaschm/"
+
+    DB: str = "data.db"
+    # semesters crawled by the full `courses` spider, oldest first
+    SEMESTERS: Tuple[str, ...] = ()
+    # Course result semesters
+    COURSERESULT_YEARSEM: Tuple[str, ...] = ("1102", "1111", "1112", "1121")
+    RATE_QRY: Tuple[str, ...] = ()
 
-        # Server configuration
-        self.SERVER_URL = "http://es.nccu.edu.tw/"
-        self.KEY = "vvvdwbvv"
+    # API endpoints
+    @property
+    def SEM_API(self) -> str:
+        return f"{self.SERVER_URL}{self.SEM_PATH}"
 
-        # API endpoints
-        self.SEM_API = f"{self.SERVER_URL}semester/"
-        self.PERSON_API = f"{self.SERVER_URL}person/"
-        self.COURSE_API = f"{self.SERVER_URL}course/"
-        self.TRACE_API = f"{self.SERVER_URL}tracing/"
+    @property
+    def PERSON_API(self) -> str:
+        return f"{self.SERVER_URL}{self.PERSON_PATH}"
 
-        # Combined year-semester
-        self.YEAR_SEM = f"{self.YEAR}{self.SEM}"
+    @property
+    def COURSE_API(self) -> str:
+        return f"{self.SERVER_URL}{self.COURSE_PATH}"
 
-        # Course result semesters
-        self.COURSERESULT_YEARSEM = ["1102", "1111", "1112", "1121"]
+    @property
+    def TRACE_API(self) -> str:
+        return f"{self.SERVER_URL}{self.TRACE_PATH}"
+
+    # Combined year-semester
+    @property
+    def YEAR_SEM(self) -> str:
+        return f"{self.YEAR}{self.SEM}"
+
+    @classmethod
+    def load(cls, overrides: Optional[dict] = None) -> "Config":
+        """Merge config.toml, then the environment (.env), then `overrides`."""
+        load_dotenv()
+        file_config = load_file_config()
+        general = file_config.get("general", {})
+        urls = file_config.get("urls", {})
+        results = file_config.get("course_results", {})
+
+        values = {
+            "YEAR": str(general.get("year", "")),
+            "SEM": str(general.get("sem", "")),
+            "DB": general.get("db", cls.DB),
+            "SERVER_URL": urls.get("server_url", cls.SERVER_URL),
+            "SEM_PATH": urls.get("sem_api", cls.SEM_PATH),
+            "PERSON_PATH": urls.get("person_api", cls.PERSON_PATH),
+            "COURSE_PATH": urls.get("course_api", cls.COURSE_PATH),
+            "TRACE_PATH": urls.get("trace_api", cls.TRACE_PATH),
+            "COURSE_LIST_API": urls.get("course_list_api", cls.COURSE_LIST_API),
+            "UNIT_API": urls.get("unit_api", cls.UNIT_API),
+            "TEACHER_SCHM_BASE_URL": urls.get(
+                "teacher_schm_base_url", cls.TEACHER_SCHM_BASE_URL
+            ),
+            "COURSERESULT_YEARSEM": _as_tuple(
+                results.get("years", cls.COURSERESULT_YEARSEM)
+            ),
+            "RATE_QRY": _as_tuple(urls.get("rate_query", ())),
+        }
+
+        for env, field in (
+            ("YEAR", "YEAR"),
+            ("SEM", "SEM"),
+            ("USERNAME", "USERNAME"),
+            ("PASSWORD", "PASSWORD"),
+            ("RATE_QRY", "RATE_QRY"),
+        ):
+            if os.getenv(env):
+                values[field] = os.getenv(env)
+
+        values.update(overrides or {})
+        values["RATE_QRY"] = _as_tuple(values["RATE_QRY"])
+        if values.get("SEMESTERS"):
+            values["SEMESTERS"] = _as_tuple(values["SEMESTERS"])
+        else:
+            values["SEMESTERS"] = semester_range(
+                str(general.get("first_semester", "")),
+                f"{values['YEAR']}{values['SEM']}",
+            )
+        return cls(**values)
 
     def teacher_url(self, teacher_id: str, year_sem: str = None) -> str:
         year_sem = year_sem or self.YEAR_SEM
-        return f"http://newdoc.nccu.edu.tw/teaschm/{year_sem}/statistic.jsp-tnum={teacher_id}.htm"
+        return f"{self.TEACHER_SCHM_BASE_URL}{year_sem}/statistic.jsp-tnum={teacher_id}.htm"
 
     def course_rate_url(self, param: str, year_sem: str = None) -> str:
         year_sem = year_sem or self.YEAR_SEM
-        return f"http://newdoc.nccu.edu.tw/teaschm/{year_sem}/{param}"
+        return f"{self.TEACHER_SCHM_BASE_URL}{year_sem}/{param}"
+
+    def course_list_url(self, sem: str, dp1: str, dp2: str, dp3: str) -> str:
+        # ex: https://es.nccu.edu.tw/course/zh-TW/:sem=1131%20:dp1=01%20:dp2=A1%20:dp3=105%20/
+        return (
+            f"{self.COURSE_LIST_API}zh-TW/"
+            f":sem={sem}%20:dp1={dp1}%20:dp2={dp2}%20:dp3={dp3}"
+        )
+
+    def course_detail_url(self, course_id: str, lang: str = "zh-TW") -> str:
+        return f"{self.COURSE_API}{lang}/{course_id}/"
 
     def get_rate_qry(self) -> List[str]:
-        rate_qry_env = os.getenv("RATE_QRY", "")
-        return rate_qry_env.split(",") if rate_qry_env else []
+        return list(self.RATE_QRY)
 
     def courseresult_csv(self, sem: str) -> str:
         return f"{sem}CourseResult.csv"
 
 
-config = Config()
+@cache
+def _cached_config(overrides: Tuple[Tuple[str, object], ...]) -> Config:
+    return Config.load(dict(overrides))
+
+
+def get_config(settings=None) -> Config:
+    """
+    The process-wide Config, loaded on first use. Pass the crawler/spider
+    settings to apply NCCU_* / SQLITE_PATH overrides; each distinct set of
+    overrides is loaded once.
+    """
+    overrides = []
+    if settings is not None:
+        for name, field in SETTINGS_OVERRIDES.items():
+            value = settings.get(name)
+            if value:
+                if isinstance(value, list):
+                    value = tuple(value)
+                overrides.append((field, value))
+    return _cached_config(tuple(sorted(overrides)))
@@ -0,0 +1,235 @@
+"""
+Resolve where crawled data lives and stitch sharded SQLite files together.
+
+The database path comes from the SQLITE_PATH setting, then `[general] db`
+in config.toml, then data.db. With SQLITE_SHARD = "spider" or "semester",
+StoragePipeline writes to `<stem>.<key><suffix>` next to that path
+(data.remain.db, data.1141.db, ...), so a `remain` poll and a `courses`
+backfill no longer contend for one WAL write lock. Rows without a semester
+(teachers) and interned rate comments (rate_content) stay in the base file.
+
+    python3 -m NCCUCrawl.database list
+    python3 -m NCCUCrawl.database merge [--delete]
+
+`open_unified` gives a read-only connection whose temp views UNION ALL the
+base file and its shards; `merge_shards` folds the shards back into the
+base file for tools (search, export) that need one database.
+"""
+
+import argparse
+import glob
+import os
+import sqlite3
+import sys
+from typing import List, Optional
+
+from scrapy.utils.project import get_project_settings
+
+from NCCUCrawl.config import get_config
+from NCCUCrawl.schema import ensure_course_fts, migrate
+
+SHARD_MODES = ("spider", "semester")
+
+# item class -> fields whose values give the "<year><sem>" shard key; a
+# single field is an id that starts with the year-semester
+SEMESTER_FIELDS = {
+    "CourseItem": ("year", "semester"),
+    "CourseLegacyItem": ("y", "s"),
+    "CourseRemainItem": ("course_id",),
+    "RateItem": ("courseId",),
+    "RateLegacyItem": ("courseId",),
+    "RemainLegacyItem": ("id",),
+}
+
+# tables that belong to one file and are never merged or unioned
+LOCAL_TABLES = ("schema_version", "course_fts", "dead_letter")
+
+# dead_letter columns carried over by merge_shards; ids are per file
+DEAD_LETTER_COLUMNS = (
+    "spider",
+    "url",
+    "reason",
+    "attempts",
+    "request",
+    "body",
+    "failed_at",
+)
+
+
+def resolve_db_path(settings=None) -> str:
+    """SQLITE_PATH setting, then config.toml `[general] db`, then data.db."""
+    return get_config(settings).DB
+
+
+def shard_path(base: str, key: str) -> str:
+    stem, suffix = os.path.splitext(base)
+    return f"{stem}.{key}{suffix or '.db'}"
+
+
+def list_shards(base: str) -> List[str]:
+    stem, suffix = os.path.splitext(base)
+    return sorted(glob.glob(f"{glob.escape(stem)}.*{suffix or '.db'}"))
+
+
+def item_semester(item) -> Optional[str]:
+    """The "<year><sem>" an item belongs to, or None (e.g. teachers)."""
+    fields = SEMESTER_FIELDS.get(item.__class__.__name__)
+    if not fields:
+        return None
+    if len(fields) == 1:
+        key = str(item.get(fields[0]) or "")[:4]
+    else:
+        key = "".join(str(item.get(field) or "") for field in fields)
+    return key if len(key) == 4 and key.isdigit() else None
+
+
+def _user_tables(conn: sqlite3.Connection, schema: str = "main") -> List[str]:
+    rows = conn.execute(
+        f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table' "
+        "AND name NOT LIKE 'sqlite_%' ORDER BY name"
+    )
+    return [
+        name
+        for (name,) in rows
+        if not any(name == t or name.startswith(f"{t}_") for t in LOCAL_TABLES)
+    ]
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f'PRAGMA {schema}.table_info("{table}")')]
+
+
+def open_unified(base: str, shards: Optional[List[str]] = None) -> sqlite3.Connection:
+    """
+    Read-only connection over the base file and its shards.
+
+    Every data table is a temp view that UNION ALLs the attached files, so
+    queries run unchanged; course_fts is per file and not available here.
+    """
+    if shards is None:
+        shards = list_shards(base)
+    paths = ([base] if os.path.exists(base) else []) + list(shards)
+    if not paths:
+        raise FileNotFoundError(base)
+
+    conn = sqlite3.connect(":memory:")
+    limit = 10
+    if hasattr(conn, "getlimit"):
+        limit = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+    if len(paths) > limit:
+        conn.close()
+        raise ValueError(
+            f"{len(paths)} database files exceed SQLite's attach limit ({limit}); "
+            "run `python3 -m NCCUCrawl.database merge` first"
+        )
+
+    sources = {}
+    for i, path in enumerate(paths):
+        alias = f"s{i}"
+        conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+        for table in _user_tables(conn, alias):
+            sources.setdefault(table, []).append(alias)
+
+    for table, aliases in sources.items():
+        # column order can differ between files migrated at different times
+        columns = ", ".join(f'"{c}"' for c in _columns(conn, aliases[0], table))
+        union = " UNION ALL ".join(
+            f'SELECT {columns} FROM {alias}."{table}"' for alias in aliases
+        )
+        conn.execute(f'CREATE TEMP VIEW "{table}" AS {union}')
+    conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def merge_shards(
+    base: str, shards: Optional[List[str]] = None, delete: bool = False
+) -> dict:
+    """
+    Upsert every shard's rows into the base file (created and migrated if
+    needed). Dead letters are appended under new ids, so DEAD_LETTER_REPLAY
+    on the base file still finds them. Returns {table: rows merged}; with
+    delete=True merged shard files are removed.
+    """
+    if shards is None:
+        shards = list_shards(base)
+
+    counts: dict = {}
+    conn = sqlite3.connect(base)
+    try:
+        migrate(conn)
+        for path in shards:
+            conn.execute("ATTACH DATABASE ? AS shard", (path,))
+            try:
+                with conn:
+                    for table in _user_tables(conn, "shard"):
+                        target = _columns(conn, "main", table)
+                        if not target:
+                            continue
+                        columns = ", ".join(
+                            f'"{c}"'
+                            for c in _columns(conn, "shard", table)
+                            if c in target
+                        )
+                        cur = conn.execute(
+                            f'INSERT OR REPLACE INTO main."{table}" ({columns}) '
+                            f'SELECT {columns} FROM shard."{table}"'
+                        )
+                        counts[table] = counts.get(table, 0) + cur.rowcount
+                    if _columns(conn, "shard", "dead_letter"):
+                        columns = ", ".join(DEAD_LETTER_COLUMNS)
+                        # merging the same shard twice must not replay twice
+                        cur = conn.execute(
+                            f"INSERT INTO main.dead_letter ({columns}) "
+                            f"SELECT {columns} FROM shard.dead_letter AS s "
+                            "WHERE NOT EXISTS (SELECT 1 FROM main.dead_letter AS d "
+                            "WHERE d.spider IS s.spider AND d.url IS s.url "
+                            "AND d.request IS s.request) ORDER BY id"
+                        )
+                        counts["dead_letter"] = (
+                            counts.get("dead_letter", 0) + cur.rowcount
+                        )
+            finally:
+                conn.execute("DETACH DATABASE shard")
+
+        # REPLACE deletes skip the FTS delete trigger, so rebuild once
+        if counts.get("course"):
+            try:
+                ensure_course_fts(conn)
+                conn.execute("INSERT INTO course_fts(course_fts) VALUES('rebuild')")
+                conn.commit()
+            except sqlite3.OperationalError:
+                pass
+    finally:
+        conn.close()
+
+    if delete:
+        for path in shards:
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+    return counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or merge sharded databases")
+    parser.add_argument("--db", default=None, help="base database (default: resolved)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="list shard files next to the base database")
+    merge = sub.add_parser("merge", help="merge shard files into the base database")
+    merge.add_argument("shards", nargs="*", help="shard files (default: all)")
+    merge.add_argument("--delete", action="store_true", help="remove merged shards")
+    args = parser.parse_args(argv)
+
+    base = args.db or resolve_db_path(get_project_settings())
+    if args.command == "list":
+        for path in list_shards(base):
+            print(path)
+        return
+
+    counts = merge_shards(base, args.shards or None, delete=args.delete)
+    for table, count in sorted(counts.items()):
+        print(f"{table}: {count}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
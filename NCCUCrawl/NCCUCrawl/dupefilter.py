@@ -0,0 +1,284 @@
+"""
+Duplicate request filtering in a few MB instead of a set of fingerprints.
+
+RFPDupeFilter keeps every 20-byte fingerprint in a Python set (~90 bytes
+each with the set overhead), which grows to hundreds of MB on full
+multi-semester runs. BloomDupeFilter keeps them in a scalable Bloom filter
+(a chain of bitmaps, each twice the size and with half the error of the
+previous one) so the false-positive rate stays at DUPEFILTER_BLOOM_ERROR_RATE
+however many requests a run makes. A false positive drops a request that
+was never sent, so requests whose loss would drop a course are checked
+against an exact set instead: URLs matching DUPEFILTER_EXACT_PATTERNS
+(course detail, syllabus, statistic and remain pages) and any request
+carrying the item it completes in meta["item"].
+
+With JOBDIR (or DUPEFILTER_BLOOM_PATH) the bitmaps are saved on close to
+`requests.bloom` and the exact fingerprints appended to `requests.exact`,
+and both are loaded again by the next run.
+"""
+
+import hashlib
+import logging
+import math
+import os
+import re
+import struct
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.utils.job import job_dir
+from scrapy.utils.request import RequestFingerprinter, referer_str
+
+logger = logging.getLogger(__name__)
+
+BLOOM_FILE = "requests.bloom"
+EXACT_FILE = "requests.exact"
+
+_MAGIC = b"NCCUBLM1"
+# error rate, initial capacity, number of slices
+_HEADER = struct.Struct(">dQI")
+# capacity, count, bits, hashes
+_SLICE = struct.Struct(">QQQI")
+# each slice gets this share of the previous slice's error rate
+_TIGHTENING = 0.5
+_GROWTH = 2
+
+
+class BloomSlice:
+    """A fixed-capacity Bloom filter using double hashing over one digest."""
+
+    def __init__(self, capacity: int, error_rate: float, bits=None, count: int = 0):
+        self.capacity = capacity
+        nbits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.nbits = max(nbits, 8)
+        self.hashes = max(1, round(self.nbits / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.nbits + 7) // 8)
+        self.count = count
+
+    def _positions(self, h1: int, h2: int) -> Iterator[int]:
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.nbits
+
+    def __contains__(self, hashes) -> bool:
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(*hashes))
+
+    def add(self, hashes):
+        bits = self.bits
+        for p in self._positions(*hashes):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.capacity
+
+
+class ScalableBloomFilter:
+    """
+    Membership of byte strings at a bounded false-positive rate.
+
+    Slice i holds capacity * 2**i items at error_rate * (1 - r) * r**i, so
+    the combined rate stays below error_rate as slices are added.
+    """
+
+    def __init__(self, error_rate: float = 0.001, capacity: int = 1_000_000):
+        if not 0 < error_rate < 1:
+            raise ValueError(f"error_rate must be in (0, 1), got {error_rate}")
+        self.error_rate = error_rate
+        self.capacity = max(capacity, 1)
+        self.slices: List[BloomSlice] = []
+
+    @staticmethod
+    def _hashes(key: bytes):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        return int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+
+    def _new_slice(self) -> BloomSlice:
+        i = len(self.slices)
+        rate = self.error_rate * (1 - _TIGHTENING) * _TIGHTENING**i
+        return BloomSlice(self.capacity * _GROWTH**i, rate)
+
+    def __contains__(self, key: bytes) -> bool:
+        hashes = self._hashes(key)
+        return any(hashes in s for s in reversed(self.slices))
+
+    def add(self, key: bytes) -> bool:
+        """Add `key`; True if it was (probably) present already."""
+        hashes = self._hashes(key)
+        if any(hashes in s for s in reversed(self.slices)):
+            return True
+        if not self.slices or self.slices[-1].full:
+            self.slices.append(self._new_slice())
+        self.slices[-1].add(hashes)
+        return False
+
+    def __len__(self) -> int:
+        return sum(s.count for s in self.slices)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(len(s.bits) for s in self.slices)
+
+    def save(self, path: Path):
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with tmp.open("wb") as f:
+            f.write(_MAGIC)
+            f.write(_HEADER.pack(self.error_rate, self.capacity, len(self.slices)))
+            for s in self.slices:
+                f.write(_SLICE.pack(s.capacity, s.count, s.nbits, s.hashes))
+                f.write(s.bits)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> "ScalableBloomFilter":
+        data = path.read_bytes()
+        if not data.startswith(_MAGIC):
+            raise ValueError(f"{path} is not a Bloom filter file")
+        pos = len(_MAGIC)
+        error_rate, capacity, nslices = _HEADER.unpack_from(data, pos)
+        pos += _HEADER.size
+        bloom = cls(error_rate, capacity)
+        for _ in range(nslices):
+            slice_capacity, count, nbits, hashes = _SLICE.unpack_from(data, pos)
+            pos += _SLICE.size
+            size = (nbits + 7) // 8
+            if pos + size > len(data):
+                raise ValueError(f"{path} is truncated")
+            s = bloom._new_slice()
+            if (s.capacity, s.nbits, s.hashes) != (slice_capacity, nbits, hashes):
+                raise ValueError(f"{path} slice layout does not match its header")
+            s.bits = bytearray(data[pos : pos + size])
+            s.count = count
+            pos += size
+            bloom.slices.append(s)
+        return bloom
+
+
+def _read_fingerprints(data: bytes) -> Iterator[bytes]:
+    # same framing as Scrapy's requests.seen: 2-byte big-endian length + bytes
+    pos = 0
+    while pos + 2 <= len(data):
+        size = int.from_bytes(data[pos : pos + 2], "big")
+        pos += 2
+        if pos + size > len(data):
+            return
+        yield data[pos : pos + size]
+        pos += size
+
+
+class BloomDupeFilter(BaseDupeFilter):
+    """
+    RFPDupeFilter with the fingerprint set replaced by ScalableBloomFilter.
+
+    Requests whose URL matches one of `exact_patterns`, or that carry a
+    meta["item"], are checked against an exact fingerprint set, so they are
+    never dropped by a false positive.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        debug: bool = False,
+        *,
+        fingerprinter=None,
+        error_rate: float = 0.001,
+        capacity: int = 1_000_000,
+        exact_patterns: Iterable[str] = (),
+        stats=None,
+    ):
+        self.fingerprinter = fingerprinter or RequestFingerprinter()
+        self.debug = debug
+        self.logdupes = True
+        self.stats = stats
+        self.exact_re = (
+            re.compile("|".join(f"(?:{p})" for p in exact_patterns))
+            if exact_patterns
+            else None
+        )
+        self.exact = set()
+        self.bloom_path = Path(path, BLOOM_FILE) if path else None
+        self.exact_file = None
+
+        self.bloom = None
+        if self.bloom_path and self.bloom_path.exists():
+            try:
+                self.bloom = ScalableBloomFilter.load(self.bloom_path)
+            except (ValueError, struct.error) as e:
+                logger.warning(f"Ignoring Bloom filter {self.bloom_path}: {e}")
+            else:
+                if self.bloom.error_rate != error_rate:
+                    logger.info(
+                        f"{self.bloom_path} keeps its error rate "
+                        f"{self.bloom.error_rate} (DUPEFILTER_BLOOM_ERROR_RATE "
+                        f"applies to new filters)"
+                    )
+        if self.bloom is None:
+            self.bloom = ScalableBloomFilter(error_rate, capacity)
+
+        if path:
+            Path(path).mkdir(parents=True, exist_ok=True)
+            self.exact_file = Path(path, EXACT_FILE).open("a+b")
+            self.exact_file.seek(0)
+            self.exact.update(_read_fingerprints(self.exact_file.read()))
+        if len(self.bloom) or self.exact:
+            logger.info(
+                f"Loaded {len(self.bloom)} Bloom and {len(self.exact)} exact "
+                f"fingerprints from {path}"
+            )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            settings.get("DUPEFILTER_BLOOM_PATH") or job_dir(settings),
+            settings.getbool("DUPEFILTER_DEBUG"),
+            fingerprinter=crawler.request_fingerprinter,
+            error_rate=settings.getfloat("DUPEFILTER_BLOOM_ERROR_RATE", 0.001),
+            capacity=settings.getint("DUPEFILTER_BLOOM_CAPACITY", 1_000_000),
+            exact_patterns=settings.getlist("DUPEFILTER_EXACT_PATTERNS"),
+            stats=crawler.stats,
+        )
+
+    def _exact(self, request) -> bool:
+        if "item" in request.meta:
+            return True
+        return self.exact_re is not None and bool(self.exact_re.search(request.url))
+
+    def request_seen(self, request) -> bool:
+        fp = self.fingerprinter.fingerprint(request)
+        if self._exact(request):
+            if fp in self.exact:
+                return True
+            self.exact.add(fp)
+            if self.exact_file:
+                self.exact_file.write(len(fp).to_bytes(2, "big") + fp)
+            return False
+        return self.bloom.add(fp)
+
+    def close(self, reason):
+        if self.stats is not None:
+            self.stats.set_value("dupefilter/bloom/fingerprints", len(self.bloom))
+            self.stats.set_value("dupefilter/bloom/slices", len(self.bloom.slices))
+            self.stats.set_value("dupefilter/bloom/bytes", self.bloom.nbytes)
+            self.stats.set_value("dupefilter/exact/fingerprints", len(self.exact))
+        if self.exact_file:
+            self.exact_file.close()
+        if self.bloom_path:
+            self.bloom.save(self.bloom_path)
+
+    def log(self, request, spider):
+        if self.debug:
+            msg = "Filtered duplicate request: %(request)s (referer: %(referer)s)"
+            args = {"request": request, "referer": referer_str(request)}
+            logger.debug(msg, args, extra={"spider": spider})
+        elif self.logdupes:
+            msg = (
+                "Filtered duplicate request: %(request)s"
+                " - no more duplicates will be shown"
+                " (see DUPEFILTER_DEBUG to show all duplicates)"
+            )
+            logger.debug(msg, {"request": request}, extra={"spider": spider})
+            self.logdupes = False
+        spider.crawler.stats.inc_value("dupefilter/filtered")
@@ -0,0 +1,441 @@
+"""
+Stream SQLite tables to portable SQL, CSV, JSONL or partitioned Parquet.
+
+Replaces `sqlite3 data.db ".dump COURSE"` + quickfix.py: rows are read in
+chunks and written as they arrive, so memory stays flat regardless of
+table size, and literals are escaped directly instead of being patched
+afterwards with regexes.
+
+    python3 -m NCCUCrawl.export course -o output_fixed.sql
+    python3 -m NCCUCrawl.export course rate -f jsonl -o export.jsonl
+    python3 -m NCCUCrawl.export -f parquet -o analytics/
+
+Parquet output needs pyarrow (optional, not in requirements.txt). Tables
+with a semester are written as `<table>/year=.../semester=.../*.parquet`;
+re-running only appends semesters that are not exported yet, so reports
+can read the dataset instead of the live data.db.
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import shutil
+import sqlite3
+import sys
+import uuid
+from typing import Iterator, List, Optional, TextIO
+
+from scrapy.utils.project import get_project_settings
+
+from NCCUCrawl.database import resolve_db_path
+
+CHUNK_SIZE = 1000
+PARQUET_CHUNK_SIZE = 50_000
+
+# table -> SQL expressions for the (year, semester) partition columns
+PARQUET_PARTITIONS = {
+    "course": ("year", "semester"),
+    "course_remain": ("substr(course_id, 1, 3)", "substr(course_id, 4, 1)"),
+    "rate": ("substr(course_id, 1, 3)", "substr(course_id, 4, 1)"),
+    "course_legacy": ("y", "s"),
+    "remain_legacy": ("substr(id, 1, 3)", "substr(id, 4, 1)"),
+    "teacher": None,
+    "teacher_legacy": None,
+    "rate_legacy": None,
+    "rate_content": None,
+}
+
+# low-cardinality text columns stored as Arrow dictionaries
+PARQUET_CATEGORICAL = {
+    "course": [
+        "teacher_id",
+        "lang",
+        "lang_en",
+        "sem_qty_en",
+        "unit",
+        "unit_en",
+        "college",
+        "degree",
+        "department",
+        "transition_type",
+        "transition_type_en",
+        "discipline",
+    ],
+    "course_legacy": [
+        "teacher",
+        "teacherEn",
+        "lmtKind",
+        "lmtKindEn",
+        "lang",
+        "langEn",
+        "semQty",
+        "unit",
+        "unitEn",
+        "dp1",
+        "dp2",
+        "dp3",
+        "tranTpe",
+        "tranTpeEn",
+    ],
+    "rate": ["teacher_id"],
+    "rate_legacy": ["teacherId"],
+    "teacher": ["department", "first_appear"],
+}
+
+_CONTROL = re.compile(r"[\n\r\t]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def sql_literal(value, flatten: bool = True) -> str:
+    """Render a Python value from sqlite3 as a SQL literal."""
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float):
+        if math.isnan(value):
+            return "NULL"
+        if math.isinf(value):
+            # SQLite has no inf literal; out-of-range reals read back as +-Inf
+            return "9e999" if value > 0 else "-9e999"
+        return repr(value)
+    if isinstance(value, int):
+        return repr(value)
+    if isinstance(value, bytes):
+        return f"X'{value.hex()}'"
+
+    text = str(value)
+    if flatten and _CONTROL.search(text):
+        # same output as quickfix.py: no raw line breaks inside statements
+        text = _WHITESPACE.sub(" ", text).strip()
+    return "'" + text.replace("'", "''") + "'"
+
+
+def quote_identifier(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def list_tables(conn: sqlite3.Connection) -> List[str]:
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+    )
+    return [row[0] for row in rows]
+
+
+def resolve_table(conn: sqlite3.Connection, name: str) -> str:
+    """Map a (case-insensitive) table name to its stored spelling."""
+    for table in list_tables(conn):
+        if table.lower() == name.lower():
+            return table
+    raise ValueError(f"unknown table: {name}")
+
+
+def iter_rows(
+    conn: sqlite3.Connection, table: str, chunk_size: int = CHUNK_SIZE
+) -> Iterator[tuple]:
+    cur = conn.execute(f"SELECT * FROM {quote_identifier(table)}")
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [
+        row[1] for row in conn.execute(f"PRAGMA table_info({quote_identifier(table)})")
+    ]
+
+
+def export_sql(
+    conn: sqlite3.Connection,
+    tables: List[str],
+    out: TextIO,
+    chunk_size: int = CHUNK_SIZE,
+    schema: bool = False,
+    flatten: bool = True,
+) -> int:
+    count = 0
+    out.write("BEGIN TRANSACTION;\n")
+    for table in tables:
+        if schema:
+            (ddl,) = conn.execute(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (table,),
+            ).fetchone()
+            ddl = re.sub(
+                r"^CREATE TABLE(?! IF NOT EXISTS)", "CREATE TABLE IF NOT EXISTS", ddl
+            )
+            out.write(f"{ddl};\n")
+
+        columns = ", ".join(quote_identifier(c) for c in table_columns(conn, table))
+        prefix = f"INSERT OR REPLACE INTO {quote_identifier(table)} ({columns}) VALUES("
+        for row in iter_rows(conn, table, chunk_size):
+            out.write(prefix)
+            out.write(",".join(sql_literal(v, flatten) for v in row))
+            out.write(");\n")
+            count += 1
+    out.write("COMMIT;\n")
+    return count
+
+
+def export_csv(
+    conn: sqlite3.Connection,
+    tables: List[str],
+    out: TextIO,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    count = 0
+    writer = csv.writer(out)
+    multi = len(tables) > 1
+    for table in tables:
+        header = table_columns(conn, table)
+        writer.writerow((["table"] if multi else []) + header)
+        for row in iter_rows(conn, table, chunk_size):
+            writer.writerow(((table,) if multi else ()) + row)
+            count += 1
+    return count
+
+
+def export_jsonl(
+    conn: sqlite3.Connection,
+    tables: List[str],
+    out: TextIO,
+    chunk_size: int = CHUNK_SIZE,
+) -> int:
+    count = 0
+    for table in tables:
+        columns = table_columns(conn, table)
+        for row in iter_rows(conn, table, chunk_size):
+            record = dict(zip(columns, row))
+            record["_table"] = table
+            out.write(json.dumps(record, ensure_ascii=False))
+            out.write("\n")
+            count += 1
+    return count
+
+
+def _arrow_column(pa, decl_type: str, values: list):
+    """Build an Arrow array typed from the SQLite column declaration."""
+    decl_type = (decl_type or "").upper()
+    if "INT" in decl_type:
+        return pa.array([_as_number(v, int) for v in values], type=pa.int64())
+    if "REAL" in decl_type or "FLOA" in decl_type or "DOUB" in decl_type:
+        return pa.array([_as_number(v, float) for v in values], type=pa.float64())
+    if "BOOL" in decl_type:
+        return pa.array([None if v is None else bool(v) for v in values], pa.bool_())
+    return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def _as_number(value, kind):
+    if value is None or value == "":
+        return None
+    try:
+        return kind(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _existing_partitions(table_dir: str) -> List[tuple]:
+    found = []
+    if not os.path.isdir(table_dir):
+        return found
+    for year_dir in os.listdir(table_dir):
+        if not year_dir.startswith("year="):
+            continue
+        for sem_dir in os.listdir(os.path.join(table_dir, year_dir)):
+            if sem_dir.startswith("semester="):
+                found.append((year_dir[5:], sem_dir[9:]))
+    return found
+
+
+def export_parquet(
+    conn: sqlite3.Connection,
+    tables: List[str],
+    output_dir: str,
+    chunk_size: int = PARQUET_CHUNK_SIZE,
+    refresh: Optional[List[str]] = None,
+) -> int:
+    """Write tables to Parquet, appending only semesters not exported yet."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError(
+            "Parquet export requires pyarrow: pip install pyarrow"
+        ) from e
+
+    refresh = set(refresh or [])
+    run_id = uuid.uuid4().hex[:8]
+    count = 0
+
+    for table in tables:
+        table_dir = os.path.join(output_dir, table)
+        info = list(conn.execute(f"PRAGMA table_info({quote_identifier(table)})"))
+        columns = [row[1] for row in info]
+        decl_types = [row[2] for row in info]
+        categorical = set(PARQUET_CATEGORICAL.get(table, []))
+        partition = PARQUET_PARTITIONS.get(table)
+
+        select = ", ".join(quote_identifier(c) for c in columns)
+        params: list = []
+        where = ""
+        if partition:
+            # NULL / empty values go to the "unknown" partition, in the
+            # select and in the incremental filter alike
+            year_expr, sem_expr = (
+                f"COALESCE(NULLIF({expr}, ''), 'unknown')" for expr in partition
+            )
+            select += f", {year_expr} AS year_part, {sem_expr} AS semester_part"
+            done = []
+            for year, sem in _existing_partitions(table_dir):
+                if f"{year}{sem}" in refresh:
+                    shutil.rmtree(
+                        os.path.join(table_dir, f"year={year}", f"semester={sem}")
+                    )
+                else:
+                    done.append((year, sem))
+            if done:
+                placeholders = ", ".join("?" * len(done))
+                where = (
+                    f" WHERE ({year_expr} || '/' || {sem_expr}) NOT IN ({placeholders})"
+                )
+                params = [f"{year}/{sem}" for year, sem in done]
+        elif os.path.isdir(table_dir):
+            # small, unpartitioned tables are rewritten on every run
+            shutil.rmtree(table_dir)
+
+        cur = conn.execute(
+            f"SELECT {select} FROM {quote_identifier(table)}{where}", params
+        )
+        chunk_no = 0
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+
+            values = list(zip(*rows))
+            arrays = {}
+            for i, name in enumerate(columns):
+                array = _arrow_column(pa, decl_types[i], list(values[i]))
+                if name in categorical:
+                    array = array.dictionary_encode()
+                arrays[name] = array
+
+            if partition:
+                arrays["year"] = pa.array(
+                    [v or "unknown" for v in values[-2]], pa.string()
+                )
+                arrays["semester"] = pa.array(
+                    [v or "unknown" for v in values[-1]], pa.string()
+                )
+                pq.write_to_dataset(
+                    pa.table(arrays),
+                    table_dir,
+                    partition_cols=["year", "semester"],
+                    basename_template=f"{run_id}-{chunk_no}-{{i}}.parquet",
+                    existing_data_behavior="overwrite_or_ignore",
+                )
+            else:
+                os.makedirs(table_dir, exist_ok=True)
+                pq.write_table(
+                    pa.table(arrays),
+                    os.path.join(table_dir, f"{run_id}-{chunk_no}.parquet"),
+                )
+
+            chunk_no += 1
+            count += len(rows)
+
+    return count
+
+
+def export(
+    db_path: str,
+    tables: List[str],
+    fmt: str = "sql",
+    output: Optional[str] = None,
+    chunk_size: Optional[int] = None,
+    schema: bool = False,
+    flatten: bool = True,
+    refresh: Optional[List[str]] = None,
+) -> int:
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        tables = [resolve_table(conn, t) for t in tables]
+        if fmt == "parquet":
+            tables = tables or [t for t in list_tables(conn) if t in PARQUET_PARTITIONS]
+            if output in (None, "-"):
+                raise ValueError("Parquet export needs an output directory (-o)")
+            return export_parquet(
+                conn, tables, output, chunk_size or PARQUET_CHUNK_SIZE, refresh
+            )
+
+        tables = tables or list_tables(conn)
+        out = (
+            sys.stdout
+            if output in (None, "-")
+            else open(output, "w", encoding="utf-8", newline="")
+        )
+        try:
+            if fmt == "sql":
+                return export_sql(
+                    conn, tables, out, chunk_size or CHUNK_SIZE, schema, flatten
+                )
+            if fmt == "csv":
+                return export_csv(conn, tables, out, chunk_size or CHUNK_SIZE)
+            if fmt == "jsonl":
+                return export_jsonl(conn, tables, out, chunk_size or CHUNK_SIZE)
+            raise ValueError(f"unknown format: {fmt}")
+        finally:
+            if out is not sys.stdout:
+                out.close()
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export crawled tables from SQLite")
+    parser.add_argument("tables", nargs="*", help="tables to export (default: all)")
+    parser.add_argument("--db", default=resolve_db_path(get_project_settings()))
+    parser.add_argument(
+        "-f", "--format", choices=["sql", "csv", "jsonl", "parquet"], default="sql"
+    )
+    parser.add_argument(
+        "-o", "--output", help="output file, or directory for parquet (default: stdout)"
+    )
+    parser.add_argument("--chunk-size", type=int)
+    parser.add_argument(
+        "--schema", action="store_true", help="emit CREATE TABLE IF NOT EXISTS"
+    )
+    parser.add_argument(
+        "--keep-newlines",
+        action="store_true",
+        help="keep line breaks inside SQL string literals",
+    )
+    parser.add_argument(
+        "--refresh",
+        nargs="*",
+        default=[],
+        metavar="YEARSEM",
+        help="parquet: re-export these semesters (e.g. 1141) instead of skipping them",
+    )
+    args = parser.parse_args(argv)
+
+    count = export(
+        args.db,
+        args.tables,
+        fmt=args.format,
+        output=args.output,
+        chunk_size=args.chunk_size,
+        schema=args.schema,
+        flatten=not args.keep_newlines,
+        refresh=args.refresh,
+    )
+    print(f"Exported {count} rows", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
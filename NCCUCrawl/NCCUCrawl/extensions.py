@@ -0,0 +1,223 @@
+# Define here your extensions
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+
+import logging
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet.error import CannotListenError
+from twisted.web.resource import Resource
+from twisted.web.server import Site
+
+from NCCUCrawl.metrics import (
+    ITEMS_DROPPED,
+    ITEMS_SCRAPED,
+    REGISTRY,
+    SPIDER_ERRORS,
+    sanitize,
+)
+
+logger = logging.getLogger(__name__)
+
+# gauge name -> (help, reading of the running engine)
+ENGINE_GAUGES = {
+    "nccu_queue_depth": (
+        "Requests waiting in the scheduler.",
+        lambda engine: len(engine.scheduler),
+    ),
+    "nccu_inflight_requests": (
+        "Requests handed to the downloader and not finished yet.",
+        lambda engine: len(engine.downloader.active),
+    ),
+    "nccu_scraper_active": (
+        "Responses and items being processed by callbacks and pipelines.",
+        lambda engine: len(engine.scraper.slot.active),
+    ),
+    "nccu_scraper_active_bytes": (
+        "Response bytes held by the scraper.",
+        lambda engine: engine.scraper.slot.active_size,
+    ),
+}
+
+# Scrapy stats key prefix -> (metric name, type, help, label name)
+STATS_FAMILIES = [
+    (
+        "downloader/response_status_count/",
+        "nccu_responses_total",
+        "counter",
+        "Responses by HTTP status.",
+        "status",
+    ),
+    (
+        "downloader/exception_type_count/",
+        "nccu_download_errors_total",
+        "counter",
+        "Download errors by exception class.",
+        "error",
+    ),
+    (
+        "retry/classified/",
+        "nccu_retries_total",
+        "counter",
+        "Retries by NccucrawlDownloaderMiddleware classification.",
+        "reason",
+    ),
+    (
+        "dead_letter/",
+        "nccu_dead_letters_total",
+        "counter",
+        "Requests written to the dead_letter table, by reason.",
+        "reason",
+    ),
+]
+
+
+# roll-up keys under the prefixes above that are not a label value
+STATS_TOTALS = ("count", "replayed")
+
+
+class MetricsResource(Resource):
+    isLeaf = True
+
+    def __init__(self, render):
+        super().__init__()
+        self._render = render
+
+    def render_GET(self, request):
+        if request.path != b"/metrics":
+            request.setResponseCode(404)
+            return b"not found\n"
+        request.setHeader(b"Content-Type", b"text/plain; version=0.0.4; charset=utf-8")
+        return self._render().encode("utf-8")
+
+
+class MetricsExtension:
+    """
+    Serve Prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics.
+
+    Besides the counters in NCCUCrawl.metrics (items per type, drops,
+    callback errors, DB write/flush latency, auth refreshes) every scrape
+    reports the scheduler queue depth and in-flight requests, response
+    status / download error / retry / dead-letter counts from the stats,
+    breaker trips and adaptive slot concurrency. Spiders opt in to exporting
+    numeric attributes by listing them in `metrics_attributes` (smart_courses
+    progress counters, teacher_deprecated tracking calls).
+    """
+
+    def __init__(self, crawler, host: str, port: int):
+        self.crawler = crawler
+        self.host = host
+        self.port = port
+        self.listener = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool("METRICS_ENABLED"):
+            raise NotConfigured
+        ext = cls(
+            crawler,
+            settings.get("METRICS_HOST", "127.0.0.1"),
+            settings.getint("METRICS_PORT", 9410),
+        )
+        crawler.signals.connect(ext.engine_started, signal=signals.engine_started)
+        crawler.signals.connect(ext.engine_stopped, signal=signals.engine_stopped)
+        crawler.signals.connect(ext.item_scraped, signal=signals.item_scraped)
+        crawler.signals.connect(ext.item_dropped, signal=signals.item_dropped)
+        crawler.signals.connect(ext.spider_error, signal=signals.spider_error)
+        return ext
+
+    def engine_started(self):
+        from twisted.internet import reactor
+
+        REGISTRY.add_collector(self.collect)
+        try:
+            self.listener = reactor.listenTCP(
+                self.port, Site(MetricsResource(REGISTRY.render)), interface=self.host
+            )
+        except CannotListenError as e:
+            logger.error(f"Metrics endpoint disabled: {e}")
+            return
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    def engine_stopped(self):
+        REGISTRY.remove_collector(self.collect)
+        if self.listener is not None:
+            self.listener.stopListening()
+            self.listener = None
+
+    def item_scraped(self, item, spider):
+        ITEMS_SCRAPED.inc(spider=spider.name, type=item.__class__.__name__)
+
+    def item_dropped(self, item, spider, exception):
+        ITEMS_DROPPED.inc(spider=spider.name, type=item.__class__.__name__)
+
+    def spider_error(self, failure, response, spider):
+        callback = getattr(response.request, "callback", None)
+        SPIDER_ERRORS.inc(
+            spider=spider.name,
+            callback=getattr(callback, "__name__", "parse"),
+            error=failure.type.__name__,
+        )
+
+    def collect(self):
+        spider = self.crawler.spider
+        name = spider.name if spider else ""
+        engine = self.crawler.engine
+        if engine is not None and engine.running:
+            for gauge, (help, read) in ENGINE_GAUGES.items():
+                try:
+                    value = read(engine)
+                except (AttributeError, TypeError):
+                    # scheduler / scraper slot not set up yet or torn down
+                    continue
+                yield gauge, "gauge", help, [({"spider": name}, value)]
+
+        stats = self.crawler.stats.get_stats()
+        for prefix, metric, type_, help, label in STATS_FAMILIES:
+            samples = [
+                ({"spider": name, label: key[len(prefix) :]}, value)
+                for key, value in stats.items()
+                if key.startswith(prefix)
+                and key[len(prefix) :] not in STATS_TOTALS
+                and isinstance(value, (int, float))
+            ]
+            if samples:
+                yield metric, type_, help, samples
+
+        trips, concurrency = [], []
+        for key, value in stats.items():
+            if key.startswith("circuit_breaker/") and key.endswith("/opened"):
+                host = key[len("circuit_breaker/") : -len("/opened")]
+                trips.append(({"spider": name, "host": host}, value))
+            elif key.startswith("adaptive_concurrency/") and key.endswith(
+                "/concurrency"
+            ):
+                slot = key[len("adaptive_concurrency/") : -len("/concurrency")]
+                concurrency.append(({"spider": name, "slot": slot}, value))
+        if trips:
+            yield (
+                "nccu_circuit_breaker_trips_total",
+                "counter",
+                "Times a host's circuit breaker opened.",
+                trips,
+            )
+        if concurrency:
+            yield (
+                "nccu_slot_concurrency",
+                "gauge",
+                "Concurrency chosen by AdaptiveConcurrencyMiddleware per slot.",
+                concurrency,
+            )
+
+        for attribute in getattr(spider, "metrics_attributes", ()):
+            value = getattr(spider, attribute, None)
+            if isinstance(value, (int, float)):
+                yield (
+                    f"nccu_spider_{sanitize(attribute)}",
+                    "gauge",
+                    f"{type(spider).__name__}.{attribute}",
+                    [({"spider": name}, value)],
+                )
@@ -0,0 +1,109 @@
+"""
+Lazy, back-pressured scheduling of large request fan-outs.
+
+The course spiders expand unit.json into semesters x categories list
+requests. Yielding all of them at once puts thousands of requests in the
+scheduler before the first list is parsed; RequestFeeder instead pulls from
+a generator and keeps at most COURSE_LIST_QUEUE_SIZE of them between the
+spider and the downloader, topping up whenever one leaves the downloader
+(and, as a fallback, when the spider goes idle).
+"""
+
+import logging
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider
+
+logger = logging.getLogger(__name__)
+
+
+def semester_priorities(semesters: Sequence[str]) -> List[Tuple[str, int]]:
+    """(semester, priority) newest first; older terms get lower priorities."""
+    ordered = sorted(semesters, key=lambda s: (int(s[:-1]), s[-1:]), reverse=True)
+    return [(sem, -rank) for rank, sem in enumerate(ordered)]
+
+
+def shard_slice(items: Sequence, shard: Optional[str]) -> Sequence:
+    """Every k-th item from i for `shard` "i/k" (`-a shard=i/k`, NCCUCrawl.launcher)."""
+    if not shard:
+        return items
+    index, count = (int(n) for n in str(shard).split("/"))
+    if not 0 <= index < count:
+        raise ValueError(f"shard must be i/k with 0 <= i < k, got {shard!r}")
+    return items[index::count]
+
+
+class RequestFeeder:
+    """
+    Feed `requests` to the engine, at most `size` outstanding at a time.
+
+    A request is outstanding from the moment it is handed out until it
+    leaves the downloader or is dropped by the scheduler; retries of it
+    are not counted again.
+    """
+
+    META_KEY = "feeder"
+
+    def __init__(
+        self, crawler, requests: Iterable[Request], size: int = 32, depth: int = 1
+    ):
+        self.crawler = crawler
+        self.requests: Iterator[Request] = iter(requests)
+        self.size = max(size, 1)
+        self.depth = depth
+        self.outstanding = set()
+        self.exhausted = False
+        self.fed = 0
+        crawler.signals.connect(
+            self.request_done, signal=signals.request_left_downloader
+        )
+        crawler.signals.connect(self.request_done, signal=signals.request_dropped)
+        crawler.signals.connect(self.spider_idle, signal=signals.spider_idle)
+
+    def start(self) -> List[Request]:
+        """The first batch, to be yielded by the callback that built the feeder."""
+        return self.take()
+
+    def take(self) -> List[Request]:
+        batch = []
+        while not self.exhausted and len(self.outstanding) < self.size:
+            try:
+                request = next(self.requests)
+            except StopIteration:
+                self.exhausted = True
+                logger.debug(f"Feeder exhausted after {self.fed} requests")
+                break
+            request.meta[self.META_KEY] = self.fed
+            self.outstanding.add(self.fed)
+            self.fed += 1
+            batch.append(request)
+        if batch:
+            self.crawler.stats.inc_value("feeder/requests", len(batch))
+        return batch
+
+    def crawl(self, request: Request):
+        # engine.crawl() skips the spider middlewares, so do DepthMiddleware's
+        # part here to keep DEPTH_PRIORITY ordering consistent
+        request.meta["depth"] = self.depth
+        request.priority -= self.depth * self.crawler.settings.getint("DEPTH_PRIORITY")
+        self.crawler.engine.crawl(request)
+
+    def request_done(self, request, spider=None, reason=None):
+        key = request.meta.get(self.META_KEY)
+        if key is None or key not in self.outstanding:
+            return
+        self.outstanding.discard(key)
+        for next_request in self.take():
+            self.crawl(next_request)
+
+    def spider_idle(self, spider=None):
+        if self.exhausted:
+            return
+        # everything handed out was lost without a signal; start over
+        self.outstanding.clear()
+        batch = self.take()
+        for request in batch:
+            self.crawl(request)
+        if batch:
+            raise DontCloseSpider("course list feeder has more requests")
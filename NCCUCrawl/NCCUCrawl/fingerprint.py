@@ -0,0 +1,98 @@
+"""
+Request fingerprints that treat equivalent NCCU URLs as one request.
+
+The same page is reachable under several spellings: http or https,
+140.119.229.20 or newdoc.nccu.edu.tw, with or without a trailing slash,
+course list filters (`:sem=1131%20:dp1=01%20...`) and newdoc `.jsp-a=1&b=2`
+parameters in any order, and detail URLs carrying cache-busting markers
+(`?_spider_req=N`, `?_direct_N`). NCCURequestFingerprinter hashes the
+canonical form, so the dupefilter and HTTP cache see one request; the
+request itself is still sent to the URL it was built with.
+
+    REQUEST_FINGERPRINTER_CLASS = "NCCUCrawl.fingerprint.NCCURequestFingerprinter"
+"""
+
+import re
+import weakref
+from typing import Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from scrapy.utils.request import fingerprint
+
+# host spellings of the same server -> canonical host
+HOST_ALIASES = {
+    "140.119.229.20": "newdoc.nccu.edu.tw",
+}
+
+# query parameter names that only defeat caching / the dupefilter
+CACHE_BUSTING_PARAMS = (r"_spider_req", r"_direct_\d+")
+
+# `:name=value` filters packed into one path segment, separated by spaces
+_COLON_PARAM = re.compile(r"(?:%20|\s)*(:[^:%\s]+=[^:%\s]*)")
+_JSP_PARAMS = re.compile(r"^(?P<head>.*?\.jsp-)(?P<params>[^/]*?)(?P<tail>\.html?)?$")
+
+
+def _is_nccu_host(host: str) -> bool:
+    return host.endswith("nccu.edu.tw")
+
+
+def _sort_colon_params(segment: str) -> str:
+    params = _COLON_PARAM.findall(segment)
+    if not params or _COLON_PARAM.sub("", segment).strip("%20 "):
+        return segment
+    return "%20".join(sorted(params))
+
+
+def _sort_jsp_params(segment: str) -> str:
+    match = _JSP_PARAMS.match(segment)
+    if not match or "=" not in match["params"]:
+        return segment
+    params = "&".join(sorted(match["params"].split("&")))
+    return f"{match['head']}{params}{match['tail'] or ''}"
+
+
+def canonicalize_nccu_url(
+    url: str, strip_params: Iterable[str] = CACHE_BUSTING_PARAMS
+) -> str:
+    """Canonical spelling of an NCCU URL; other hosts only lose `strip_params`."""
+    strip = re.compile("|".join(f"(?:{p})" for p in strip_params) or r"(?!)")
+    parts = urlsplit(url)
+    scheme, host, path = parts.scheme, (parts.hostname or "").lower(), parts.path
+
+    query = urlencode(
+        [
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not strip.fullmatch(key)
+        ]
+    )
+
+    host = HOST_ALIASES.get(host, host)
+    if _is_nccu_host(host):
+        scheme = "https"
+        segments = path.rstrip("/").split("/")
+        segments = [_sort_jsp_params(_sort_colon_params(s)) for s in segments]
+        path = "/".join(segments) or "/"
+        netloc = host
+    else:
+        netloc = parts.netloc
+    return urlunsplit((scheme, netloc, path, query, ""))
+
+
+class NCCURequestFingerprinter:
+    """Scrapy's default fingerprint, taken over canonicalize_nccu_url(request.url)."""
+
+    def __init__(self, strip_params: Optional[Iterable[str]] = None):
+        self.strip_params = tuple(strip_params or CACHE_BUSTING_PARAMS)
+        self._cache = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings.getlist("FINGERPRINT_STRIP_PARAMS") or None)
+
+    def fingerprint(self, request) -> bytes:
+        if request not in self._cache:
+            url = canonicalize_nccu_url(request.url, self.strip_params)
+            canonical = request if url == request.url else request.replace(url=url)
+            self._cache[request] = fingerprint(canonical)
+        return self._cache[request]
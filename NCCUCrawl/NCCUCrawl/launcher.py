@@ -0,0 +1,287 @@
+"""
+Run a course crawl on every core by splitting it into per-semester tasks.
+
+Scrapy uses one core per process, and a course crawl's semesters are
+independent of each other. The launcher cuts the semesters (and, with
+--split K, each semester's categories into K parts, see `-a shard=i/K` on
+the course spiders) into tasks and runs them on a pool of --jobs worker
+processes. Each task is a fresh crawl writing to its own staging database
+(data.staging/1141.db, data.staging/1141.0.db, ...), so workers never share
+a write lock. The staging directory is out of reach of list_shards, so kept
+staging files are not unioned with the base file they were merged into, and
+SQLITE_SHARD shards next to the base file are left alone.
+Workers pull the next task as soon as they finish one, so a process that
+drew small semesters takes over the leftovers of the others. Tasks go out
+largest first, using the semester's row count in the base database (newest
+first when there is none). When all tasks are done the coordinator merges
+the staging files into the base database with merge_shards, dead letters
+included.
+
+    python3 -m NCCUCrawl.launcher courses -j 8
+    python3 -m NCCUCrawl.launcher courses_deprecated -j 4 --split 2 \\
+        --semesters 1131,1132 -s DOWNLOAD_DELAY=0.2
+"""
+
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from multiprocessing import get_context
+from typing import Dict, List, Optional
+
+from scrapy.crawler import CrawlerProcess
+from scrapy.utils.project import get_project_settings
+
+from NCCUCrawl.config import get_config
+from NCCUCrawl.database import merge_shards, resolve_db_path
+from NCCUCrawl.feeder import semester_priorities
+
+logger = logging.getLogger(__name__)
+
+# spider -> (table, "<year><sem>" expression) used to size its semesters
+SPIDER_TABLES = {
+    "courses": ("course", "year || semester"),
+    "courses_deprecated": ("course_legacy", "y || s"),
+    "smart_courses": ("course_legacy", "y || s"),
+    "remain": ("course_remain", "substr(course_id, 1, 4)"),
+}
+
+# stats each worker reports back
+REPORTED_STATS = (
+    "item_scraped_count",
+    "response_received_count",
+    "downloader/response_bytes",
+    "elapsed_time_seconds",
+    "finish_reason",
+    "log_count/ERROR",
+)
+
+
+@dataclass(frozen=True)
+class Task:
+    semester: str
+    part: int
+    parts: int
+    db: str
+
+    @property
+    def label(self) -> str:
+        if self.parts == 1:
+            return self.semester
+        return f"{self.semester} {self.part + 1}/{self.parts}"
+
+
+def staging_dir(base: str) -> str:
+    stem, _ = os.path.splitext(base)
+    return f"{stem}.staging"
+
+
+def staging_path(base: str, key: str) -> str:
+    _, suffix = os.path.splitext(base)
+    return os.path.join(staging_dir(base), f"{key}{suffix or '.db'}")
+
+
+def semester_weights(db: str, spider: str) -> Dict[str, int]:
+    """Rows per semester the spider stored in `db` by earlier runs."""
+    if spider not in SPIDER_TABLES or not os.path.exists(db):
+        return {}
+    table, semester = SPIDER_TABLES[spider]
+    conn = sqlite3.connect(f"file:{db}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            f"SELECT {semester}, count(*) FROM {table} GROUP BY 1"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        return {}
+    finally:
+        conn.close()
+    return {str(sem): count for sem, count in rows}
+
+
+def plan_tasks(
+    base: str, semesters: List[str], parts: int, weights: Dict[str, int]
+) -> List[Task]:
+    """Largest semesters first; unknown sizes keep newest-first order."""
+    ordered = [sem for sem, _ in semester_priorities(semesters)]
+    ordered.sort(key=lambda sem: weights.get(sem, 0), reverse=True)
+    tasks = []
+    for sem in ordered:
+        for part in range(parts):
+            key = sem if parts == 1 else f"{sem}.{part}"
+            tasks.append(Task(sem, part, parts, staging_path(base, key)))
+    return tasks
+
+
+def run_task(spider: str, task: Task, overrides: Dict[str, str]) -> Dict:
+    """Crawl one task in this (fresh) process and return its REPORTED_STATS."""
+    settings = get_project_settings()
+    settings.setdict(overrides, priority="cmdline")
+    settings.set("NCCU_SEMESTERS", task.semester, priority="cmdline")
+    settings.set("SQLITE_PATH", task.db, priority="cmdline")
+    settings.set("SQLITE_SHARD", None, priority="cmdline")
+    # every worker would try to bind the same METRICS_PORT
+    settings.set("METRICS_ENABLED", False, priority="cmdline")
+
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(spider)
+    kwargs = {"shard": f"{task.part}/{task.parts}"} if task.parts > 1 else {}
+    process.crawl(crawler, **kwargs)
+    process.start()
+
+    stats = crawler.stats.get_stats()
+    return {key: stats.get(key) for key in REPORTED_STATS}
+
+
+def _report(task: Task, stats: Dict, done: int, total: int):
+    items = stats.get("item_scraped_count") or 0
+    pages = stats.get("response_received_count") or 0
+    secs = stats.get("elapsed_time_seconds") or 0.0
+    rate = items / secs if secs else 0.0
+    errors = stats.get("log_count/ERROR") or 0
+    print(
+        f"[{done}/{total}] {task.label:<10} {items:>7} items {pages:>7} pages"
+        f" {secs:>8.1f}s {rate:>8.1f} items/s {errors:>4} errors"
+        f" ({stats.get('finish_reason')})",
+        file=sys.stderr,
+    )
+
+
+def launch(
+    spider: str,
+    base: str,
+    semesters: List[str],
+    jobs: int,
+    parts: int = 1,
+    overrides: Optional[Dict[str, str]] = None,
+    keep: bool = False,
+) -> bool:
+    """Run every task, merge the staging files into `base`; True if all finished."""
+    tasks = plan_tasks(base, semesters, parts, semester_weights(base, spider))
+    print(
+        f"{spider}: {len(semesters)} semesters as {len(tasks)} tasks"
+        f" on {jobs} processes",
+        file=sys.stderr,
+    )
+
+    os.makedirs(staging_dir(base), exist_ok=True)
+    failed, items = [], 0
+    start = time.perf_counter()
+    # one crawl per process: a Twisted reactor cannot be restarted
+    with ProcessPoolExecutor(
+        jobs, mp_context=get_context("spawn"), max_tasks_per_child=1
+    ) as pool:
+        futures = {
+            pool.submit(run_task, spider, task, overrides or {}): task for task in tasks
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            task = futures[future]
+            try:
+                stats = future.result()
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Task {task.label} crashed: {e!r}")
+                stats = {"finish_reason": f"crashed: {e!r}"}
+            if stats.get("finish_reason") != "finished":
+                failed.append(task)
+            items += stats.get("item_scraped_count") or 0
+            _report(task, stats, done, len(tasks))
+
+    wall = time.perf_counter() - start
+    print(
+        f"{items} items in {wall:.1f}s ({items / wall if wall else 0:.1f} items/s)",
+        file=sys.stderr,
+    )
+
+    staged = [task.db for task in tasks if os.path.exists(task.db)]
+    merge_start = time.perf_counter()
+    counts = merge_shards(base, staged, delete=not keep)
+    if not keep and not os.listdir(staging_dir(base)):
+        os.rmdir(staging_dir(base))
+    print(
+        f"Merged {len(staged)} staging files into {base} in"
+        f" {time.perf_counter() - merge_start:.1f}s: "
+        + ", ".join(
+            f"{table} {count}" for table, count in sorted(counts.items()) if count
+        ),
+        file=sys.stderr,
+    )
+    if failed:
+        print(
+            "Unfinished tasks (re-run with --semesters "
+            + ",".join(sorted({task.semester for task in failed}))
+            + "): "
+            + ", ".join(task.label for task in failed),
+            file=sys.stderr,
+        )
+    return not failed
+
+
+def _parse_overrides(pairs: List[str]) -> Dict[str, str]:
+    overrides = {}
+    for pair in pairs:
+        name, sep, value = pair.partition("=")
+        if not sep:
+            raise argparse.ArgumentTypeError(f"expected NAME=VALUE, got {pair!r}")
+        overrides[name] = value
+    return overrides
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Crawl semesters on parallel processes and merge the results"
+    )
+    parser.add_argument("spider", nargs="?", default="courses")
+    parser.add_argument(
+        "-j", "--jobs", type=int, default=os.cpu_count() or 1, help="worker processes"
+    )
+    parser.add_argument(
+        "--split",
+        type=int,
+        default=1,
+        help="split each semester's categories into this many tasks",
+    )
+    parser.add_argument(
+        "--semesters", help="comma-separated, e.g. 1131,1132 (default: configured)"
+    )
+    parser.add_argument("--db", default=None, help="base database (default: resolved)")
+    parser.add_argument(
+        "--keep", action="store_true", help="keep staging files after merging"
+    )
+    parser.add_argument(
+        "-s",
+        "--set",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="setting for every worker (repeatable), as with scrapy crawl -s",
+    )
+    args = parser.parse_args(argv)
+
+    try:
+        overrides = _parse_overrides(args.set)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    settings = get_project_settings()
+    settings.setdict(overrides, priority="cmdline")
+    if args.semesters:
+        settings.set("NCCU_SEMESTERS", args.semesters, priority="cmdline")
+    semesters = list(get_config(settings).SEMESTERS)
+    base = args.db or resolve_db_path(settings)
+
+    ok = launch(
+        args.spider,
+        base,
+        semesters,
+        max(args.jobs, 1),
+        max(args.split, 1),
+        overrides,
+        keep=args.keep,
+    )
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Process-wide counters, gauges and histograms in Prometheus text format.
+
+Spiders, pipelines and the auth client update the module-level metrics
+below; NCCUCrawl.extensions.MetricsExtension serves REGISTRY.render() on
+http://127.0.0.1:<METRICS_PORT>/metrics together with live engine gauges
+and selected Scrapy stats. Per-second rates (items/sec per type, ...) are
+left to PromQL, e.g. `rate(nccu_items_scraped_total[1m])`.
+"""
+
+import math
+import re
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+Labels = Tuple[str, ...]
+# (metric name, type, help, [(labels dict, value)]) yielded by collectors
+Family = Tuple[str, str, str, List[Tuple[dict, float]]]
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+    return f"{{{inner}}}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def sanitize(name: str) -> str:
+    """Turn a stats key or label-less name into a valid metric name part."""
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def _key(self, labels: dict) -> Labels:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterable[Tuple[str, dict, float]]:
+        for key, value in self.values.items():
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels):
+        self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> ([per-bucket counts..., +Inf], sum)
+        self.data: Dict[Labels, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        counts, total = self.data.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+        self.data[key] = (counts, total + value)
+
+    def samples(self):
+        for key, (counts, total) in self.data.items():
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = "+Inf" if math.isinf(bound) else repr(float(bound))
+                yield f"{self.name}_bucket", {**labels, "le": le}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+        self.collectors: List[Callable[[], Iterable[Family]]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[Family]]):
+        self.collectors.append(collector)
+
+    def remove_collector(self, collector):
+        if collector in self.collectors:
+            self.collectors.remove(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in self.collectors:
+            for name, type_, help, samples in collector():
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {type_}")
+                for labels, value in samples:
+                    lines.append(
+                        f"{name}{_format_labels(labels)} {_format_value(value)}"
+                    )
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+ITEMS_SCRAPED = REGISTRY.register(
+    Counter(
+        "nccu_items_scraped_total",
+        "Items that made it through every pipeline.",
+        ["spider", "type"],
+    )
+)
+ITEMS_DROPPED = REGISTRY.register(
+    Counter(
+        "nccu_items_dropped_total",
+        "Items dropped by a pipeline (DropItem).",
+        ["spider", "type"],
+    )
+)
+SPIDER_ERRORS = REGISTRY.register(
+    Counter(
+        "nccu_spider_errors_total",
+        "Exceptions raised by spider callbacks, by exception class.",
+        ["spider", "callback", "error"],
+    )
+)
+DB_WRITE_SECONDS = REGISTRY.register(
+    Histogram(
+        "nccu_db_write_seconds",
+        "StoragePipeline time per item, including any flush it triggers.",
+        ["backend"],
+    )
+)
+DB_FLUSH_SECONDS = REGISTRY.register(
+    Histogram(
+        "nccu_db_flush_seconds",
+        "Batched write (executemany / COPY + merge) and commit latency.",
+        ["backend"],
+    )
+)
+AUTH_REFRESHES = REGISTRY.register(
+    Counter(
+        "nccu_auth_refreshes_total",
+        "Token fetches against the person API, by result.",
+        ["result"],
+    )
+)
@@ -3,44 +3,160 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
-from scrapy import signals
+import json
+import logging
+import random
+import re
+import sqlite3
+import time
+from collections import defaultdict
+
+from scrapy import Item, signals
+from scrapy.downloadermiddlewares.retry import get_retry_request
+from scrapy.exceptions import (
+    CannotResolveHostError,
+    DownloadConnectionRefusedError,
+    DownloadTimeoutError,
+    NotConfigured,
+)
+from scrapy.utils.asyncio import create_looping_call
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.misc import load_object
+from scrapy.utils.request import request_from_dict
+from twisted.internet.error import (
+    ConnectionRefusedError,
+    DNSLookupError,
+    TCPTimedOutError,
+)
+from twisted.internet.error import TimeoutError as TwistedTimeoutError
+from twisted.web._newclient import ResponseNeverReceived
+
+from NCCUCrawl.database import resolve_db_path
+from NCCUCrawl.profiling import get_profiler
+from NCCUCrawl.scheduler import HoldingScheduler, set_hold_time
+from NCCUCrawl.schema import migrate
 
 # useful for handling different item types with a single interface
 
+logger = logging.getLogger(__name__)
+
+# retry reason -> download exceptions classified under it; anything else in
+# RETRY_EXCEPTIONS is a "connection_error"
+EXCEPTION_REASONS = {
+    "timeout": (
+        DownloadTimeoutError,
+        TwistedTimeoutError,
+        TCPTimedOutError,
+        ResponseNeverReceived,
+    ),
+    "connection_refused": (DownloadConnectionRefusedError, ConnectionRefusedError),
+    "dns": (CannotResolveHostError, DNSLookupError),
+}
+
+
+def retry_exceptions(settings) -> tuple:
+    """RETRY_EXCEPTIONS as classes, loaded like Scrapy's RetryMiddleware does."""
+    return tuple(
+        load_object(path) if isinstance(path, str) else path
+        for path in settings.getlist("RETRY_EXCEPTIONS")
+    ) + tuple(cls for classes in EXCEPTION_REASONS.values() for cls in classes)
+
+
+def exception_reason(exception) -> str:
+    for reason, classes in EXCEPTION_REASONS.items():
+        if isinstance(exception, classes):
+            return reason
+    return "connection_error"
+
 
 class NccucrawlSpiderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the spider middleware does not modify the
-    # passed objects.
+    """
+    Profiling surface for the hot path (see NCCUCrawl.profiling).
+
+    With PROFILING_ENABLED, a PROFILING_SAMPLE_RATE share of responses get
+    their callback timed (wall and CPU, across every step of the callback's
+    generator) and their download latency and body size recorded per URL
+    pattern. ETLPipeline/StoragePipeline and the SQLite upserts report into
+    the same profiler. Histograms are exported to stats when the spider
+    closes and dumped to PROFILING_DUMP_PATH every PROFILING_INTERVAL
+    seconds.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.profiler = get_profiler(crawler)
+        self.interval = settings.getfloat("PROFILING_INTERVAL", 60.0)
+        self.dump_path = settings.get("PROFILING_DUMP_PATH")
+        self.patterns = _compile_patterns(settings)
+        self.task = None
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(crawler)
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
         return s
 
-    def process_spider_input(self, response, spider):
-        # Called for each response that goes through the spider
-        # middleware and into the spider.
-
-        # Should return None or raise an exception.
+    def process_spider_input(self, response, spider=None):
+        if self.profiler.sampled():
+            pattern = url_pattern(response.url, self.patterns)
+            latency = response.meta.get("download_latency")
+            if latency is not None:
+                self.profiler.observe(f"download/{pattern}/latency", latency)
+            self.profiler.observe(f"download/{pattern}/bytes", len(response.body), 64)
         return None
 
-    def process_spider_output(self, response, result, spider):
-        # Called with the results returned from the Spider, after
-        # it has processed the response.
+    def process_spider_output(self, response, result, spider=None):
+        if not self.profiler.sampled():
+            return result
+        return self._timed(_callback_name(response), result)
 
-        # Must return an iterable of Request, or item objects.
-        for i in result:
+    async def process_spider_output_async(self, response, result, spider=None):
+        if not self.profiler.sampled():
+            async for i in result:
+                yield i
+            return
+        name = f"callback/{_callback_name(response)}"
+        wall = cpu = 0.0
+        iterator = result.__aiter__()
+        while True:
+            w, c = time.perf_counter(), time.process_time()
+            try:
+                i = await iterator.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                wall += time.perf_counter() - w
+                cpu += time.process_time() - c
             yield i
+        self.profiler.observe(f"{name}/wall", wall)
+        self.profiler.observe(f"{name}/cpu", cpu)
 
-    def process_spider_exception(self, response, exception, spider):
-        # Called when a spider or process_spider_input() method
-        # (from other spider middleware) raises an exception.
+    def _timed(self, callback, result):
+        # a callback runs lazily: its cost is the time spent inside next()
+        name = f"callback/{callback}"
+        wall = cpu = 0.0
+        iterator = iter(result)
+        while True:
+            w, c = time.perf_counter(), time.process_time()
+            try:
+                i = next(iterator)
+            except StopIteration:
+                break
+            finally:
+                wall += time.perf_counter() - w
+                cpu += time.process_time() - c
+            yield i
+        self.profiler.observe(f"{name}/wall", wall)
+        self.profiler.observe(f"{name}/cpu", cpu)
 
-        # Should return either None or an iterable of Request or item objects.
-        pass
+    def process_spider_exception(self, response, exception, spider=None):
+        if self.profiler.enabled:
+            self.crawler.stats.inc_value(
+                f"profile/callback/{_callback_name(response)}/exceptions"
+            )
+        return None
 
     async def process_start(self, start):
         # Called with an async iterator over the spider start() method or the
@@ -48,52 +164,543 @@ class NccucrawlSpiderMiddleware:
         async for item_or_request in start:
             yield item_or_request
 
+    def report(self):
+        self.profiler.log_top()
+        if self.dump_path:
+            self.profiler.dump(self.dump_path, self.crawler.spider.name)
+
     def spider_opened(self, spider):
         spider.logger.info("Spider opened: %s" % spider.name)
+        if self.profiler.enabled and self.interval > 0:
+            self.task = create_looping_call(self.report)
+            self.task.start(self.interval, now=False)
+
+    def spider_closed(self, spider):
+        if self.task is not None and self.task.running:
+            self.task.stop()
+        if self.profiler.enabled:
+            self.profiler.export(self.crawler.stats)
+            self.report()
+
+
+def _callback_name(response) -> str:
+    callback = getattr(response.request, "callback", None)
+    return getattr(callback, "__name__", "parse")
+
+
+# per-attempt meta that must not follow a dead letter into its replay
+TRANSIENT_META = (
+    "download_slot",
+    "download_latency",
+    "retry_times",
+    "retry_not_before",
+    "dead_letter_id",
+)
+
+
+class CircuitBreaker:
+    """
+    Per-host breaker: CIRCUIT_BREAKER_THRESHOLD consecutive failures open it
+    for a cooldown (doubling on each re-trip, capped), then one probe request
+    is let through half-open; its success closes the breaker. A probe that
+    ends without an outcome (release()) or outlives `probe_timeout` lets the
+    next request probe instead.
+    """
+
+    def __init__(
+        self,
+        threshold: int,
+        cooldown: float,
+        max_cooldown: float,
+        probe_timeout: float = 180.0,
+    ):
+        self.threshold = threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+        self.failures = 0
+        self.trips = 0
+        self.open_until = 0.0
+        self.probing = False
+        self.probe_deadline = 0.0
+
+    def wait_time(self, now: float) -> float:
+        """Seconds a new request must wait; 0 lets it through."""
+        if now < self.open_until:
+            return self.open_until - now
+        if self.trips and self.failures >= self.threshold:
+            # half-open: one probe at a time
+            if self.probing and now < self.probe_deadline:
+                return min(self.base_cooldown, 1.0)
+            self.probing = True
+            self.probe_deadline = now + self.probe_timeout
+        return 0.0
+
+    def release(self):
+        """The probe finished without a success or failure to record."""
+        self.probing = False
+
+    def success(self):
+        self.failures = 0
+        self.trips = 0
+        self.probing = False
+
+    def failure(self, now: float) -> bool:
+        """Record a failure; True when this opens the breaker."""
+        if now < self.open_until:
+            # in-flight requests failing after the trip don't extend it
+            return False
+        self.failures += 1
+        self.probing = False
+        if self.failures < self.threshold:
+            return False
+        cooldown = min(self.base_cooldown * 2**self.trips, self.max_cooldown)
+        self.trips += 1
+        self.open_until = now + cooldown
+        return True
 
 
 class NccucrawlDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+    """
+    Classified retries with jittered backoff, a per-host circuit breaker and
+    a dead-letter table (replaces Scrapy's RetryMiddleware).
+
+    Retried: RETRY_EXCEPTIONS (timeouts, refused or lost connections, DNS
+    failures), RETRY_HTTP_CODES (5xx, 429) and
+    an empty JSON `[]` from URLs in RETRY_EMPTY_JSON_PATTERNS, which the
+    course API returns when it throttles us. Retry n waits a random
+    0..min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2**n) seconds. While a
+    host's breaker is open its requests wait instead of hitting the server.
+    Waiting requests are parked by NCCUCrawl.scheduler.HoldingScheduler
+    (see hold_time), so they stay out of the downloader and other hosts
+    keep downloading.
+    Requests that exhaust RETRY_TIMES are stored in the dead_letter table
+    and re-scheduled on the next run with DEAD_LETTER_REPLAY = True.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.max_retry_times = settings.getint("RETRY_TIMES", 2)
+        self.retry_http_codes = set(settings.getlist("RETRY_HTTP_CODES", []))
+        self.retry_http_codes = {int(code) for code in self.retry_http_codes}
+        self.priority_adjust = settings.getint("RETRY_PRIORITY_ADJUST", -1)
+        self.exceptions_to_retry = retry_exceptions(settings)
+        self.backoff_base = settings.getfloat("RETRY_BACKOFF_BASE", 1.0)
+        self.backoff_max = settings.getfloat("RETRY_BACKOFF_MAX", 60.0)
+        self.empty_json_patterns = [
+            re.compile(p) for p in settings.getlist("RETRY_EMPTY_JSON_PATTERNS", [])
+        ]
+        self.breaker_threshold = settings.getint("CIRCUIT_BREAKER_THRESHOLD", 5)
+        self.breaker_cooldown = settings.getfloat("CIRCUIT_BREAKER_COOLDOWN", 30.0)
+        self.breaker_max_cooldown = settings.getfloat(
+            "CIRCUIT_BREAKER_MAX_COOLDOWN", 600.0
+        )
+        self.breaker_probe_timeout = settings.getfloat("DOWNLOAD_TIMEOUT", 180.0)
+        self.breakers = {}
+        self.dead_letter_enabled = settings.getbool("DEAD_LETTER_ENABLED", True)
+        self.dead_letter_replay = settings.getbool("DEAD_LETTER_REPLAY", False)
+        self.db_path = resolve_db_path(settings)
+        self._conn = None
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
+        s = cls(crawler)
         crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(s.spider_closed, signal=signals.spider_closed)
+        set_hold_time(crawler, s.hold_time)
+        if not issubclass(load_object(crawler.settings["SCHEDULER"]), HoldingScheduler):
+            logger.warning(
+                "SCHEDULER is not a HoldingScheduler: retry backoff and open "
+                "circuit breakers will not hold requests"
+            )
         return s
 
-    def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
-        return None
+    def breaker(self, request) -> CircuitBreaker:
+        host = urlparse_cached(request).hostname or ""
+        if host not in self.breakers:
+            self.breakers[host] = CircuitBreaker(
+                self.breaker_threshold,
+                self.breaker_cooldown,
+                self.breaker_max_cooldown,
+                self.breaker_probe_timeout,
+            )
+        return self.breakers[host]
 
-    def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
+    def hold_time(self, request, now: float) -> float:
+        """Seconds `request` must still wait: retry backoff, then its host's breaker."""
+        wait = request.meta.get("retry_not_before", 0) - now
+        if wait > 0:
+            return wait
+        request.meta.pop("retry_not_before", None)
+        # only asked once the backoff is over, so a half-open breaker gives
+        # its probe to a request that is sent right away
+        wait = self.breaker(request).wait_time(now)
+        if wait > 0:
+            self.stats.inc_value("circuit_breaker/held_requests")
+        return wait
 
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+    def process_response(self, request, response, spider=None):
+        if request.meta.get("dont_retry"):
+            self.breaker(request).release()
+            self.recovered(request)
+            return response
+        if response.status in self.retry_http_codes:
+            return self._retry(request, f"http_{response.status}", response)
+        if self._is_throttled_empty(request, response):
+            return self._retry(request, "empty_json", response)
+        self.breaker(request).success()
+        self.recovered(request)
         return response
 
-    def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
+    def process_exception(self, request, exception, spider=None):
+        if request.meta.get("dont_retry") or not isinstance(
+            exception, self.exceptions_to_retry
+        ):
+            # IgnoreRequest, dont_retry, ...: no verdict on the host
+            self.breaker(request).release()
+            return None
+        return self._retry(request, exception_reason(exception), exception)
 
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+    def _is_throttled_empty(self, request, response) -> bool:
+        if not request.meta.get("retry_empty_json") and not any(
+            p.search(request.url) for p in self.empty_json_patterns
+        ):
+            return False
+        return response.body.strip() == b"[]"
+
+    def _retry(self, request, reason, result):
+        """Return a delayed retry, or dead-letter and fall through with `result`."""
+        self.stats.inc_value(f"retry/classified/{reason}")
+        breaker = self.breaker(request)
+        if breaker.failure(time.time()):
+            host = urlparse_cached(request).hostname
+            logger.warning(
+                "Circuit breaker open for %s (%d consecutive failures)",
+                host,
+                breaker.failures,
+            )
+            self.stats.inc_value(f"circuit_breaker/{host}/opened")
+
+        retry = get_retry_request(
+            request,
+            spider=self.crawler.spider,
+            reason=reason,
+            max_retry_times=request.meta.get("max_retry_times", self.max_retry_times),
+            priority_adjust=self.priority_adjust,
+        )
+        if retry is not None:
+            attempt = retry.meta["retry_times"]
+            cap = min(self.backoff_max, self.backoff_base * 2**attempt)
+            retry.meta["retry_not_before"] = time.time() + random.uniform(0, cap)
+            return retry
+
+        self.dead_letter(request, reason)
+        if isinstance(result, Exception):
+            return None
+        return result
+
+    # dead letters
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path)
+            migrate(self._conn)
+        return self._conn
+
+    def dead_letter(self, request, reason):
+        if not self.dead_letter_enabled:
+            return
+        spider = self.crawler.spider
+        data = request.to_dict(spider=spider)
+        body = data.pop("body", b"")
+        data["headers"] = {
+            key.decode("latin-1"): [v.decode("latin-1") for v in values]
+            for key, values in request.headers.items()
+        }
+        # to_dict() shares the request's meta
+        data["meta"] = {
+            key: value
+            for key, value in request.meta.items()
+            if key not in TRANSIENT_META
+        }
+        attempts = request.meta.get("retry_times", 0) + 1
+        row_id = request.meta.get("dead_letter_id")
+        if row_id is not None:
+            # a replay that failed again keeps its row
+            self.conn.execute(
+                "UPDATE dead_letter SET reason = ?, attempts = attempts + ?, "
+                "failed_at = CURRENT_TIMESTAMP WHERE id = ?",
+                (reason, attempts, row_id),
+            )
+        else:
+            self.conn.execute(
+                "INSERT INTO dead_letter (spider, url, reason, attempts, request, body) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    spider.name,
+                    request.url,
+                    reason,
+                    attempts,
+                    json.dumps(data, default=_json_default, ensure_ascii=False),
+                    body,
+                ),
+            )
+        self.conn.commit()
+        self.stats.inc_value("dead_letter/count")
+        self.stats.inc_value(f"dead_letter/{reason}")
+
+    def replay(self, spider):
+        rows = self.conn.execute(
+            "SELECT id, request, body FROM dead_letter WHERE spider = ? ORDER BY id",
+            (spider.name,),
+        ).fetchall()
+        replayed = 0
+        for row_id, data, body in rows:
+            try:
+                data = json.loads(data, object_hook=_json_object_hook)
+                data["body"] = body
+                data["dont_filter"] = True
+                request = request_from_dict(data, spider=spider)
+            except (ValueError, KeyError, AttributeError, ImportError) as e:
+                # callback or item class renamed or removed since it was stored
+                spider.logger.warning(f"Cannot replay dead letter {row_id}: {e}")
+                continue
+            # the row is deleted once the replay gets a response
+            request.meta["dead_letter_id"] = row_id
+            self.crawler.engine.crawl(request)
+            replayed += 1
+        if replayed:
+            spider.logger.info(f"Replaying {replayed} dead-lettered requests")
+            self.stats.set_value("dead_letter/replayed", replayed)
+
+    def recovered(self, request):
+        row_id = request.meta.pop("dead_letter_id", None)
+        if row_id is None:
+            return
+        self.conn.execute("DELETE FROM dead_letter WHERE id = ?", (row_id,))
+        self.conn.commit()
+        self.stats.inc_value("dead_letter/recovered")
 
     def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+        if self.dead_letter_replay:
+            self.replay(spider)
+
+    def spider_closed(self, spider):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def _json_default(value):
+    # items carried in meta by the detail requests keep their class, so the
+    # replayed callback yields the same item type
+    if isinstance(value, Item):
+        cls = type(value)
+        return {
+            "__item__": f"{cls.__module__}.{cls.__qualname__}",
+            "fields": dict(value),
+        }
+    return str(value)
+
+
+def _json_object_hook(obj):
+    if "__item__" in obj and set(obj) == {"__item__", "fields"}:
+        return load_object(obj["__item__"])(**obj["fields"])
+    return obj
+
+
+# URL pattern name -> regex, first match wins; unmatched URLs fall in "other"
+ADAPTIVE_CONCURRENCY_PATTERNS = {
+    "list": r":sem=\d+",
+    "detail": r"/course/(?:zh-TW|en)/\d",
+    "syllabus": r"/teaschm/\d+/schm",
+    "rate": r"/teaschm/\d+/(?:statistic|set20)",
+    "remain": r"(?i)remain",
+    "unit": r"/api/unit\.json",
+}
+
+
+def _compile_patterns(settings):
+    patterns = (
+        settings.getdict("ADAPTIVE_CONCURRENCY_PATTERNS")
+        or ADAPTIVE_CONCURRENCY_PATTERNS
+    )
+    return [(name, re.compile(regex)) for name, regex in patterns.items()]
+
+
+def url_pattern(url: str, patterns) -> str:
+    """Name of the first (name, regex) pair matching `url`, else "other"."""
+    for name, pattern in patterns:
+        if pattern.search(url):
+            return name
+    return "other"
+
+
+class AdaptiveConcurrencyMiddleware:
+    """
+    AIMD concurrency control per host and URL pattern.
+
+    Each request is routed to a downloader slot named "<host>/<pattern>"
+    (list, detail, syllabus, ... see ADAPTIVE_CONCURRENCY_PATTERNS), so a
+    slow syllabus backlog on newdoc can't starve es.nccu.edu.tw list calls.
+    Every ADAPTIVE_CONCURRENCY_WINDOW responses a slot is re-evaluated: if
+    its p90 latency exceeds ADAPTIVE_CONCURRENCY_TARGET_LATENCY or its
+    rate of 5xx responses and RETRY_EXCEPTIONS download errors (timeouts,
+    refused connections, ...) exceeds ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE the
+    concurrency is multiplied by ADAPTIVE_CONCURRENCY_BACKOFF, otherwise it
+    grows by one. A host-wide error burst backs off all of its slots.
+
+    Managed slots run without a download delay (a delayed slot sends one
+    request per delay whatever its concurrency), so AutoThrottle should be
+    disabled alongside. Decisions are exported as adaptive_concurrency/*
+    stats.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_CONCURRENCY_ENABLED"):
+            raise NotConfigured
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.min_concurrency = settings.getint("ADAPTIVE_CONCURRENCY_MIN", 1)
+        self.max_concurrency = settings.getint(
+            "ADAPTIVE_CONCURRENCY_MAX",
+            settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN", 8),
+        )
+        self.start_concurrency = settings.getint("ADAPTIVE_CONCURRENCY_START", 4)
+        self.target_latency = settings.getfloat(
+            "ADAPTIVE_CONCURRENCY_TARGET_LATENCY", 2.0
+        )
+        self.max_error_rate = settings.getfloat(
+            "ADAPTIVE_CONCURRENCY_MAX_ERROR_RATE", 0.05
+        )
+        self.window = settings.getint("ADAPTIVE_CONCURRENCY_WINDOW", 20)
+        self.backoff = settings.getfloat("ADAPTIVE_CONCURRENCY_BACKOFF", 0.5)
+        self.patterns = _compile_patterns(settings)
+        self.error_exceptions = retry_exceptions(settings)
+
+        # slot key -> responses, latencies and errors since the last decision
+        self.samples = defaultdict(int)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        # slot key -> Slot we configured (Scrapy recreates idle slots)
+        self.managed = {}
+
+        if settings.getbool("AUTOTHROTTLE_ENABLED"):
+            logger.warning(
+                "AdaptiveConcurrencyMiddleware and AutoThrottle both enabled; "
+                "AutoThrottle delays serialize the adaptive slots"
+            )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def classify(self, request) -> str:
+        return url_pattern(request.url, self.patterns)
+
+    def slot_key(self, request) -> str:
+        host = urlparse_cached(request).hostname or ""
+        return f"{host}/{self.classify(request)}"
+
+    def _slot(self, key):
+        return self.crawler.engine.downloader.slots.get(key)
+
+    def process_request(self, request, spider=None):
+        if "download_slot" not in request.meta:
+            request.meta["download_slot"] = self.slot_key(request)
+        return None
+
+    def process_response(self, request, response, spider=None):
+        key = request.meta.get("download_slot")
+        if key is not None:
+            latency = request.meta.get("download_latency")
+            self.observe(key, latency, error=response.status >= 500)
+        return response
+
+    def process_exception(self, request, exception, spider=None):
+        key = request.meta.get("download_slot")
+        if key is not None and isinstance(exception, self.error_exceptions):
+            self.observe(key, None, error=True)
+        return None
+
+    def observe(self, key, latency, error=False):
+        slot = self._slot(key)
+        if slot is None:
+            return
+        if self.managed.get(key) is not slot:
+            # first response on a slot Scrapy created from global settings
+            self.managed[key] = slot
+            slot.concurrency = max(
+                self.min_concurrency, min(self.start_concurrency, self.max_concurrency)
+            )
+            slot.delay = 0
+            self._export(key, slot)
+
+        self.samples[key] += 1
+        if latency is not None:
+            self.latencies[key].append(latency)
+        if error:
+            self.errors[key] += 1
+            self.stats.inc_value(f"adaptive_concurrency/{key}/errors")
+
+        if self.samples[key] >= self.window:
+            self.decide(key, slot)
+
+    def decide(self, key, slot):
+        latencies = sorted(self.latencies.pop(key, []))
+        errors = self.errors.pop(key, 0)
+        error_rate = errors / max(self.samples.pop(key, 0), 1)
+        p50 = latencies[len(latencies) // 2] if latencies else 0.0
+        p90 = latencies[int(len(latencies) * 0.9)] if latencies else 0.0
+
+        if error_rate > self.max_error_rate:
+            self._decrease(key, slot, "error_rate")
+            # the whole host is degraded, not just this URL pattern
+            host = key.split("/", 1)[0]
+            for other in list(self.managed):
+                if other != key and other.startswith(f"{host}/"):
+                    other_slot = self._slot(other)
+                    if other_slot is not None:
+                        self._decrease(other, other_slot, "host_error_rate")
+        elif p90 > self.target_latency:
+            self._decrease(key, slot, "latency")
+        elif slot.concurrency < self.max_concurrency:
+            slot.concurrency += 1
+            self.stats.inc_value(f"adaptive_concurrency/{key}/increase")
+
+        self.stats.set_value(
+            f"adaptive_concurrency/{key}/latency_p50_ms", round(p50 * 1000)
+        )
+        self.stats.set_value(
+            f"adaptive_concurrency/{key}/latency_p90_ms", round(p90 * 1000)
+        )
+        self.stats.set_value(
+            f"adaptive_concurrency/{key}/error_rate", round(error_rate, 3)
+        )
+        self._export(key, slot)
+
+    def _decrease(self, key, slot, reason):
+        concurrency = max(self.min_concurrency, int(slot.concurrency * self.backoff))
+        if concurrency < slot.concurrency:
+            logger.info(
+                "Adaptive concurrency %s: %d -> %d (%s)",
+                key,
+                slot.concurrency,
+                concurrency,
+                reason,
+            )
+        slot.concurrency = concurrency
+        self.stats.inc_value(f"adaptive_concurrency/{key}/decrease/{reason}")
+        self._export(key, slot)
+
+    def _export(self, key, slot):
+        self.stats.set_value(
+            f"adaptive_concurrency/{key}/concurrency", slot.concurrency
+        )
+        self.stats.max_value(
+            f"adaptive_concurrency/{key}/max_concurrency", slot.concurrency
+        )
@@ -0,0 +1,195 @@
+"""
+Syllabus page extraction, optionally offloaded to worker processes.
+
+The extractors take the raw body and return plain dicts, using lxml and
+precompiled XPath only, so they can run in a ProcessPoolExecutor: with
+PARSE_OFFLOAD_ENABLED the spiders ship syllabus bodies to
+PARSE_OFFLOAD_WORKERS processes and the reactor thread keeps scheduling
+downloads while pages are parsed on the other cores. Disabled, the same
+extractors run inline in the callback.
+"""
+
+import asyncio
+import logging
+import os
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context
+from typing import Callable, Dict, Optional
+
+from lxml import etree, html
+from scrapy import signals
+from scrapy.utils.asyncio import is_asyncio_available
+
+logger = logging.getLogger(__name__)
+
+
+def _has_class(*names: str) -> str:
+    return " and ".join(
+        f"contains(concat(' ', normalize-space(@class), ' '), ' {name} ')"
+        for name in names
+    )
+
+
+# `body > div.container.sylview-section > div > div > div > p::text`
+OBJECTIVE_XPATH = etree.XPath(
+    f"//body/div[{_has_class('container', 'sylview-section')}]/div/div/div/p/text()"
+)
+# `div.col-sm-7.sylview--mtop.col-p-6 h2.text-primary`
+DESCRIPTION_TITLE_XPATH = etree.XPath(
+    f"//div[{_has_class('col-sm-7', 'sylview--mtop', 'col-p-6')}]"
+    f"//h2[{_has_class('text-primary')}]"
+)
+SIBLINGS_XPATH = etree.XPath("following-sibling::*")
+CLASS_XPATH = etree.XPath("descendant-or-self::*/@class")
+TEXT_XPATH = etree.XPath("descendant-or-self::text()")
+SECTION_XPATH = etree.XPath(f"//*[{_has_class('sylview-section')}]")
+NAME_EN_XPATH = etree.XPath("//*[@id='CourseNameEn']/text()")
+
+# the bordered row after the description closes it
+DESCRIPTION_END = {"row", "sylview-mtop", "fa-border"}
+
+
+def _root(body: bytes, encoding: str):
+    # decode like Response.text and parse like parsel, so results match
+    # what response.css()/xpath() returned
+    text = body.decode(encoding or "utf-8", "replace")
+    parser = html.HTMLParser(recover=True, encoding="utf-8", huge_tree=True)
+    root = etree.fromstring(text.encode("utf-8") or b"<html/>", parser=parser)
+    return root if root is not None else etree.fromstring(b"<html/>", parser)
+
+
+def _objective(root) -> Optional[str]:
+    texts = OBJECTIVE_XPATH(root)
+    if not texts:
+        return None
+    return " ".join(text.strip() for text in texts if text.strip())
+
+
+def extract_syllabus_summary(body: bytes, url: str, encoding: str = "utf-8") -> Dict:
+    """English course name and objective (CoursesSpider)."""
+    root = _root(body, encoding)
+    fields = {}
+    name_en = NAME_EN_XPATH(root)
+    if name_en:
+        fields["name_en"] = name_en[0].strip()
+    objective = _objective(root)
+    if objective is not None:
+        fields["objective"] = objective
+    return fields
+
+
+def extract_syllabus(body: bytes, url: str, encoding: str = "utf-8") -> Dict:
+    """
+    Objective and description lines (CoursesLegacySpider).
+
+    `syllabus` is the text of the siblings after the description title up to
+    the bordered row, one stripped line per line; the page URL when that
+    yields nothing or only a generic .sylview-section is found.
+    """
+    root = _root(body, encoding)
+    fields = {}
+    objective = _objective(root)
+    if objective is not None:
+        fields["objective"] = objective
+
+    titles = DESCRIPTION_TITLE_XPATH(root)
+    if titles:
+        descriptions = []
+        siblings = [sibling for title in titles for sibling in SIBLINGS_XPATH(title)]
+        for sibling in siblings:
+            classes = CLASS_XPATH(sibling)
+            if classes and DESCRIPTION_END.issubset(classes[0].split()):
+                break
+            for text in TEXT_XPATH(sibling):
+                descriptions.extend(
+                    line.strip() for line in text.split("\n") if line.strip()
+                )
+        fields["syllabus"] = "\n".join(descriptions) if descriptions else url
+    elif SECTION_XPATH(root):
+        fields["syllabus"] = url
+    return fields
+
+
+class ParseOffload:
+    """
+    Run extractors on a lazily started process pool, or inline when
+    `workers` is 0. A pool that dies (BrokenProcessPool, on submit or while
+    pages are being parsed) is replaced by inline parsing for the rest of
+    the crawl, and the pages it lost are parsed again inline.
+    """
+
+    def __init__(self, workers: int = 0, stats=None):
+        self.workers = workers
+        self.stats = stats
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        workers = 0
+        if settings.getbool("PARSE_OFFLOAD_ENABLED"):
+            workers = settings.getint("PARSE_OFFLOAD_WORKERS") or os.cpu_count() or 1
+            if not is_asyncio_available():
+                # results come back through asyncio.wrap_future
+                logger.warning(
+                    "Parse offload needs the asyncio reactor, parsing inline"
+                )
+                workers = 0
+        offload = cls(workers, crawler.stats)
+        crawler.signals.connect(offload.shutdown, signal=signals.engine_stopped)
+        return offload
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            # spawn: forking the reactor process and its threads is not safe
+            self.executor = ProcessPoolExecutor(
+                self.workers, mp_context=get_context("spawn")
+            )
+            logger.info(f"Parsing syllabus pages on {self.workers} processes")
+        return self.executor
+
+    async def run(self, extractor: Callable[..., Dict], response) -> Dict:
+        args = (response.body, response.url, response.encoding)
+        if not self.enabled:
+            return extractor(*args)
+        try:
+            future = self._executor().submit(extractor, *args)
+            if self.stats is not None:
+                self.stats.inc_value("parse_offload/submitted")
+            return await asyncio.wrap_future(future)
+        except BrokenProcessPool as e:
+            self._broken(e)
+            return extractor(*args)
+
+    def _broken(self, error: BrokenProcessPool):
+        if self.stats is not None:
+            self.stats.inc_value("parse_offload/fallback")
+        if not self.enabled:
+            return
+        logger.error(f"Parse offload pool died, parsing inline: {error}")
+        self.workers = 0
+        self.shutdown()
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+_disabled = ParseOffload()
+_offloads: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_parse_offload(crawler=None) -> ParseOffload:
+    """The crawler's shared ParseOffload; an inline one without a crawler."""
+    if crawler is None:
+        return _disabled
+    if crawler not in _offloads:
+        _offloads[crawler] = ParseOffload.from_crawler(crawler)
+    return _offloads[crawler]
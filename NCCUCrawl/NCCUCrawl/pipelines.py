@@ -5,18 +5,202 @@
 
 
 # useful for handling different item types with a single interface
+import re
 import sqlite3
+import time
+from abc import ABC, abstractmethod
 
 from scrapy.exceptions import DropItem
 
+from NCCUCrawl.database import (
+    SHARD_MODES,
+    item_semester,
+    resolve_db_path,
+    shard_path,
+)
+from NCCUCrawl.items import (
+    CourseItem,
+    CourseLegacyItem,
+    CourseRemainItem,
+    RateItem,
+    RateLegacyItem,
+    RemainLegacyItem,
+    TeacherItem,
+    TeacherLegacyItem,
+)
+from NCCUCrawl.metrics import DB_FLUSH_SECONDS, DB_WRITE_SECONDS
+from NCCUCrawl.profiling import Profiler, get_profiler
+from NCCUCrawl.schema import (
+    TABLES,
+    apply_pragmas,
+    ensure_course_fts,
+    ensure_indexes,
+    migrate,
+    rate_rows,
+)
+
+
+# field converters used by ETLPipeline.build_registry
+def _to_float(value):
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _to_int(value):
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return None
+
+
+def _to_bool(value):
+    return value if value is None else bool(value)
+
+
+def _to_core_flag(value):
+    # list payloads carry "是"/"否", detail callbacks already store 1/0
+    if isinstance(value, str):
+        return value == "是"
+    return _to_bool(value)
+
+
+def _to_text(value):
+    return "" if value is None else str(value)
+
+
+def _to_syllabus(value):
+    if isinstance(value, (tuple, list)):
+        return str(value[0]) if value else ""
+    return _to_text(value)
+
+
+class StorageBackend(ABC):
+    """
+    Interface for the item store behind StoragePipeline.
+
+    A backend is an item pipeline of its own (open_spider / process_item /
+    close_spider) built from the crawler settings, so it can also be listed
+    in ITEM_PIPELINES directly.
+    """
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls()
+
+    @abstractmethod
+    def open_spider(self, spider): ...
+
+    @abstractmethod
+    def process_item(self, item, spider): ...
+
+    @abstractmethod
+    def close_spider(self, spider): ...
+
 
 # mainly hard coding sql syntax: suggest folding it
-class SCSRSQLitePipeline:
-    def __init__(self):
+class SCSRSQLitePipeline(StorageBackend):
+    COURSE_UPSERT_SQL = """
+    INSERT INTO course (
+        id, year, semester, sub_num, name, name_en, teacher_id,
+        kind, time, lang, lang_en, sem_qty, sem_qty_en, classroom_id,
+        unit, unit_en, college, degree, department, credit,
+        transition_type, transition_type_en, info, info_en,
+        note, note_en, syllabus, syllabus_en, objective, objective_en,
+        core, discipline, last_enroll, student_limit, student_count
+    ) VALUES (
+        :id, :year, :semester, :sub_num, :name, :name_en, :teacher_id,
+        :kind, :time, :lang, :lang_en, :sem_qty, :sem_qty_en, :classroom_id,
+        :unit, :unit_en, :college, :degree, :department, :credit,
+        :transition_type, :transition_type_en, :info, :info_en,
+        :note, :note_en, :syllabus, :syllabus_en, :objective, :objective_en,
+        :core, :discipline, :last_enroll, :student_limit, :student_count
+    )
+    ON CONFLICT(id) DO UPDATE SET
+        name                = excluded.name,
+        name_en             = excluded.name_en,
+        kind                = excluded.kind,
+        time                = excluded.time,
+        lang                = excluded.lang,
+        lang_en             = excluded.lang_en,
+        sem_qty             = excluded.sem_qty,
+        sem_qty_en          = excluded.sem_qty_en,
+        classroom_id        = excluded.classroom_id,
+        unit                = excluded.unit,
+        unit_en             = excluded.unit_en,
+        college             = excluded.college,
+        degree              = excluded.degree,
+        department          = excluded.department,
+        credit              = excluded.credit,
+        transition_type     = excluded.transition_type,
+        transition_type_en  = excluded.transition_type_en,
+        info                = excluded.info,
+        info_en             = excluded.info_en,
+        note                = excluded.note,
+        note_en             = excluded.note_en,
+        syllabus            = excluded.syllabus,
+        syllabus_en         = excluded.syllabus_en,
+        objective           = excluded.objective,
+        objective_en        = excluded.objective_en,
+        core                = excluded.core,
+        discipline          = excluded.discipline,
+        last_enroll         = excluded.last_enroll,
+        student_limit       = excluded.student_limit,
+        student_count       = excluded.student_count;
+    """
+
+    # item class -> upsert method ("ResultItem": "upsert_result" is not wired up)
+    UPSERT_METHODS = {
+        "TeacherItem": "upsert_teacher",
+        "CourseItem": "upsert_course",
+        "RateItem": "upsert_rate",
+        "CourseRemainItem": "upsert_remain",
+        "CourseLegacyItem": "upsert_course_legacy",
+        "TeacherLegacyItem": "upsert_teacher_legacy",
+        "RateLegacyItem": "upsert_rate_legacy",
+        "RemainLegacyItem": "upsert_remain_legacy",
+    }
+
+    def __init__(
+        self,
+        batch_size: int = 1,
+        mmap_size: int = 268435456,
+        cache_size: int = -65536,
+        fts_enabled: bool = True,
+        db_path: str = "data.db",
+        profiler: Profiler | None = None,
+    ):
         """Initialize the pipeline with None values for database connections."""
+        self.db_path = db_path
+        self.profiler = profiler or get_profiler()
         self._conn: sqlite3.Connection | None = None
         self._cur: sqlite3.Cursor | None = None
         self._initialized = False
+        self.mmap_size = mmap_size
+        self.cache_size = cache_size
+        self.fts_enabled = fts_enabled
+
+        # batch ETL mode: buffer CourseItems and clean/write them column-wise
+        self.batch_size = batch_size
+        self._course_buffer: list = []
+        self._etl = ETLPipeline(batch_size=batch_size)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            batch_size=settings.getint("ETL_BATCH_SIZE", 1),
+            mmap_size=settings.getint("SQLITE_MMAP_SIZE", 268435456),
+            cache_size=settings.getint("SQLITE_CACHE_SIZE", -65536),
+            fts_enabled=settings.getbool("COURSE_FTS_ENABLED", True),
+            db_path=resolve_db_path(settings),
+            profiler=get_profiler(crawler),
+        )
 
     @property
     def conn(self) -> sqlite3.Connection:
@@ -42,281 +226,51 @@ class SCSRSQLitePipeline:
 
     def open_spider(self, spider):
         """Open a connection to the SQLite database."""
-        self._conn = sqlite3.connect("data.db")
+        self._conn = sqlite3.connect(self.db_path)
         self._cur = self._conn.cursor()
-        self._cur.execute("PRAGMA journal_mode = WAL")
-        self._cur.execute("PRAGMA synchronous = NORMAL")
+        apply_pragmas(self._conn, self.mmap_size, self.cache_size)
+        self._initialized = True
+
+        applied = self.create_tables()
+        if applied:
+            spider.logger.info(f"Applied schema migrations: {applied}")
+        created = ensure_indexes(self.conn)
+        if created:
+            spider.logger.info(f"Created indexes: {', '.join(created)}")
 
-        self.create_tables()
+        if self.fts_enabled:
+            try:
+                if ensure_course_fts(self.conn):
+                    spider.logger.info("Built course_fts full-text index")
+            except sqlite3.OperationalError as e:
+                # SQLite built without FTS5 or older than 3.34 (no trigram)
+                spider.logger.warning(f"Course full-text index unavailable: {e}")
 
     def close_spider(self, spider):
         if self.conn:
+            self.flush_courses()
             self.conn.commit()
+            self.conn.execute("PRAGMA optimize")
             self.conn.close()
 
     def process_item(self, item, spider):
-        if item.__class__.__name__ == "TeacherItem":
-            self.upsert_teacher(item)
-        elif item.__class__.__name__ == "CourseItem":
-            self.upsert_course(item)
-        elif item.__class__.__name__ == "RateItem":
-            self.upsert_rate(item)
-        elif item.__class__.__name__ == "CourseRemainItem":
-            self.upsert_remain(item)
-        elif item.__class__.__name__ == "CourseLegacyItem":
-            self.upsert_course_legacy(item)
-        elif item.__class__.__name__ == "TeacherLegacyItem":
-            self.upsert_teacher_legacy(item)
-        elif item.__class__.__name__ == "RateLegacyItem":
-            self.upsert_rate_legacy(item)
-        # elif item.__class__.__name__ == "ResultItem":
-        #     self.upsert_result(item)
-        elif item.__class__.__name__ == "RemainLegacyItem":
-            self.upsert_remain_legacy(item)
-        else:
+        name = item.__class__.__name__
+        if name == "CourseItem" and self.batch_size > 1:
+            self._course_buffer.append(item)
+            if len(self._course_buffer) >= self.batch_size:
+                self.flush_courses()
+            return item
+
+        method = self.UPSERT_METHODS.get(name)
+        if method is None:
             raise DropItem(f"unknown item type: {type(item)}")
+        with self.profiler.timer(f"upsert/{method}"):
+            getattr(self, method)(item)
         return item
 
     def create_tables(self):
-        """Create database tables if they don't exist."""
-
-        # Create teacher table
-        self.cur.execute("""
-        CREATE TABLE IF NOT EXISTS teacher (
-            id TEXT PRIMARY KEY,
-            name TEXT,
-            name_en TEXT,
-            department TEXT,
-            first_appear TEXT
-        )
-        """)
-
-        # Create course table
-        self.cur.execute("""
-        CREATE TABLE IF NOT EXISTS course (
-            id TEXT PRIMARY KEY,
-            year TEXT,
-            semester TEXT,
-            sub_num TEXT,
-            name TEXT,
-            name_en TEXT,
-            teacher_id TEXT REFERENCES teacher(id),
-            kind TEXT,
-            time TEXT,
-            lang TEXT,
-            lang_en TEXT,
-            sem_qty TEXT,
-            sem_qty_en TEXT,
-            classroom_id TEXT,
-            unit TEXT,
-            unit_en TEXT,
-            college TEXT,
-            degree TEXT,
-            department TEXT,
-            credit INTEGER,
-            transition_type TEXT,
-            transition_type_en TEXT,
-            info TEXT,
-            info_en TEXT,
-            note TEXT,
-            note_en TEXT,
-            syllabus TEXT,
-            syllabus_en TEXT,
-            objective TEXT,
-            objective_en TEXT,
-            core BOOLEAN,
-            discipline TEXT,
-            last_enroll INTEGER,
-            student_limit INTEGER,
-            student_count INTEGER
-        )
-        """)
-
-        # Create course_remain table
-        self.cur.execute("""
-        CREATE TABLE IF NOT EXISTS course_remain (
-            course_id TEXT PRIMARY KEY REFERENCES course(id),
-            signable BOOLEAN,
-            waiting_count INTEGER,
-            origin_maximum INTEGER,
-            origin_registered INTEGER,
-            origin_remained INTEGER,
-            all_maximum INTEGER,
-            all_registered INTEGER,
-            all_remained INTEGER,
-            other_dept_maximum INTEGER,
-            other_dept_registered INTEGER,
-            other_dept_remained INTEGER,
-            same_grade_maximum INTEGER,
-            same_grade_registered INTEGER,
-            same_grade_remained INTEGER,
-            diff_grade_maximum INTEGER,
-            diff_grade_registered INTEGER,
-            diff_grade_remained INTEGER,
-            minor_maximum INTEGER,
-            minor_registered INTEGER,
-            minor_remained INTEGER,
-            double_major_maximum INTEGER,
-            double_major_registered INTEGER,
-            double_major_remained INTEGER,
-            other_dept_in_college_maximum INTEGER,
-            other_dept_in_college_registered INTEGER,
-            other_dept_in_college_remained INTEGER,
-            other_college_maximum INTEGER,
-            other_college_registered INTEGER,
-            other_college_remained INTEGER,
-            program_maximum INTEGER,
-            program_registered INTEGER,
-            program_remained INTEGER,
-            same_grade_and_above_maximum INTEGER,
-            same_grade_and_above_registered INTEGER,
-            same_grade_and_above_remained INTEGER,
-            lower_grade_maximum INTEGER,
-            lower_grade_registered INTEGER,
-            lower_grade_remained INTEGER,
-            other_program_maximum INTEGER,
-            other_program_registered INTEGER,
-            other_program_remained INTEGER
-        )
-        """)
-
-        # Create rate table (if needed)
-        self.cur.execute("""
-        CREATE TABLE IF NOT EXISTS rate (
-            course_id TEXT REFERENCES course(id),
-            teacher_id TEXT REFERENCES teacher(id),
-            content TEXT,
-            content_en TEXT
-        )
-        """)
-
-        # Course Legacy table
-        self.cur.execute("""
-        CREATE TABLE IF NOT EXISTS course_legacy (
-            id TEXT PRIMARY KEY,
-            y TEXT,
-            s TEXT,
-            subNum TEXT,
-            name TEXT,
-            nameEn TEXT,
-            teacher TEXT,
-            teacherEn TEXT,
-            kind INTEGER,
-            time TEXT,
-            timeEn TEXT,
-            lmtKind TEXT,
-            lmtKindEn TEXT,
-            core BOOLEAN,
-            lang TEXT,
-            langEn TEXT,
-            semQty TEXT,
-            classroom TEXT,
-            classroomId TEXT,
-            unit TEXT,
-            unitEn TEXT,
-            dp1 TEXT,
-            dp2 TEXT,
-            dp3 TEXT,
-            point REAL,
-            subRemainUrl TEXT,
-            subSetUrl TEXT,
-            subUnitRuleUrl TEXT,
-            teaExpUrl TEXT,
-            teaSchmUrl TEXT,
-            tranTpe TEXT,
-            tranTpeEn TEXT,
-            info TEXT,
-            infoEn TEXT,
-            note TEXT,
-            noteEn TEXT,
-            syllabus TEXT,
-            objective TEXT
-        )
-        """)
-
-        # Teacher Legacy table
-        self.cur.execute("""
-        CREATE TABLE IF NOT EXISTS teacher_legacy (
-            id TEXT PRIMARY KEY,
-            name TEXT
-        )
-        """)
-
-        # Rate Legacy table
-        self.cur.execute("""
-        CREATE TABLE IF NOT EXISTS rate_legacy (
-            courseId TEXT,
-            rowId TEXT,
-            teacherId TEXT,
-            content TEXT,
-            contentEn TEXT,
-            PRIMARY KEY (courseId, rowId)
-        )
-        """)
-
-        # Result table
-        self.cur.execute("""
-        CREATE TABLE IF NOT EXISTS result (
-            courseId TEXT PRIMARY KEY,
-            yearsem TEXT,
-            name TEXT,
-            teacher TEXT,
-            time TEXT,
-            studentLimit INTEGER,
-            studentCount INTEGER,
-            lastEnroll INTEGER
-        )
-        """)
-
-        #  Remain Legacy table
-        self.cur.execute("""
-        CREATE TABLE IF NOT EXISTS remain_legacy (
-            id TEXT PRIMARY KEY,
-            signableAdding BOOLEAN,
-            waitingList INTEGER,
-            originLimit INTEGER,
-            originRegistered INTEGER,
-            originAvailable INTEGER,
-            allLimit INTEGER,
-            allRegistered INTEGER,
-            allAvailable INTEGER,
-            otherDeptLimit INTEGER,
-            otherDeptRegistered INTEGER,
-            otherDeptAvailable INTEGER,
-            sameGradeLimit INTEGER,
-            sameGradeRegistered INTEGER,
-            sameGradeAvailable INTEGER,
-            diffGradeLimit INTEGER,
-            diffGradeRegistered INTEGER,
-            diffGradeAvailable INTEGER,
-            minorLimit INTEGER,
-            minorRegistered INTEGER,
-            minorAvailable INTEGER,
-            doubleMajorLimit INTEGER,
-            doubleMajorRegistered INTEGER,
-            doubleMajorAvailable INTEGER,
-            otherDeptInCollegeLimit INTEGER,
-            otherDeptInCollegeRegistered INTEGER,
-            otherDeptInCollegeAvailable INTEGER,
-            otherCollegeLimit INTEGER,
-            otherCollegeRegistered INTEGER,
-            otherCollegeAvailable INTEGER,
-            programLimit INTEGER,
-            programRegistered INTEGER,
-            programAvailable INTEGER,
-            sameGradeAndAboveLimit INTEGER,
-            sameGradeAndAboveRegistered INTEGER,
-            sameGradeAndAboveAvailable INTEGER,
-            lowerGradeLimit INTEGER,
-            lowerGradeRegistered INTEGER,
-            lowerGradeAvailable INTEGER,
-            otherProgramLimit INTEGER,
-            otherProgramRegistered INTEGER,
-            otherProgramAvailable INTEGER
-        )
-        """)
-
-        self.conn.commit()
+        """Create or upgrade the database schema (see NCCUCrawl.schema.MIGRATIONS)."""
+        return migrate(self.conn)
 
     def upsert_teacher(self, i):
         sql = """
@@ -332,66 +286,50 @@ class SCSRSQLitePipeline:
         self.conn.commit()
 
     def upsert_course(self, i):
-        sql = """
-        INSERT INTO course (
-            id, year, semester, sub_num, name, name_en, teacher_id,
-            kind, time, lang, lang_en, sem_qty, sem_qty_en, classroom_id,
-            unit, unit_en, college, degree, department, credit,
-            transition_type, transition_type_en, info, info_en,
-            note, note_en, syllabus, syllabus_en, objective, objective_en,
-            core, discipline, last_enroll, student_limit, student_count
-        ) VALUES (
-            :id, :year, :semester, :sub_num, :name, :name_en, :teacher_id,
-            :kind, :time, :lang, :lang_en, :sem_qty, :sem_qty_en, :classroom_id,
-            :unit, :unit_en, :college, :degree, :department, :credit,
-            :transition_type, :transition_type_en, :info, :info_en,
-            :note, :note_en, :syllabus, :syllabus_en, :objective, :objective_en,
-            :core, :discipline, :last_enroll, :student_limit, :student_count
-        )
-        ON CONFLICT(id) DO UPDATE SET
-            name                = excluded.name,
-            name_en             = excluded.name_en,
-            kind                = excluded.kind,
-            time                = excluded.time,
-            lang                = excluded.lang,
-            lang_en             = excluded.lang_en,
-            sem_qty             = excluded.sem_qty,
-            sem_qty_en          = excluded.sem_qty_en,
-            classroom_id        = excluded.classroom_id,
-            unit                = excluded.unit,
-            unit_en             = excluded.unit_en,
-            college             = excluded.college,
-            degree              = excluded.degree,
-            department          = excluded.department,
-            credit              = excluded.credit,
-            transition_type     = excluded.transition_type,
-            transition_type_en  = excluded.transition_type_en,
-            info                = excluded.info,
-            info_en             = excluded.info_en,
-            note                = excluded.note,
-            note_en             = excluded.note_en,
-            syllabus            = excluded.syllabus,
-            syllabus_en         = excluded.syllabus_en,
-            objective           = excluded.objective,
-            objective_en        = excluded.objective_en,
-            core                = excluded.core,
-            discipline          = excluded.discipline,
-            last_enroll         = excluded.last_enroll,
-            student_limit       = excluded.student_limit,
-            student_count       = excluded.student_count;
-        """
-        self.cur.execute(sql, dict(i))
+        self.cur.execute(self.COURSE_UPSERT_SQL, dict(i))
         self.conn.commit()
 
+    def flush_courses(self):
+        """Clean buffered CourseItems in one column-wise pass and write them in one transaction."""
+        if not self._course_buffer:
+            return
+
+        started = time.perf_counter()
+        with self.profiler.timer("upsert/flush_courses"):
+            rows = self._etl.clean_course_batch(self._course_buffer)
+            self._course_buffer = []
+            self.cur.executemany(self.COURSE_UPSERT_SQL, rows)
+            self.conn.commit()
+        DB_FLUSH_SECONDS.observe(time.perf_counter() - started, backend="sqlite")
+
     def upsert_rate(self, i):
-        sql = """
-        INSERT OR IGNORE INTO rate (
-            course_id, teacher_id, content, content_en
-        ) VALUES (
-            :course_id, :teacher_id, :content, :content_en
-        );
-        """
-        self.cur.execute(sql, dict(i))
+        """Content-addressed: re-crawling the same comment is a no-op"""
+        content, rate = rate_rows(
+            i.get("courseId"), i.get("teacherId"), i.get("content"), i.get("contentEn")
+        )
+        self.upsert_rate_content(content)
+        self.insert_rate(rate)
+
+    def upsert_rate_content(self, content):
+        self.cur.execute(
+            """
+            INSERT INTO rate_content (hash, content, content_en)
+            VALUES (:hash, :content, :content_en)
+            ON CONFLICT(hash) DO UPDATE SET
+                content_en = COALESCE(excluded.content_en, rate_content.content_en);
+            """,
+            content,
+        )
+        self.conn.commit()
+
+    def insert_rate(self, rate):
+        self.cur.execute(
+            """
+            INSERT OR IGNORE INTO rate (id, course_id, teacher_id, content_hash)
+            VALUES (:id, :course_id, :teacher_id, :content_hash);
+            """,
+            rate,
+        )
         self.conn.commit()
 
     def upsert_remain(self, i):
@@ -620,7 +558,7 @@ class SCSRSQLitePipeline:
             otherCollegeRegistered      = excluded.otherCollegeRegistered,
             otherCollegeAvailable       = excluded.otherCollegeAvailable,
             programLimit                = excluded.programLimit,
-            rogramRegistered           = excluded.programRegistered,
+            programRegistered           = excluded.programRegistered,
             programAvailable            = excluded.programAvailable,
             sameGradeAndAboveLimit      = excluded.sameGradeAndAboveLimit,
             sameGradeAndAboveRegistered = excluded.sameGradeAndAboveRegistered,
@@ -636,6 +574,76 @@ class SCSRSQLitePipeline:
         self.conn.commit()
 
 
+class ShardedSQLiteBackend(StorageBackend):
+    """
+    Routes items to one SCSRSQLitePipeline per shard file (see
+    NCCUCrawl.database): per spider, or per item semester with semesterless
+    rows (teachers) kept in the base file. Per semester, a RateItem's
+    rate_content row also goes to the base file, so a comment repeated
+    across semesters is stored once. Shards open lazily on first write.
+    """
+
+    def __init__(self, mode: str, db_path: str = "data.db", **pipeline_kwargs):
+        if mode not in SHARD_MODES:
+            raise ValueError(f"unknown SQLITE_SHARD: {mode}")
+        self.mode = mode
+        self.db_path = db_path
+        self.pipeline_kwargs = pipeline_kwargs
+        self.shards: dict = {}
+        self._spider = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            mode=settings.get("SQLITE_SHARD"),
+            db_path=resolve_db_path(settings),
+            batch_size=settings.getint("ETL_BATCH_SIZE", 1),
+            mmap_size=settings.getint("SQLITE_MMAP_SIZE", 268435456),
+            cache_size=settings.getint("SQLITE_CACHE_SIZE", -65536),
+            fts_enabled=settings.getbool("COURSE_FTS_ENABLED", True),
+            profiler=get_profiler(crawler),
+        )
+
+    def shard_for(self, item) -> str:
+        if self.mode == "spider":
+            return shard_path(self.db_path, self._spider.name)
+        semester = item_semester(item)
+        return shard_path(self.db_path, semester) if semester else self.db_path
+
+    def open_spider(self, spider):
+        self._spider = spider
+
+    def pipeline(self, path: str, spider) -> "SCSRSQLitePipeline":
+        pipeline = self.shards.get(path)
+        if pipeline is None:
+            pipeline = SCSRSQLitePipeline(db_path=path, **self.pipeline_kwargs)
+            pipeline.open_spider(spider)
+            self.shards[path] = pipeline
+        return pipeline
+
+    def process_item(self, item, spider):
+        path = self.shard_for(item)
+        if self.mode == "semester" and isinstance(item, RateItem):
+            content, rate = rate_rows(
+                item.get("courseId"),
+                item.get("teacherId"),
+                item.get("content"),
+                item.get("contentEn"),
+            )
+            shard = self.pipeline(path, spider)
+            with shard.profiler.timer("upsert/upsert_rate"):
+                self.pipeline(self.db_path, spider).upsert_rate_content(content)
+                shard.insert_rate(rate)
+            return item
+        return self.pipeline(path, spider).process_item(item, spider)
+
+    def close_spider(self, spider):
+        for pipeline in self.shards.values():
+            pipeline.close_spider(spider)
+        self.shards.clear()
+
+
 class ETLPipeline:
     LANGUAGE_MAPPING = {
         "中文": "chinese",
@@ -668,116 +676,321 @@ class ETLPipeline:
         "群修": 3,
     }
 
+    REQUIRED_STRING_FIELDS = [
+        "note",
+        "note_en",
+        "unit_en",
+        "department",
+        "transition_type_en",
+        "name_en",
+        "objective",
+        "objective_en",
+        "syllabus_en",
+        "teacher_id",
+        "syllabus",
+        "info",
+        "info_en",
+        "discipline",
+    ]
+
+    def __init__(self, batch_size: int = 1, backend: str = "sqlite"):
+        self.batch_size = batch_size
+        # the sqlite backend buffers CourseItems and cleans them column-wise
+        # in SCSRSQLitePipeline.flush_courses; other backends get them cleaned
+        self.defer_courses = batch_size > 1 and backend == "sqlite"
+        self.registry = self.build_registry()
+        self.profiler = get_profiler()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        pipeline = cls(
+            batch_size=settings.getint("ETL_BATCH_SIZE", 1),
+            backend=settings.get("STORAGE_BACKEND", "sqlite"),
+        )
+        pipeline.profiler = get_profiler(crawler)
+        return pipeline
+
+    def build_registry(self):
+        """
+        Compile one conversion plan per item class.
+
+        A plan is a tuple of (target, source, converter) steps; cleaning an
+        item is `item[target] = converter(item.get(source))` for each step.
+        """
+        lang = self.LANGUAGE_MAPPING.get
+        sem = self.SEM_MAPPING.get
+        kind = self.KIND_MAPPING.get
+
+        def legacy_kind(value):
+            # the detail callbacks already store convert_kind_to_int() results
+            return value if isinstance(value, int) else kind(value, 0)
+
+        course = {f: _to_text for f in self.REQUIRED_STRING_FIELDS}
+        course.update(
+            {
+                "sem_qty": lambda v: sem(v, 0),
+                "kind": lambda v: kind(v, 0),
+                "syllabus": _to_syllabus,
+                "core": _to_bool,
+                "credit": _to_float,
+                "last_enroll": _to_int,
+                "student_limit": _to_int,
+                "student_count": _to_int,
+            }
+        )
+        course_steps = [("lang_en", "lang", lambda v: lang(v, "unknown"))]
+
+        course_legacy = {
+            "kind": legacy_kind,
+            "core": _to_core_flag,
+            "point": _to_float,
+        }
+
+        remain = {
+            f: _to_int
+            for f in CourseRemainItem.fields
+            if f not in ("course_id", "signable")
+        }
+        remain["signable"] = _to_bool
+
+        remain_legacy = {
+            f: _to_int
+            for f in RemainLegacyItem.fields
+            if f not in ("id", "signableAdding")
+        }
+        remain_legacy["signableAdding"] = _to_bool
+
+        converters = {
+            CourseItem: course,
+            CourseLegacyItem: course_legacy,
+            CourseRemainItem: remain,
+            RemainLegacyItem: remain_legacy,
+            TeacherItem: {"id": _to_text},
+            TeacherLegacyItem: {"id": _to_text},
+            RateItem: {"courseId": _to_text, "teacherId": _to_text},
+            RateLegacyItem: {
+                "courseId": _to_text,
+                "rowId": _to_text,
+                "teacherId": _to_text,
+            },
+        }
+
+        registry = {}
+        for item_cls, fields in converters.items():
+            steps = course_steps if item_cls is CourseItem else []
+            registry[item_cls.__name__] = tuple(steps) + tuple(
+                (f, f, fields[f]) for f in item_cls.fields if f in fields
+            )
+        return registry
+
     def process_item(self, item, spider):
         """Process items and clean data before storing."""
-        if item.__class__.__name__ == "CourseItem":
-            item = self.clean_course_item(item)
+        name = item.__class__.__name__
+        if name == "CourseItem" and self.defer_courses:
+            return item
+
+        plan = self.registry.get(name)
+        if plan:
+            with self.profiler.timer("pipeline/ETLPipeline"):
+                item = self.clean_item(item, plan)
         return item
 
-    def _transform_mappings(self, item):
-        """Clean and transform course item fields."""
-        item["lang_en"] = self.LANGUAGE_MAPPING.get(item["lang"], "unknown")
-        item["sem_qty"] = self.SEM_MAPPING.get(item["sem_qty"], 0)
-        item["kind"] = self.KIND_MAPPING.get(item["kind"], 0)
+    def clean_item(self, item, plan=None):
+        """Apply the item's conversion plan in a single pass."""
+        if plan is None:
+            plan = self.registry.get(item.__class__.__name__, ())
+
+        get = item.get
+        for target, source, convert in plan:
+            item[target] = convert(get(source))
         return item
 
-    def _ensure_required_fields(self, item):
-        required_string_fields = [
-            "note",
-            "note_en",
-            "unit_en",
-            "department",
-            "transition_type_en",
-            "name_en",
-            "objective",
-            "objective_en",
-            "syllabus_en",
-            "teacher_id",
-            "syllabus",
-            "info",
-            "info_en",
-            "discipline",
-        ]
-
-        required_integer_fields = ["last_enroll", "student_limit", "student_count"]
-
-        for field in required_string_fields:
-            if item.get(field) is None:
-                item[field] = ""
-
-        for field in required_integer_fields:
-            if item.get(field) is None:
-                item[field] = None
+    def clean_course_batch(self, items):
+        """Clean CourseItems column-wise and return plain row dicts for executemany."""
+        fields = list(CourseItem.fields)
+        columns = {f: [item.get(f) for item in items] for f in fields}
 
-        return item
+        for target, source, convert in self.registry["CourseItem"]:
+            columns[target] = list(map(convert, columns[source]))
 
-    def _fix_data_types(self, item):
-        if isinstance(item.get("syllabus"), (tuple, list)):
-            item["syllabus"] = str(item["syllabus"][0]) if item["syllabus"] else ""
+        return [dict(zip(fields, row)) for row in zip(*columns.values())]
 
-        if item.get("core") is not None and not isinstance(item["core"], bool):
-            item["core"] = bool(item["core"])
 
-        if item.get("credit") is not None:
-            try:
-                item["credit"] = float(item["credit"])
-            except (ValueError, TypeError):
-                item["credit"] = None
+class ETLPipelineLegacy(ETLPipeline):
+    """Kept so old ITEM_PIPELINES configs keep loading; ETLPipeline covers legacy items."""
 
-        return item
 
-    def clean_course_item(self, item):
-        item = self._transform_mappings(item)
-        item = self._ensure_required_fields(item)
-        item = self._fix_data_types(item)
+# item class -> (table, primary key columns, {item field: column} renames)
+ITEM_TABLES = {
+    "TeacherItem": ("teacher", ("id",), {}),
+    "CourseItem": ("course", ("id",), {}),
+    "CourseRemainItem": ("course_remain", ("course_id",), {}),
+    "RateItem": ("rate", ("id",), {}),
+    "CourseLegacyItem": ("course_legacy", ("id",), {}),
+    "TeacherLegacyItem": ("teacher_legacy", ("id",), {}),
+    "RateLegacyItem": ("rate_legacy", ("courseId", "rowId"), {}),
+    "RemainLegacyItem": ("remain_legacy", ("id",), {}),
+}
 
-        return item
+# tables only written as a side row of another item
+TABLE_KEYS = {"rate_content": ("hash",)}
+TABLE_KEYS.update({table: key for table, key, _ in ITEM_TABLES.values()})
 
 
-class ETLPipelineLegacy:
-    KIND_MAPPING = {
-        "必修": 1,
-        "選修": 2,
-        "群修": 3,
-    }
+class PostgresCopyBackend(StorageBackend):
+    """
+    PostgreSQL backend: buffers rows per table, COPYs each batch into a
+    temporary staging table and merges it with one INSERT ... ON CONFLICT.
+
+    Needs psycopg 3 (`pip install psycopg`). Tables are created from
+    NCCUCrawl.schema.TABLES; SQLite-only foreign keys are left out so
+    spiders can write in any order.
+    """
+
+    def __init__(self, dsn: str, batch_size: int = 1000):
+        self.dsn = dsn
+        self.batch_size = batch_size
+        self.conn = None
+        self._buffers: dict = {}
+        self._pending = 0
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        dsn = crawler.settings.get("STORAGE_DSN")
+        if not dsn:
+            raise ValueError("STORAGE_DSN is required for the postgres backend")
+        return cls(dsn, batch_size=crawler.settings.getint("STORAGE_BATCH_SIZE", 1000))
+
+    def open_spider(self, spider):
+        try:
+            import psycopg
+        except ImportError as e:
+            raise ImportError("postgres backend requires psycopg") from e
+
+        self.conn = psycopg.connect(self.dsn)
+        with self.conn.cursor() as cur:
+            for name, columns in TABLES.items():
+                columns = re.sub(r"\s+REFERENCES\s+\w+\s*\(\w+\)", "", columns)
+                cur.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns})")
+        self.conn.commit()
+
+    def close_spider(self, spider):
+        if self.conn is not None:
+            self.flush()
+            self.conn.close()
 
     def process_item(self, item, spider):
-        """Process items and clean data before storing."""
-        if item.__class__.__name__ == "CourseItem":
-            item = self.clean_course_item(item)
-        return item
+        name = item.__class__.__name__
+        if name not in ITEM_TABLES:
+            raise DropItem(f"unknown item type: {type(item)}")
 
-    def _transform_mappings(self, item):
-        """Clean and transform course item fields."""
-        item["kind"] = self.KIND_MAPPING.get(item["kind"], 0)
+        table, key, renames = ITEM_TABLES[name]
+        if name == "RateItem":
+            content, row = rate_rows(
+                item.get("courseId"),
+                item.get("teacherId"),
+                item.get("content"),
+                item.get("contentEn"),
+            )
+            self._buffer("rate_content", content)
+        else:
+            row = {}
+            for field, value in item.items():
+                column = renames.get(field, field)
+                if column is not None:
+                    row[column] = value
+
+        self._buffer(table, row)
+        self._pending += 1
+        if self._pending >= self.batch_size:
+            self.flush()
         return item
 
-    def _ensure_required_fields(self, item):
-        required_integer_fields = ["last_enroll", "student_limit", "student_count"]
-        for field in required_integer_fields:
-            if item.get(field) is None:
-                item[field] = None
+    def _buffer(self, table, row):
+        buffer = self._buffers.setdefault(table, {})
+        # later items for the same key replace earlier ones, like the upserts
+        key = TABLE_KEYS[table]
+        row_key = tuple(row.get(k) for k in key) if key else len(buffer)
+        buffer[row_key] = row
+
+    def flush(self):
+        """COPY every buffered table into staging and merge it in one transaction."""
+        if not self._pending:
+            return
+
+        started = time.perf_counter()
+        with self.conn.cursor() as cur:
+            for table, buffer in self._buffers.items():
+                if buffer:
+                    self._merge(cur, table, list(buffer.values()))
+        self.conn.commit()
+        DB_FLUSH_SECONDS.observe(time.perf_counter() - started, backend="postgres")
+        self._buffers = {}
+        self._pending = 0
+
+    def _merge(self, cur, table, rows):
+        key = TABLE_KEYS[table]
+        columns = list(rows[0])
+        column_list = ", ".join(columns)
+        staging = f"{table}_staging"
+
+        cur.execute(
+            f"CREATE TEMP TABLE {staging} (LIKE {table} INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        with cur.copy(f"COPY {staging} ({column_list}) FROM STDIN") as copy:
+            for row in rows:
+                copy.write_row([row.get(c) for c in columns])
 
-        return item
+        if key:
+            updates = ", ".join(f"{c} = EXCLUDED.{c}" for c in columns if c not in key)
+            conflict = f"ON CONFLICT ({', '.join(key)}) DO UPDATE SET {updates}"
+        else:
+            conflict = "ON CONFLICT DO NOTHING"
+        cur.execute(
+            f"INSERT INTO {table} ({column_list}) "
+            f"SELECT {column_list} FROM {staging} {conflict}"
+        )
 
-    def _fix_data_types(self, item):
-        if isinstance(item.get("syllabus"), (tuple, list)):
-            item["syllabus"] = str(item["syllabus"][0]) if item["syllabus"] else ""
 
-        if item.get("core") is not None and not isinstance(item["core"], bool):
-            item["core"] = bool(item["core"])
+STORAGE_BACKENDS = {
+    "sqlite": SCSRSQLitePipeline,
+    "postgres": PostgresCopyBackend,
+}
 
-        if item.get("credit") is not None:
-            try:
-                item["credit"] = float(item["credit"])
-            except (ValueError, TypeError):
-                item["credit"] = None
 
-        return item
+class StoragePipeline:
+    """Writes items through the backend named by the STORAGE_BACKEND setting."""
+
+    def __init__(self, backend: StorageBackend, profiler: Profiler | None = None):
+        self.backend = backend
+        self.profiler = profiler or get_profiler()
+        self.backend_name = type(backend).__name__
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        name = crawler.settings.get("STORAGE_BACKEND", "sqlite")
+        # NotConfigured would silently disable storage; misconfiguration
+        # must stop the crawl
+        if name not in STORAGE_BACKENDS:
+            raise ValueError(f"unknown STORAGE_BACKEND: {name}")
+        if name == "sqlite" and crawler.settings.get("SQLITE_SHARD"):
+            backend = ShardedSQLiteBackend.from_crawler(crawler)
+        else:
+            backend = STORAGE_BACKENDS[name].from_crawler(crawler)
+        return cls(backend, get_profiler(crawler))
+
+    def open_spider(self, spider):
+        self.backend.open_spider(spider)
 
-    def clean_course_item(self, item):
-        item = self._transform_mappings(item)
-        item = self._ensure_required_fields(item)
-        item = self._fix_data_types(item)
+    def close_spider(self, spider):
+        self.backend.close_spider(spider)
 
+    def process_item(self, item, spider):
+        started = time.perf_counter()
+        with self.profiler.timer("pipeline/StoragePipeline"):
+            item = self.backend.process_item(item, spider)
+        DB_WRITE_SECONDS.observe(
+            time.perf_counter() - started, backend=self.backend_name
+        )
         return item
@@ -0,0 +1,164 @@
+"""
+Sampled hot-path timing for callbacks, pipeline stages and upserts.
+
+One Profiler per crawler (get_profiler) collects log-bucketed histograms:
+
+    callback/<name>/wall, callback/<name>/cpu      spider callbacks
+    pipeline/<class>/wall, pipeline/<class>/cpu    item pipeline stages
+    upsert/<method>/wall, upsert/<method>/cpu      SQLite writes
+    download/<pattern>/latency, download/<pattern>/bytes
+
+Only PROFILING_SAMPLE_RATE of the events are timed, so the overhead of a
+disabled or lightly sampled profiler is one random() call per event.
+Summaries go to Scrapy stats as profile/<name>/{count,p50,p90,p99,max}
+and, every PROFILING_INTERVAL seconds, to the log and PROFILING_DUMP_PATH.
+"""
+
+import json
+import logging
+import os
+import random
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Exponential buckets: bucket i holds values up to start * factor**i."""
+
+    def __init__(self, start: float, factor: float = 2.0, buckets: int = 32):
+        self.bounds = [start * factor**i for i in range(buckets)]
+        self.counts = [0] * (buckets + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        lo, hi = 0, len(self.bounds)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if value <= self.bounds[mid]:
+                hi = mid
+            else:
+                lo = mid + 1
+        self.counts[lo] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (0 < q <= 1)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return self.bounds[i] if i < len(self.bounds) else self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+        }
+
+
+class Profiler:
+    def __init__(self, enabled: bool = False, sample_rate: float = 0.1):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.histograms: Dict[str, Histogram] = {}
+
+    @classmethod
+    def from_settings(cls, settings) -> "Profiler":
+        return cls(
+            enabled=settings.getbool("PROFILING_ENABLED", False),
+            sample_rate=settings.getfloat("PROFILING_SAMPLE_RATE", 0.1),
+        )
+
+    def sampled(self) -> bool:
+        return self.enabled and random.random() < self.sample_rate
+
+    def observe(self, name: str, value: float, start: float = 1e-5):
+        hist = self.histograms.get(name)
+        if hist is None:
+            hist = self.histograms[name] = Histogram(start)
+        hist.observe(value)
+
+    def timer(self, name: str):
+        """Context manager timing a sampled block as <name>/wall and <name>/cpu."""
+        if not self.sampled():
+            return nullcontext()
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str):
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}/wall", time.perf_counter() - wall)
+            self.observe(f"{name}/cpu", time.process_time() - cpu)
+
+    def summary(self) -> dict:
+        return {name: h.summary() for name, h in sorted(self.histograms.items())}
+
+    def export(self, stats):
+        for name, summary in self.summary().items():
+            for key in ("count", "p50", "p90", "p99", "max"):
+                value = summary[key]
+                stats.set_value(
+                    f"profile/{name}/{key}",
+                    value if key == "count" else round(value, 6),
+                )
+
+    def dump(self, path: str, spider_name: Optional[str] = None):
+        data = {
+            "spider": spider_name,
+            "time": time.time(),
+            "sample_rate": self.sample_rate,
+            "histograms": self.summary(),
+        }
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+    def log_top(self, limit: int = 5):
+        """Log the sampled wall-time leaders (sum of observations)."""
+        walls = [
+            (h.total, name[: -len("/wall")], h)
+            for name, h in self.histograms.items()
+            if name.endswith("/wall")
+        ]
+        for total, name, h in sorted(walls, reverse=True)[:limit]:
+            logger.info(
+                "profile %s: n=%d sum=%.3fs p50=%.1fms p99=%.1fms",
+                name,
+                h.count,
+                total,
+                h.percentile(0.5) * 1000,
+                h.percentile(0.99) * 1000,
+            )
+
+
+_profilers: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_disabled = Profiler(enabled=False)
+
+
+def get_profiler(crawler=None) -> Profiler:
+    """The crawler's shared Profiler; a disabled one without a crawler."""
+    if crawler is None:
+        return _disabled
+    if crawler not in _profilers:
+        _profilers[crawler] = Profiler.from_settings(crawler.settings)
+    return _profilers[crawler]
@@ -0,0 +1,74 @@
+"""
+Keep requests that must wait out of the downloader.
+
+Retry backoff and an open circuit breaker (NccucrawlDownloaderMiddleware)
+make a request wait before it may be downloaded. Waiting inside the
+downloader middleware chain would keep it in downloader.active, where it
+counts against CONCURRENT_REQUESTS and stalls every other host.
+HoldingScheduler asks the middleware, when it dequeues a request, how long
+the request must still wait. If it must wait, the scheduler parks the
+request and hands out the next one. A parked request goes out again once
+its wait is over, on the first next_request() after that. The engine calls
+next_request() after every download and at least every 5 seconds.
+"""
+
+import heapq
+import itertools
+import time
+import weakref
+from typing import Callable, Optional
+
+from scrapy import Request
+from scrapy.core.scheduler import Scheduler
+
+# crawler -> hold_time(request, now): seconds the request must still wait
+_hold_times: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def set_hold_time(crawler, hold_time: Callable[[Request, float], float]):
+    """Register the crawler's hold_time(request, now) for HoldingScheduler."""
+    _hold_times[crawler] = hold_time
+
+
+class HoldingScheduler(Scheduler):
+    """
+    Scheduler that parks requests with a pending hold until it ends. Parked
+    requests count as pending, so the spider stays open, and with JOBDIR
+    they are written back to the disk queue on close.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (monotonic release time, tie-breaker, request)
+        self.parked: list = []
+        self._order = itertools.count()
+
+    def next_request(self) -> Optional[Request]:
+        now = time.monotonic()
+        while self.parked and self.parked[0][0] <= now:
+            _, _, request = heapq.heappop(self.parked)
+            if not self._park(request, now):
+                return request
+        while (request := super().next_request()) is not None:
+            if not self._park(request, now):
+                return request
+        return None
+
+    def _park(self, request: Request, now: float) -> bool:
+        hold_time = _hold_times.get(self.crawler)
+        wait = hold_time(request, time.time()) if hold_time else 0.0
+        if wait <= 0:
+            return False
+        heapq.heappush(self.parked, (now + wait, next(self._order), request))
+        self.stats.inc_value("scheduler/held")
+        return True
+
+    def close(self, reason: str):
+        if self.dqs is not None:
+            for _, _, request in self.parked:
+                self._dqpush(request)
+        self.parked.clear()
+        return super().close(reason)
+
+    def __len__(self) -> int:
+        return super().__len__() + len(self.parked)
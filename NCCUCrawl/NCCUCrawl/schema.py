@@ -0,0 +1,536 @@
+import hashlib
+import re
+import sqlite3
+import unicodedata
+
+# column definitions per table; migration 1 creates them, rebuilds reuse them
+TABLES = {
+    "teacher": """
+        id TEXT PRIMARY KEY,
+        name TEXT,
+        name_en TEXT,
+        department TEXT,
+        first_appear TEXT
+    """,
+    "course": """
+        id TEXT PRIMARY KEY,
+        year TEXT,
+        semester TEXT,
+        sub_num TEXT,
+        name TEXT,
+        name_en TEXT,
+        teacher_id TEXT REFERENCES teacher(id),
+        kind INTEGER,
+        time TEXT,
+        lang TEXT,
+        lang_en TEXT,
+        sem_qty INTEGER,
+        sem_qty_en TEXT,
+        classroom_id TEXT,
+        unit TEXT,
+        unit_en TEXT,
+        college TEXT,
+        degree TEXT,
+        department TEXT,
+        credit REAL,
+        transition_type TEXT,
+        transition_type_en TEXT,
+        info TEXT,
+        info_en TEXT,
+        note TEXT,
+        note_en TEXT,
+        syllabus TEXT,
+        syllabus_en TEXT,
+        objective TEXT,
+        objective_en TEXT,
+        core BOOLEAN,
+        discipline TEXT,
+        last_enroll INTEGER,
+        student_limit INTEGER,
+        student_count INTEGER
+    """,
+    "course_remain": """
+        course_id TEXT PRIMARY KEY REFERENCES course(id),
+        signable BOOLEAN,
+        waiting_count INTEGER,
+        origin_maximum INTEGER,
+        origin_registered INTEGER,
+        origin_remained INTEGER,
+        all_maximum INTEGER,
+        all_registered INTEGER,
+        all_remained INTEGER,
+        other_dept_maximum INTEGER,
+        other_dept_registered INTEGER,
+        other_dept_remained INTEGER,
+        same_grade_maximum INTEGER,
+        same_grade_registered INTEGER,
+        same_grade_remained INTEGER,
+        diff_grade_maximum INTEGER,
+        diff_grade_registered INTEGER,
+        diff_grade_remained INTEGER,
+        minor_maximum INTEGER,
+        minor_registered INTEGER,
+        minor_remained INTEGER,
+        double_major_maximum INTEGER,
+        double_major_registered INTEGER,
+        double_major_remained INTEGER,
+        other_dept_in_college_maximum INTEGER,
+        other_dept_in_college_registered INTEGER,
+        other_dept_in_college_remained INTEGER,
+        other_college_maximum INTEGER,
+        other_college_registered INTEGER,
+        other_college_remained INTEGER,
+        program_maximum INTEGER,
+        program_registered INTEGER,
+        program_remained INTEGER,
+        same_grade_and_above_maximum INTEGER,
+        same_grade_and_above_registered INTEGER,
+        same_grade_and_above_remained INTEGER,
+        lower_grade_maximum INTEGER,
+        lower_grade_registered INTEGER,
+        lower_grade_remained INTEGER,
+        other_program_maximum INTEGER,
+        other_program_registered INTEGER,
+        other_program_remained INTEGER
+    """,
+    # id = rate_key(course_id, teacher_id, content); the text lives once in
+    # rate_content however many courses / semesters repeat it
+    "rate": """
+        id TEXT PRIMARY KEY,
+        course_id TEXT REFERENCES course(id),
+        teacher_id TEXT REFERENCES teacher(id),
+        content_hash TEXT REFERENCES rate_content(hash)
+    """,
+    "rate_content": """
+        hash TEXT PRIMARY KEY,
+        content TEXT,
+        content_en TEXT
+    """,
+    "course_legacy": """
+        id TEXT PRIMARY KEY,
+        y TEXT,
+        s TEXT,
+        subNum TEXT,
+        name TEXT,
+        nameEn TEXT,
+        teacher TEXT,
+        teacherEn TEXT,
+        kind INTEGER,
+        time TEXT,
+        timeEn TEXT,
+        lmtKind TEXT,
+        lmtKindEn TEXT,
+        core BOOLEAN,
+        lang TEXT,
+        langEn TEXT,
+        semQty TEXT,
+        classroom TEXT,
+        classroomId TEXT,
+        unit TEXT,
+        unitEn TEXT,
+        dp1 TEXT,
+        dp2 TEXT,
+        dp3 TEXT,
+        point REAL,
+        subRemainUrl TEXT,
+        subSetUrl TEXT,
+        subUnitRuleUrl TEXT,
+        teaExpUrl TEXT,
+        teaSchmUrl TEXT,
+        tranTpe TEXT,
+        tranTpeEn TEXT,
+        info TEXT,
+        infoEn TEXT,
+        note TEXT,
+        noteEn TEXT,
+        syllabus TEXT,
+        objective TEXT
+    """,
+    "teacher_legacy": """
+        id TEXT PRIMARY KEY,
+        name TEXT
+    """,
+    "rate_legacy": """
+        courseId TEXT,
+        rowId TEXT,
+        teacherId TEXT,
+        content TEXT,
+        contentEn TEXT,
+        PRIMARY KEY (courseId, rowId)
+    """,
+    "result": """
+        courseId TEXT PRIMARY KEY,
+        yearsem TEXT,
+        name TEXT,
+        teacher TEXT,
+        time TEXT,
+        studentLimit INTEGER,
+        studentCount INTEGER,
+        lastEnroll INTEGER
+    """,
+    "remain_legacy": """
+        id TEXT PRIMARY KEY,
+        signableAdding BOOLEAN,
+        waitingList INTEGER,
+        originLimit INTEGER,
+        originRegistered INTEGER,
+        originAvailable INTEGER,
+        allLimit INTEGER,
+        allRegistered INTEGER,
+        allAvailable INTEGER,
+        otherDeptLimit INTEGER,
+        otherDeptRegistered INTEGER,
+        otherDeptAvailable INTEGER,
+        sameGradeLimit INTEGER,
+        sameGradeRegistered INTEGER,
+        sameGradeAvailable INTEGER,
+        diffGradeLimit INTEGER,
+        diffGradeRegistered INTEGER,
+        diffGradeAvailable INTEGER,
+        minorLimit INTEGER,
+        minorRegistered INTEGER,
+        minorAvailable INTEGER,
+        doubleMajorLimit INTEGER,
+        doubleMajorRegistered INTEGER,
+        doubleMajorAvailable INTEGER,
+        otherDeptInCollegeLimit INTEGER,
+        otherDeptInCollegeRegistered INTEGER,
+        otherDeptInCollegeAvailable INTEGER,
+        otherCollegeLimit INTEGER,
+        otherCollegeRegistered INTEGER,
+        otherCollegeAvailable INTEGER,
+        programLimit INTEGER,
+        programRegistered INTEGER,
+        programAvailable INTEGER,
+        sameGradeAndAboveLimit INTEGER,
+        sameGradeAndAboveRegistered INTEGER,
+        sameGradeAndAboveAvailable INTEGER,
+        lowerGradeLimit INTEGER,
+        lowerGradeRegistered INTEGER,
+        lowerGradeAvailable INTEGER,
+        otherProgramLimit INTEGER,
+        otherProgramRegistered INTEGER,
+        otherProgramAvailable INTEGER
+    """,
+}
+
+
+def add_column(conn: sqlite3.Connection, table: str, column: str, decl: str) -> bool:
+    """Online column addition (ALTER TABLE ADD COLUMN); no-op if it already exists."""
+    if column in table_columns(conn, table):
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+    return True
+
+
+def rebuild_table(conn: sqlite3.Connection, table: str, keep_rowid: bool = True):
+    """
+    Recreate `table` from TABLES[table] and copy the shared columns over.
+
+    Used for changes ALTER TABLE cannot do (column types, constraints).
+    Row ids are kept so course_fts stays valid; indexes and triggers are
+    dropped with the old table and recreated by ensure_indexes and
+    ensure_course_fts.
+    """
+    new_table = f"{table}__new"
+    conn.execute(f"DROP TABLE IF EXISTS {new_table}")
+    conn.execute(f"CREATE TABLE {new_table} ({TABLES[table]})")
+
+    shared = [
+        c for c in table_columns(conn, new_table) if c in table_columns(conn, table)
+    ]
+    columns = ", ".join(shared)
+    if keep_rowid:
+        conn.execute(
+            f"INSERT INTO {new_table} (rowid, {columns}) SELECT rowid, {columns} FROM {table}"
+        )
+    else:
+        conn.execute(
+            f"INSERT INTO {new_table} ({columns}) SELECT {columns} FROM {table}"
+        )
+
+    conn.execute(f"DROP TABLE {table}")
+    conn.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> dict:
+    """Column name -> declared type."""
+    return {row[1]: row[2] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _create_baseline(conn):
+    for name, columns in TABLES.items():
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns})")
+
+
+def _course_typed_columns(conn):
+    # databases created before the ETL registry declared these as TEXT/INTEGER
+    declared = table_columns(conn, "course")
+    if (declared.get("credit"), declared.get("kind"), declared.get("sem_qty")) != (
+        "REAL",
+        "INTEGER",
+        "INTEGER",
+    ):
+        rebuild_table(conn, "course")
+
+
+# Requests given up on by NccucrawlDownloaderMiddleware, kept for replay.
+# Crawl bookkeeping rather than crawled data, so not part of TABLES.
+DEAD_LETTER_TABLE = """
+    id INTEGER PRIMARY KEY,
+    spider TEXT,
+    url TEXT,
+    reason TEXT,
+    attempts INTEGER,
+    request TEXT,
+    body BLOB,
+    failed_at TEXT DEFAULT CURRENT_TIMESTAMP
+"""
+
+
+def _create_dead_letter(conn):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS dead_letter ({DEAD_LETTER_TABLE})")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_dead_letter_spider ON dead_letter (spider)"
+    )
+
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_rate_content(content) -> str:
+    """NFKC, collapsed whitespace: the form rate comments are hashed and stored in."""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", content or "")).strip()
+
+
+def _digest(*parts: str) -> str:
+    return hashlib.blake2b(
+        "\x1f".join(parts).encode("utf-8"), digest_size=16
+    ).hexdigest()
+
+
+def rate_key(course_id, teacher_id, content) -> str:
+    """Natural key of one rate comment: hash of (course, teacher, normalized text)."""
+    return _digest(
+        str(course_id or ""), str(teacher_id or ""), normalize_rate_content(content)
+    )
+
+
+def rate_rows(course_id, teacher_id, content, content_en=None):
+    """The (rate_content, rate) rows one comment is stored as."""
+    text = normalize_rate_content(content)
+    content_hash = _digest(text)
+    return (
+        {
+            "hash": content_hash,
+            "content": text,
+            "content_en": normalize_rate_content(content_en) or None,
+        },
+        {
+            "id": rate_key(course_id, teacher_id, text),
+            "course_id": course_id,
+            "teacher_id": teacher_id,
+            "content_hash": content_hash,
+        },
+    )
+
+
+def _content_addressed_rates(conn):
+    # rate had no key and INSERT OR IGNORE, so re-crawls appended duplicates
+    conn.execute(f"CREATE TABLE IF NOT EXISTS rate_content ({TABLES['rate_content']})")
+    if "id" not in table_columns(conn, "rate"):
+        rows = conn.execute(
+            "SELECT course_id, teacher_id, content, content_en FROM rate"
+        ).fetchall()
+        conn.execute("DROP TABLE rate")
+        conn.execute(f"CREATE TABLE rate ({TABLES['rate']})")
+        for row in rows:
+            content, rate = rate_rows(*row)
+            conn.execute(
+                "INSERT OR IGNORE INTO rate_content (hash, content, content_en)"
+                " VALUES (:hash, :content, :content_en)",
+                content,
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO rate (id, course_id, teacher_id, content_hash)"
+                " VALUES (:id, :course_id, :teacher_id, :content_hash)",
+                rate,
+            )
+
+    # rate_legacy rowIds were row positions, which shift with the page order
+    rows = conn.execute(
+        "SELECT courseId, rowId, teacherId, content, contentEn FROM rate_legacy"
+        " WHERE length(rowId) != 32"
+    ).fetchall()
+    for course_id, row_id, teacher_id, content, content_en in rows:
+        conn.execute(
+            "DELETE FROM rate_legacy WHERE courseId = ? AND rowId = ?",
+            (course_id, row_id),
+        )
+        conn.execute(
+            "INSERT OR IGNORE INTO rate_legacy"
+            " (courseId, rowId, teacherId, content, contentEn) VALUES (?, ?, ?, ?, ?)",
+            (
+                course_id,
+                rate_key(course_id, teacher_id, content),
+                teacher_id,
+                content,
+                content_en,
+            ),
+        )
+
+
+# Ordered (version, name, step) list; append new steps, never edit applied ones.
+MIGRATIONS = [
+    (1, "baseline tables", _create_baseline),
+    (2, "course typed numeric columns", _course_typed_columns),
+    (3, "dead letter queue", _create_dead_letter),
+    (4, "content-addressed rates", _content_addressed_rates),
+]
+
+
+def migrate(conn: sqlite3.Connection) -> list:
+    """Apply pending MIGRATIONS, each in its own transaction; returns applied versions."""
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TEXT DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    conn.commit()
+    (current,) = conn.execute(
+        "SELECT COALESCE(MAX(version), 0) FROM schema_version"
+    ).fetchone()
+
+    applied = []
+    for version, name, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            step(conn)
+            conn.execute(
+                "INSERT INTO schema_version (version, name) VALUES (?, ?)",
+                (version, name),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+# Secondary indexes for the common access paths; the trailing columns make
+# the usual list queries (by term / department / teacher) covering.
+INDEXES = {
+    "idx_course_year_sem": "course (year, semester, department, sub_num)",
+    "idx_course_teacher": "course (teacher_id, year, semester)",
+    "idx_course_department": "course (department, year, semester)",
+    "idx_course_college": "course (college, year, semester)",
+    "idx_course_sub_num": "course (sub_num)",
+    "idx_course_remain_all": "course_remain (all_remained, course_id)",
+    "idx_rate_course": "rate (course_id, teacher_id)",
+    "idx_rate_teacher": "rate (teacher_id)",
+    "idx_course_legacy_sub_num": "course_legacy (subNum)",
+    "idx_course_legacy_term": "course_legacy (y, s)",
+    "idx_rate_legacy_teacher": "rate_legacy (teacherId)",
+}
+
+
+def apply_pragmas(
+    conn: sqlite3.Connection,
+    mmap_size: int = 268435456,
+    cache_size: int = -65536,
+):
+    """Connection tuning: WAL, memory-mapped reads, a larger page cache and in-memory temp tables."""
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    conn.execute(f"PRAGMA cache_size = {int(cache_size)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def ensure_indexes(conn: sqlite3.Connection) -> list:
+    """Create missing indexes and refresh planner statistics when anything changed."""
+    existing = {
+        row[0]
+        for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    }
+    created = []
+    for name, target in INDEXES.items():
+        if name not in existing:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+            created.append(name)
+
+    if created:
+        conn.execute("ANALYZE")
+    conn.commit()
+    return created
+
+
+# Full-text index over the searchable course text. External content keeps
+# the text stored once (in course); the triggers keep it in sync with every
+# insert/upsert/delete. trigram makes Chinese substrings of 3+ characters
+# match without a word segmenter.
+COURSE_FTS_COLUMNS = [
+    "name",
+    "name_en",
+    "info",
+    "info_en",
+    "syllabus",
+    "objective",
+    "objective_en",
+]
+
+
+def ensure_course_fts(conn: sqlite3.Connection) -> bool:
+    """Create course_fts and its sync triggers; returns True when newly built."""
+    existing = {
+        row[0]
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE name LIKE 'course_fts%'"
+        )
+    }
+    if {"course_fts", "course_fts_ai", "course_fts_ad", "course_fts_au"} <= existing:
+        return False
+
+    columns = ", ".join(COURSE_FTS_COLUMNS)
+    new_values = ", ".join(f"new.{c}" for c in COURSE_FTS_COLUMNS)
+    old_values = ", ".join(f"old.{c}" for c in COURSE_FTS_COLUMNS)
+
+    # a course rebuild drops the triggers; recreate everything from scratch
+    for trigger in ("course_fts_ai", "course_fts_ad", "course_fts_au"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.execute("DROP TABLE IF EXISTS course_fts")
+    conn.execute(f"""
+    CREATE VIRTUAL TABLE course_fts USING fts5(
+        {columns},
+        content = 'course',
+        content_rowid = 'rowid',
+        tokenize = 'trigram'
+    )
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER course_fts_ai AFTER INSERT ON course BEGIN
+        INSERT INTO course_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER course_fts_ad AFTER DELETE ON course BEGIN
+        INSERT INTO course_fts (course_fts, rowid, {columns})
+        VALUES ('delete', old.rowid, {old_values});
+    END
+    """)
+    conn.execute(f"""
+    CREATE TRIGGER course_fts_au AFTER UPDATE OF {columns} ON course BEGIN
+        INSERT INTO course_fts (course_fts, rowid, {columns})
+        VALUES ('delete', old.rowid, {old_values});
+        INSERT INTO course_fts (rowid, {columns}) VALUES (new.rowid, {new_values});
+    END
+    """)
+    # index whatever the table already holds
+    conn.execute("INSERT INTO course_fts (course_fts) VALUES ('rebuild')")
+    conn.commit()
+    return True
@@ -0,0 +1,78 @@
+"""
+Ranked full-text course search over the course_fts index.
+
+    python3 -m NCCUCrawl.search 統計學 --limit 10
+"""
+
+import argparse
+import sqlite3
+from typing import List
+
+from scrapy.utils.project import get_project_settings
+
+from NCCUCrawl.database import resolve_db_path
+from NCCUCrawl.schema import COURSE_FTS_COLUMNS
+
+# bm25 weights in COURSE_FTS_COLUMNS order: names first, then objectives
+BM25_WEIGHTS = (10.0, 10.0, 2.0, 2.0, 1.0, 3.0, 3.0)
+
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_courses(conn: sqlite3.Connection, query: str, limit: int = 20) -> List[str]:
+    """
+    Return course ids ranked by bm25 for every whitespace-separated term.
+
+    The trigram tokenizer only indexes terms of 3+ characters, so shorter
+    terms (two-character Chinese words) are matched with LIKE against the
+    rows the longer terms already selected, or against the whole index if
+    the query has no long term.
+    """
+    terms = query.split()
+    if not terms:
+        return []
+    long_terms = [t for t in terms if len(t) >= 3]
+    short_terms = [t for t in terms if len(t) < 3]
+
+    where = []
+    params: list = []
+    if long_terms:
+        where.append("course_fts MATCH ?")
+        params.append(" AND ".join(_phrase(t) for t in long_terms))
+    for term in short_terms:
+        where.append(
+            "("
+            + " OR ".join(f"course_fts.{c} LIKE ?" for c in COURSE_FTS_COLUMNS)
+            + ")"
+        )
+        params.extend([f"%{term}%"] * len(COURSE_FTS_COLUMNS))
+
+    order = (
+        f"bm25(course_fts, {', '.join(map(str, BM25_WEIGHTS))})"
+        if long_terms
+        else "course.id DESC"
+    )
+    sql = f"""
+    SELECT course.id FROM course_fts
+    JOIN course ON course.rowid = course_fts.rowid
+    WHERE {" AND ".join(where)}
+    ORDER BY {order}
+    LIMIT ?
+    """
+    params.append(limit)
+    return [row[0] for row in conn.execute(sql, params)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search crawled courses")
+    parser.add_argument("query", nargs="+")
+    parser.add_argument("--db", default=resolve_db_path(get_project_settings()))
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f"file:{args.db}?mode=ro", uri=True)
+    for course_id in search_courses(conn, " ".join(args.query), args.limit):
+        print(course_id)
+    conn.close()
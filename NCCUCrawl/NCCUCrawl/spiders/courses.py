@@ -1,6 +1,9 @@
 import json
 import scrapy
+from NCCUCrawl.config import get_config
+from NCCUCrawl.feeder import RequestFeeder, semester_priorities, shard_slice
 from NCCUCrawl.items import CourseItem
+from NCCUCrawl.parsing import extract_syllabus_summary, get_parse_offload
 
 
 class CoursesSpider(scrapy.Spider):
@@ -12,10 +15,16 @@ class CoursesSpider(scrapy.Spider):
     def start_requests(self):
         # 先抓 unit.json
         yield scrapy.Request(
-            url="https://qrysub.nccu.edu.tw/assets/api/unit.json",
+            url=get_config(self.settings).UNIT_API,
             callback=self.parse_units,
+            # re-parsed on a JOBDIR resume so the list feed can restart
+            dont_filter=True,
         )
 
+    async def start(self):
+        for req in self.start_requests():
+            yield req
+
     def parse_units(self, response):
         """Parse the unit.json to create a mapping of unit codes"""
         units = json.loads(response.text)
@@ -48,16 +57,30 @@ class CoursesSpider(scrapy.Spider):
                                     if " / " in l3["utL3Text"]
                                     else "",
                                 }
-        categories = self.get_categories(units)
+        categories = shard_slice(
+            self.get_categories(units), getattr(self, "shard", None)
+        )
         semesters = self.get_semesters()
 
-        for sem in semesters:
+        # handed out lazily, COURSE_LIST_QUEUE_SIZE at a time
+        self.list_feeder = RequestFeeder(
+            self.crawler,
+            self.iter_list_requests(semesters, categories),
+            self.settings.getint("COURSE_LIST_QUEUE_SIZE", 32),
+            depth=response.meta.get("depth", 0) + 1,
+        )
+        yield from self.list_feeder.start()
+
+    def iter_list_requests(self, semesters, categories):
+        """Current term first; each semester's lists carry its priority"""
+        for sem, priority in semester_priorities(semesters):
             for dp1, dp2, dp3 in categories:
                 url = self.build_course_list_url(sem, dp1, dp2, dp3)
                 yield scrapy.Request(
                     url=url,
                     callback=self.parse_course_list,
                     cb_kwargs={"semester": sem, "dp1": dp1, "dp2": dp2, "dp3": dp3},
+                    priority=priority,
                 )
 
     def get_categories(self, units):
@@ -83,41 +106,11 @@ class CoursesSpider(scrapy.Spider):
         return categories
 
     def get_semesters(self):
-        return [
-            "1011",
-            "1012",
-            "1021",
-            "1022",
-            "1031",
-            "1032",
-            "1041",
-            "1042",
-            "1051",
-            "1052",
-            "1061",
-            "1062",
-            "1071",
-            "1072",
-            "1081",
-            "1082",
-            "1091",
-            "1092",
-            "1101",
-            "1102",
-            "1111",
-            "1112",
-            "1121",
-            "1122",
-            "1131",
-            "1132",
-            "1141",
-        ]
+        # config.toml [general] first_semester .. year+sem, or NCCU_SEMESTERS
+        return list(get_config(self.settings).SEMESTERS)
 
     def build_course_list_url(self, sem, dp1, dp2, dp3):
-        return (
-            "https://es.nccu.edu.tw/course/zh-TW/"
-            f":sem={sem}%20:dp1={dp1}%20:dp2={dp2}%20:dp3={dp3}"  # ex: https://es.nccu.edu.tw/course/zh-TW/:sem=1131%20:dp1=01%20:dp2=A1%20:dp3=105%20/
-        )
+        return get_config(self.settings).course_list_url(sem, dp1, dp2, dp3)
 
     def process_course_item(self, item, course_data):
         yield item
@@ -174,29 +167,39 @@ class CoursesSpider(scrapy.Spider):
             if c.get("teaSchmUrl"):
                 yield scrapy.Request(
                     url=c["teaSchmUrl"],
-                    callback=self.parse_syllabus,
+                    callback=self.syllabus_callback,
                     meta={"item": item, "course_data": c},
                 )
             else:
                 yield from self.process_course_item(item, c)
 
+    @property
+    def syllabus_callback(self):
+        """parse_syllabus, or its process-pool variant with PARSE_OFFLOAD_ENABLED"""
+        if get_parse_offload(getattr(self, "crawler", None)).enabled:
+            return self.parse_syllabus_offloaded
+        return self.parse_syllabus
+
     def parse_syllabus(self, response):
         """Parse syllabus page - can be extended by subclasses"""
+        fields = extract_syllabus_summary(
+            response.body, response.url, response.encoding
+        )
+        yield from self.syllabus_item(response, fields)
+
+    async def parse_syllabus_offloaded(self, response):
+        offload = get_parse_offload(self.crawler)
+        fields = await offload.run(extract_syllabus_summary, response)
+        for output in self.syllabus_item(response, fields):
+            yield output
+
+    def syllabus_item(self, response, fields):
         item = response.meta["item"]
         course_data = response.meta.get("course_data", {})
 
-        # Fetch course name in English
-        name_en = response.css("#CourseNameEn::text").get()
-        if name_en:
-            item["name_en"] = name_en.strip()
-
-        # Fetch course objective
-        objective_all = response.css(
-            "body > div.container.sylview-section > div > div > div > p::text"
-        ).getall()
-        if objective_all:
-            item["objective"] = " ".join(
-                [text.strip() for text in objective_all if text.strip()]
-            )
+        # English course name and objective, when the page has them
+        for key in ("name_en", "objective"):
+            if key in fields:
+                item[key] = fields[key]
 
         yield from self.process_course_item(item, course_data)
@@ -1,6 +1,9 @@
 import json
 import scrapy
+from NCCUCrawl.config import get_config
+from NCCUCrawl.feeder import RequestFeeder, semester_priorities, shard_slice
 from NCCUCrawl.items import CourseLegacyItem
+from NCCUCrawl.parsing import extract_syllabus, get_parse_offload
 
 
 class CoursesLegacySpider(scrapy.Spider):
@@ -12,10 +15,16 @@ class CoursesLegacySpider(scrapy.Spider):
     def start_requests(self):
         # 先抓 unit.json
         yield scrapy.Request(
-            url="https://qrysub.nccu.edu.tw/assets/api/unit.json",
+            url=get_config(self.settings).UNIT_API,
             callback=self.parse_units,
+            # re-parsed on a JOBDIR resume so the list feed can restart
+            dont_filter=True,
         )
 
+    async def start(self):
+        for req in self.start_requests():
+            yield req
+
     def parse_units(self, response):
         """Parse the unit.json to create a mapping of unit codes"""
         units = json.loads(response.text)
@@ -48,16 +57,30 @@ class CoursesLegacySpider(scrapy.Spider):
                                     if " / " in l3["utL3Text"]
                                     else "",
                                 }
-        categories = self.get_categories(units)
+        categories = shard_slice(
+            self.get_categories(units), getattr(self, "shard", None)
+        )
         semesters = self.get_semesters()
 
-        for sem in semesters:
+        # handed out lazily, COURSE_LIST_QUEUE_SIZE at a time
+        self.list_feeder = RequestFeeder(
+            self.crawler,
+            self.iter_list_requests(semesters, categories),
+            self.settings.getint("COURSE_LIST_QUEUE_SIZE", 32),
+            depth=response.meta.get("depth", 0) + 1,
+        )
+        yield from self.list_feeder.start()
+
+    def iter_list_requests(self, semesters, categories):
+        """Current term first; each semester's lists carry its priority"""
+        for sem, priority in semester_priorities(semesters):
             for dp1, dp2, dp3 in categories:
                 url = self.build_course_list(sem, dp1, dp2, dp3)
                 yield scrapy.Request(
                     url=url,
                     callback=self.parse_course_list,
                     cb_kwargs={"semester": sem, "dp1": dp1, "dp2": dp2, "dp3": dp3},
+                    priority=priority,
                 )
 
     def get_categories(self, units):
@@ -83,22 +106,21 @@ class CoursesLegacySpider(scrapy.Spider):
         return categories
 
     def get_semesters(self):
-        return [
-            "1141",
-        ]
+        # the current term, or NCCU_SEMESTERS (set by NCCUCrawl.launcher)
+        config = get_config(self.settings)
+        if self.settings.get("NCCU_SEMESTERS"):
+            return list(config.SEMESTERS)
+        return [config.YEAR_SEM]
 
     # also available at https://es.nccu.edu.tw/course/zh-TW/{id}/
     def build_course_list(self, sem, dp1, dp2, dp3):
-        return (
-            "https://es.nccu.edu.tw/course/zh-TW/"
-            f":sem={sem}%20:dp1={dp1}%20:dp2={dp2}%20:dp3={dp3}"  # ex: https://es.nccu.edu.tw/course/zh-TW/:sem=1131%20:dp1=01%20:dp2=A1%20:dp3=105%20/
-        )
+        return get_config(self.settings).course_list_url(sem, dp1, dp2, dp3)
 
     def build_course_detail_url_zh(self, course_id):
-        return f"http://es.nccu.edu.tw/course/zh-TW/{course_id}/"
+        return get_config(self.settings).course_detail_url(course_id, "zh-TW")
 
     def build_course_detail_url_en(self, course_id):
-        return f"http://es.nccu.edu.tw/course/en/{course_id}/"
+        return get_config(self.settings).course_detail_url(course_id, "en")
 
     def process_course_item(self, item, course_data):
         yield item
@@ -155,6 +177,8 @@ class CoursesLegacySpider(scrapy.Spider):
             item = self.create_course_item(c, semester, unit_info, dp1, dp2, dp3)
             course_id = f"{semester}{c['subNum']}"
 
+            # a course listed under several units is fetched once, so its
+            # course_legacy row keeps the first unit it was listed under
             zh_url = self.build_course_detail_url_zh(course_id)
             yield scrapy.Request(
                 url=zh_url,
@@ -168,7 +192,6 @@ class CoursesLegacySpider(scrapy.Spider):
                     "dp2": dp2,
                     "dp3": dp3,
                 },
-                dont_filter=True,
             )
 
     def convert_kind_to_int(self, kind_str, lmt_kind_str=""):
@@ -238,60 +261,37 @@ class CoursesLegacySpider(scrapy.Spider):
         if course_data.get("teaSchmUrl"):
             yield scrapy.Request(
                 url=course_data["teaSchmUrl"],
-                callback=self.parse_syllabus,
+                callback=self.syllabus_callback,
                 meta={"item": item, "course_data": course_data},
             )
         else:
             yield from self.process_course_item(item, course_data)
 
+    @property
+    def syllabus_callback(self):
+        """parse_syllabus, or its process-pool variant with PARSE_OFFLOAD_ENABLED"""
+        if get_parse_offload(getattr(self, "crawler", None)).enabled:
+            return self.parse_syllabus_offloaded
+        return self.parse_syllabus
+
     def parse_syllabus(self, response):
         """Parse syllabus page - can be extended by subclasses"""
+        fields = extract_syllabus(response.body, response.url, response.encoding)
+        yield from self.syllabus_item(response, fields)
+
+    async def parse_syllabus_offloaded(self, response):
+        offload = get_parse_offload(self.crawler)
+        fields = await offload.run(extract_syllabus, response)
+        for output in self.syllabus_item(response, fields):
+            yield output
+
+    def syllabus_item(self, response, fields):
         item = response.meta["item"]
         course_data = response.meta.get("course_data", {})
 
-        # Fetch course objective
-        objective_elements = response.css(
-            "body > div.container.sylview-section > div > div > div > p::text"
-        ).getall()
-        if objective_elements:
-            item["objective"] = " ".join(
-                [text.strip() for text in objective_elements if text.strip()]
-            )
-
-        description_title = response.css(
-            "div.col-sm-7.sylview--mtop.col-p-6 h2.text-primary"
-        )
-        if description_title:
-            descriptions = []
-            # Get all siblings after the h2 title
-            siblings = description_title.xpath("following-sibling::*")
-
-            for sibling in siblings:
-                # Check if we hit the stop condition (row sylview-mtop fa-border class)
-                classes = sibling.css("::attr(class)").get()
-                if classes and set(["row", "sylview-mtop", "fa-border"]).issubset(
-                    set(classes.split())
-                ):
-                    break
-
-                # Extract text content and split by newlines
-                text_content = sibling.css("::text").getall()
-                for text in text_content:
-                    lines = [
-                        line.strip()
-                        for line in text.split("\n")
-                        if line.strip() and line.strip() != " "
-                    ]
-                    descriptions.extend(lines)
-
-            if descriptions:
-                item["syllabus"] = "\n".join(descriptions)
-            else:
-                item["syllabus"] = response.url
-        else:
-            # Fallback to just storing the URL if structure is different
-            syllabus_content = response.css(".sylview-section").get()
-            if syllabus_content:
-                item["syllabus"] = response.url
+        # objective, and the description text (or the page URL as fallback)
+        for key in ("objective", "syllabus"):
+            if key in fields:
+                item[key] = fields[key]
 
         yield from self.process_course_item(item, course_data)
@@ -5,6 +5,8 @@ from scrapy import signals
 import os
 import csv
 from typing import Set, Dict, List
+from scrapy.utils.project import get_project_settings
+from NCCUCrawl.database import resolve_db_path
 from NCCUCrawl.items import CourseLegacyItem
 from .courses_deprecated import CoursesLegacySpider
 
@@ -137,13 +139,24 @@ class DatabaseComparator:
 
 class SmartCoursesSpider(CoursesLegacySpider):
     name = "smart_courses"
+    # progress counters exported by MetricsExtension
+    metrics_attributes = (
+        "api_request_count",
+        "successful_detail_requests",
+        "failed_requests",
+        "redirect_count",
+        "total_saved_courses",
+        "total_missing_courses",
+    )
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         try:
             self.logger.info("Initializing database comparator...")
-            self.comparator = DatabaseComparator()
+            self.comparator = DatabaseComparator(
+                db_path=resolve_db_path(get_project_settings())
+            )
             self.logger.info(
                 f"Loaded {len(self.comparator.existing_courses)} existing courses"
             )
@@ -258,11 +271,10 @@ class SmartCoursesSpider(CoursesLegacySpider):
                         f"→ Requesting course detail: {course_id} from {zh_url}"
                     )
 
-                    # Add unique identifier to prevent dupefilter issues
-                    unique_url = f"{zh_url}?_spider_req={self.api_request_count}"
-
+                    # a course listed under several units is fetched once;
+                    # NCCURequestFingerprinter treats URL variants as one
                     yield scrapy.Request(
-                        url=unique_url,
+                        url=zh_url,
                         callback=self.parse_course_detail_zh,
                         meta={
                             "item": item,
@@ -274,7 +286,6 @@ class SmartCoursesSpider(CoursesLegacySpider):
                             "dp3": dp3,
                             "original_url": zh_url,  # Store the original URL
                         },
-                        dont_filter=True,
                         # Add error handling
                         errback=self.handle_request_error,
                     )
@@ -306,6 +317,9 @@ class SmartCoursesSpider(CoursesLegacySpider):
 
     def spider_idle(self):
         """當分類 API 處理完後，直接爬取剩餘的 missing courses"""
+        feeder = getattr(self, "list_feeder", None)
+        if feeder is not None and not feeder.exhausted:
+            return  # category lists still being fed
         if self.remaining_missing and self.api_request_count < self.api_limit:
             self.logger.info(
                 f"Starting direct crawl for {len(self.remaining_missing)} remaining courses"
@@ -367,7 +381,6 @@ class SmartCoursesSpider(CoursesLegacySpider):
                     objective="",
                 )
                 zh_url = self.build_course_detail_url_zh(course_id)
-                unique_url = f"{zh_url}?_direct_{self.api_request_count}"
                 self.logger.info(f"→ Direct crawl: {sub_num} ({course_id})")
 
                 course_data = {
@@ -375,8 +388,10 @@ class SmartCoursesSpider(CoursesLegacySpider):
                     "is_direct_crawl": True,  # 標記為直接爬取
                 }
 
+                # dont_filter: the list pass may have requested this URL
+                # already and lost the item
                 request = scrapy.Request(
-                    url=unique_url,
+                    url=zh_url,
                     callback=self.parse_course_detail_zh,
                     meta={
                         "item": item,
@@ -424,12 +439,6 @@ class SmartCoursesSpider(CoursesLegacySpider):
                     f"API limit reached, {len(self.remaining_missing)} courses remain"
                 )
 
-    def build_course_detail_url_zh(self, course_id):
-        return f"http://es.nccu.edu.tw/course/zh-TW/{course_id}/"
-
-    def build_course_detail_url_en(self, course_id):
-        return f"http://es.nccu.edu.tw/course/en/{course_id}/"
-
     def parse_course_detail_zh(self, response):
         """Override to add debugging and handle unique URLs"""
         item = response.meta["item"]
@@ -479,11 +488,8 @@ class SmartCoursesSpider(CoursesLegacySpider):
                 item["note"] = zh_course.get("note", item["note"])
 
             en_url = self.build_course_detail_url_en(course_id)
-            # Add unique identifier for English URL too
-            unique_en_url = f"{en_url}?_spider_req={self.api_request_count}_en"
-
             yield scrapy.Request(
-                url=unique_en_url,
+                url=en_url,
                 callback=self.parse_course_detail_en,
                 meta={**response.meta, "original_en_url": en_url},
                 dont_filter=True,
@@ -522,7 +528,7 @@ class SmartCoursesSpider(CoursesLegacySpider):
             if final_tea_schm_url:
                 yield scrapy.Request(
                     url=final_tea_schm_url,
-                    callback=self.parse_syllabus,
+                    callback=self.syllabus_callback,
                     meta={"item": item, "course_data": course_data},
                     dont_filter=True,
                 )
@@ -535,65 +541,13 @@ class SmartCoursesSpider(CoursesLegacySpider):
             if course_data.get("teaSchmUrl"):
                 yield scrapy.Request(
                     url=course_data["teaSchmUrl"],
-                    callback=self.parse_syllabus,
+                    callback=self.syllabus_callback,
                     meta={"item": item, "course_data": course_data},
                     dont_filter=True,
                 )
             else:
                 yield from self.process_course_item(item, course_data)
 
-    def parse_syllabus(self, response):
-        """Parse syllabus page - can be extended by subclasses"""
-        item = response.meta["item"]
-        course_data = response.meta.get("course_data", {})
-
-        # Fetch course objective
-        objective_elements = response.css(
-            "body > div.container.sylview-section > div > div > div > p::text"
-        ).getall()
-        if objective_elements:
-            item["objective"] = " ".join(
-                [text.strip() for text in objective_elements if text.strip()]
-            )
-
-        description_title = response.css(
-            "div.col-sm-7.sylview--mtop.col-p-6 h2.text-primary"
-        )
-        if description_title:
-            descriptions = []
-            # Get all siblings after the h2 title
-            siblings = description_title.xpath("following-sibling::*")
-
-            for sibling in siblings:
-                # Check if we hit the stop condition (row sylview-mtop fa-border class)
-                classes = sibling.css("::attr(class)").get()
-                if classes and set(["row", "sylview-mtop", "fa-border"]).issubset(
-                    set(classes.split())
-                ):
-                    break
-
-                # Extract text content and split by newlines
-                text_content = sibling.css("::text").getall()
-                for text in text_content:
-                    lines = [
-                        line.strip()
-                        for line in text.split("\n")
-                        if line.strip() and line.strip() != " "
-                    ]
-                    descriptions.extend(lines)
-
-            if descriptions:
-                item["syllabus"] = "\n".join(descriptions)
-            else:
-                item["syllabus"] = response.url
-        else:
-            # Fallback to just storing the URL if structure is different
-            syllabus_content = response.css(".sylview-section").get()
-            if syllabus_content:
-                item["syllabus"] = response.url
-
-        yield from self.process_course_item(item, course_data)
-
     def closed(self, reason):
         self.logger.info("=== Smart Courses Spider Statistics ===")
         self.logger.info(
@@ -1,33 +1,115 @@
+import sqlite3
+
 import scrapy
+from NCCUCrawl.config import get_config
+from NCCUCrawl.database import open_unified, resolve_db_path
 from NCCUCrawl.items import RateLegacyItem
+from NCCUCrawl.schema import rate_key
 
 
 class RateDeprecatedSpider(scrapy.Spider):
+    """
+    Rates per (teacher, semester) for the teachers in teacher / teacher_legacy.
+
+    Semesters default to config.toml [course_results] years; pairs that
+    already have rows in rate_legacy are skipped unless refresh is set.
+    Pages go through the HTTP cache with RFC2616 revalidation, so an
+    unchanged statistic.jsp or rate page costs one conditional request.
+
+        scrapy crawl rate_deprecated [-a semesters=1131,1132] [-a refresh=1]
+    """
+
     name = "rate_deprecated"
     custom_settings = {
         "DOWNLOAD_DELAY": 0.2,
+        "HTTPCACHE_ENABLED": True,
+        "HTTPCACHE_POLICY": "scrapy.extensions.httpcache.RFC2616Policy",
     }
 
+    def __init__(self, semesters=None, refresh=False, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.semesters = semesters
+        self.refresh = refresh not in (False, "", "0", "false", "False")
+
+    def get_semesters(self):
+        if self.semesters:
+            return [s.strip() for s in self.semesters.split(",") if s.strip()]
+        return list(get_config(self.settings).COURSERESULT_YEARSEM)
+
+    def crawled_pairs(self, conn):
+        """(teacherId, semester) pairs that already have rate_legacy rows"""
+        try:
+            rows = conn.execute(
+                "SELECT DISTINCT teacherId, substr(courseId, 1, 4) FROM rate_legacy"
+            )
+            return {
+                (str(teacher_id), semester) for teacher_id, semester in rows.fetchall()
+            }
+        except sqlite3.OperationalError:
+            return set()
+
+    def iter_teachers(self, conn, chunk=500):
+        """
+        Stream (id, name) from teacher and teacher_legacy, each id once.
+
+        Keyset pages of `chunk` rows, each fully fetched, so no read lock is
+        held on the database StoragePipeline is writing to in between.
+        """
+        seen = set()
+        for table in ("teacher", "teacher_legacy"):
+            last = ""
+            while True:
+                try:
+                    rows = conn.execute(
+                        f"SELECT id, name FROM {table} WHERE id > ?"
+                        " ORDER BY id LIMIT ?",
+                        (last, chunk),
+                    ).fetchall()
+                except sqlite3.OperationalError:
+                    break
+                if not rows:
+                    break
+                last = rows[-1][0]
+                for teacher_id, name in rows:
+                    if teacher_id and teacher_id not in seen:
+                        seen.add(teacher_id)
+                        yield str(teacher_id), name or ""
+
     def start_requests(self):
         """Load teacher data and start crawling"""
 
-        teacher_list = {}
+        config = get_config(self.settings)
+        semesters = self.get_semesters()
+        try:
+            conn = open_unified(resolve_db_path(self.settings))
+        except FileNotFoundError:
+            self.logger.error("No database found; run teacher_deprecated first")
+            return
 
-        all_semesters = ["1111", "1112"]
+        try:
+            done = set() if self.refresh else self.crawled_pairs(conn)
+            for teacher_id, teacher_name in self.iter_teachers(conn):
+                for semester in semesters:
+                    if (teacher_id, semester) in done:
+                        self.crawler.stats.inc_value("rate/skipped_pairs")
+                        continue
+                    statistic_url = config.teacher_url(teacher_id, semester)
+                    yield scrapy.Request(
+                        url=statistic_url,
+                        callback=self.parse_teacher_courses,
+                        meta={
+                            "teacher_id": teacher_id,
+                            "teacher_name": teacher_name,
+                            "semester": semester,
+                        },
+                        encoding="big5",
+                    )
+        finally:
+            conn.close()
 
-        for teacher_name, teacher_id in teacher_list.items():
-            for semester in all_semesters:
-                statistic_url = f"http://newdoc.nccu.edu.tw/teaschm/{semester}/statistic.jsp-tnum={teacher_id}.htm"
-                yield scrapy.Request(
-                    url=statistic_url,
-                    callback=self.parse_teacher_courses,
-                    meta={
-                        "teacher_id": teacher_id,
-                        "teacher_name": teacher_name,
-                        "semester": semester,
-                    },
-                    encoding="big5",
-                )
+    async def start(self):
+        for req in self.start_requests():
+            yield req
 
     def parse_teacher_courses(self, response):
         """Parse teacher's courses page to find available courses"""
@@ -65,7 +147,9 @@ class RateDeprecatedSpider(scrapy.Spider):
                         if len(course_id_parts) == 3:
                             course_id = "".join(course_id_parts)
 
-                            rate_url = f"http://newdoc.nccu.edu.tw/teaschm/{semester}/{last_td_link}"
+                            rate_url = get_config(self.settings).course_rate_url(
+                                last_td_link, semester
+                            )
 
                             yield scrapy.Request(
                                 url=rate_url,
@@ -90,14 +174,15 @@ class RateDeprecatedSpider(scrapy.Spider):
         if rates_table:
             rows = rates_table.css("tr")
 
-            for index, row in enumerate(rows):
+            for row in rows:
                 first_td = row.css("td::text").get()
                 if first_td:
                     rate_text = first_td.strip()
 
                     yield RateLegacyItem(
                         courseId=course_id,
-                        rowId=str(index),  # 使用 index 作為 rowId
+                        # content-derived, stable when the page order changes
+                        rowId=rate_key(course_id, teacher_id, rate_text),
                         teacherId=teacher_id,
                         content=rate_text,
                         contentEn="",
@@ -1,5 +1,9 @@
+import json
+
 import scrapy
+
 from NCCUCrawl.items import CourseRemainItem
+
 from .courses import CoursesSpider
 
 
@@ -33,18 +37,30 @@ class CourseRemainSpider(CoursesSpider):  # implement the course spider
         "餘額 / Number of Available Spaces": "remained",
     }
 
+    def parse_course_list(self, response, semester, dp1, dp2, dp3):
+        """
+        Remain-only plan: go straight from the course list payload to the
+        remain page. Unlike CoursesSpider this neither fetches the syllabus
+        nor builds a CourseItem, since neither is stored by a remain crawl.
+        """
+        for c in json.loads(response.text):
+            yield from self.remain_request(f"{semester}{c['subNum']}", c)
+
     def process_course_item(self, item, course_data):
-        """Override to add remain functionality"""
+        """Used only when CoursesSpider.parse_course_list drives the crawl"""
+        yield from self.remain_request(item["id"], course_data)
+
+    def remain_request(self, course_id, course_data):
         remain_url = course_data.get("subRemainUrl")
         if remain_url:
             yield scrapy.Request(
                 url=remain_url,
                 callback=self.parse_remain,
-                meta={"course_id": item["id"]},
+                meta={"course_id": course_id},
             )
         else:
             self.logger.warning(
-                f"No remain URL found for course {item['id']} - skipping remain data extraction."
+                f"No remain URL found for course {course_id} - skipping remain data extraction."
             )
 
     def parse_remain(self, response):
@@ -1,31 +1,78 @@
+import re
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import scrapy
 from dotenv import load_dotenv
+from NCCUCrawl.config import get_config
+from NCCUCrawl.database import open_unified, resolve_db_path
 from NCCUCrawl.items import TeacherLegacyItem
 from NCCUCrawl.user import User
 
 load_dotenv()
 
+# teacher id in statisticAll.jsp-tnum=<id>.htm and similar newdoc URLs
+TEACHER_ID_RE = re.compile(r"[-?&]tnum=([0-9A-Za-z]+)")
+# separators between names in teaNam of co-taught courses
+TEACHER_NAME_SEP_RE = re.compile(r"[、,，/;；]")
+
 
 class TeacherDeprecatedSpider(scrapy.Spider):
+    """
+    Teacher ids and names for YEAR_SEM.
+
+    mode="mine" (default) resolves teachers from data already crawled:
+    teacher_legacy names, and the teaExpUrl / teaSchmUrl of course_legacy
+    rows (tnum=<id>, or a set20.jsp list page fetched without auth). Only
+    the residue goes through course tracking, TEACHER_TRACK_WINDOW courses
+    at a time, and only tracks this spider added are deleted again.
+    mode="track" is the original delete-all / add-all / read / delete-all.
+
+        scrapy crawl teacher_deprecated [-a mode=track]
+    """
+
     name = "teacher_deprecated"
     custom_settings = {
         "DOWNLOAD_DELAY": 0.2,
     }
+    # exported by MetricsExtension
+    metrics_attributes = ("track_calls",)
 
-    def __init__(self):
-        super().__init__()
-        self.user = User()
+    def __init__(self, mode="mine", *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if mode not in ("mine", "track"):
+            raise ValueError(f"mode must be 'mine' or 'track', not {mode!r}")
+        self.mode = mode
+        self._user = None
         self.teacher_id_dict = {}
         self.courses_list = []
-        self.YEAR_SEM = "1141"
+        self.added_tracks = set()
+        self.track_calls = 0
+
+    @property
+    def user(self):
+        # authenticates on creation, which the mine mode may never need
+        if self._user is None:
+            self._user = User()
+        return self._user
+
+    @property
+    def YEAR_SEM(self):
+        return get_config(self.settings).YEAR_SEM
 
     def start_requests(self):
-        yield from self.start_teacher_process(response=None)
+        yield from self.start_discovery()
 
     async def start(self):
-        for req in self.start_teacher_process(response=None):
+        for req in self.start_discovery():
             yield req
 
+    def start_discovery(self):
+        if self.mode == "track":
+            yield from self.start_teacher_process(response=None)
+        else:
+            yield from self.mine_teachers()
+
     def start_teacher_process(self, response):
         # Ensure we have a valid auth token before hitting tracing APIs
         auth = getattr(self.user, "auth", None)
@@ -78,6 +125,172 @@ class TeacherDeprecatedSpider(scrapy.Spider):
         for course in updated_courses or []:
             yield from self.process_teacher_from_course(course)
 
+    def load_courses(self):
+        """course_legacy rows of YEAR_SEM plus the known teacher_legacy names"""
+        try:
+            conn = open_unified(resolve_db_path(self.settings))
+        except FileNotFoundError:
+            return [], {}
+        try:
+            conn.row_factory = sqlite3.Row
+            year_sem = self.YEAR_SEM
+            courses = conn.execute(
+                "SELECT subNum, teacher, teaExpUrl, teaSchmUrl FROM course_legacy"
+                " WHERE y = ? AND s = ?",
+                (year_sem[:-1], year_sem[-1:]),
+            ).fetchall()
+            known = {
+                row["name"]: row["id"]
+                for row in conn.execute("SELECT id, name FROM teacher_legacy")
+                if row["name"] and row["id"]
+            }
+        except sqlite3.OperationalError as e:
+            self.logger.error(f"Cannot read crawled courses: {e}")
+            return [], {}
+        finally:
+            conn.close()
+        return courses, known
+
+    def mine_teachers(self):
+        """Resolve teachers from crawled data, tracking only the residue"""
+        courses, known = self.load_courses()
+        if not courses:
+            self.logger.warning(
+                f"No course_legacy rows for {self.YEAR_SEM}; run courses_deprecated first"
+            )
+            return
+        self.teacher_id_dict.update(known)
+
+        residue, set20_urls = [], set()
+        for course in courses:
+            names = [
+                n.strip()
+                for n in TEACHER_NAME_SEP_RE.split(course["teacher"] or "")
+                if n.strip()
+            ]
+            if not names:
+                continue
+            if all(n in self.teacher_id_dict for n in names):
+                continue
+
+            urls = [course["teaExpUrl"] or "", course["teaSchmUrl"] or ""]
+            ids = {m for url in urls for m in TEACHER_ID_RE.findall(url)}
+            set20 = next((url for url in urls if "set20.jsp" in url), None)
+            if len(names) == 1 and len(ids) == 1:
+                teacher_id = ids.pop()
+                self.teacher_id_dict[names[0]] = teacher_id
+                self.crawler.stats.inc_value("teacher_discovery/mined")
+                yield TeacherLegacyItem(id=teacher_id, name=names[0])
+            elif set20:
+                set20_urls.add(set20)
+            else:
+                residue.append(str(course["subNum"]))
+
+        for url in sorted(set20_urls):
+            self.crawler.stats.inc_value("teacher_discovery/set20")
+            yield self.teacher_list_request(url, "")
+
+        residue = sorted(set(residue))
+        self.crawler.stats.set_value("teacher_discovery/courses", len(courses))
+        self.crawler.stats.set_value("teacher_discovery/residue", len(residue))
+        if residue:
+            yield from self.track_residue(residue)
+
+        # the track mode pre-deletes, adds and deletes every course and
+        # reads the track list three times
+        legacy_calls = 3 * len(courses) + 3
+        avoided = max(legacy_calls - self.track_calls, 0)
+        self.crawler.stats.set_value("teacher_discovery/track_calls", self.track_calls)
+        self.crawler.stats.set_value("teacher_discovery/track_calls_avoided", avoided)
+        self.logger.info(
+            f"Teacher discovery: {len(courses)} courses, {len(residue)} tracked,"
+            f" {self.track_calls} tracking calls ({avoided} avoided)"
+        )
+
+    def _track_call(self, method, *args):
+        self.track_calls += 1
+        return method(*args)
+
+    def track_residue(self, course_ids):
+        """
+        Add, read and delete tracks in windows of TEACHER_TRACK_WINDOW
+        courses. Adds and deletes run on TEACHER_TRACK_CONCURRENCY threads,
+        and a window's deletes overlap the next window's adds, so at most
+        two windows are tracked at once.
+        """
+        auth = getattr(self.user, "auth", None)
+        token = getattr(auth, "token", None)
+        if not token or str(token).upper() == "ERROR":
+            self.logger.error("Authentication unavailable; skipping tracking fallback")
+            return
+
+        window = max(self.settings.getint("TEACHER_TRACK_WINDOW", 20), 1)
+        workers = max(self.settings.getint("TEACHER_TRACK_CONCURRENCY", 4), 1)
+        try:
+            existing = self._track_call(self.user.get_track) or []
+        except Exception as e:
+            self.logger.error(f"Failed to fetch tracks: {e}")
+            return
+        # already tracked by the account owner: read, never added or deleted
+        preexisting = {str(course.get("subNum")) for course in existing}
+        for course in existing:
+            if str(course.get("subNum")) in course_ids:
+                yield from self.process_teacher_from_course(course)
+        course_ids = [c for c in course_ids if c not in preexisting]
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            deleting = []
+            for offset in range(0, len(course_ids), window):
+                batch = course_ids[offset : offset + window]
+                adds = {
+                    c: pool.submit(self._track_call, self.user.add_track, c)
+                    for c in batch
+                }
+                wait(list(adds.values()) + deleting)
+                deleting = []
+                for course_id, future in adds.items():
+                    if future.exception():
+                        self.logger.error(
+                            f"Error adding track {course_id}: {future.exception()}"
+                        )
+                    else:
+                        self.added_tracks.add(course_id)
+
+                try:
+                    tracks = self._track_call(self.user.get_track) or []
+                except Exception as e:
+                    self.logger.error(f"Failed to fetch updated tracks: {e}")
+                    tracks = []
+                for course in tracks:
+                    if str(course.get("subNum")) in adds:
+                        yield from self.process_teacher_from_course(course)
+
+                for course_id in batch:
+                    if course_id in self.added_tracks:
+                        deleting.append(
+                            pool.submit(self._delete_added_track, course_id)
+                        )
+            wait(deleting)
+
+    def _delete_added_track(self, course_id):
+        try:
+            self._track_call(self.user.delete_track, course_id)
+            self.added_tracks.discard(course_id)
+        except Exception as e:
+            self.logger.error(f"Error deleting track {course_id}: {e}")
+
+    def teacher_list_request(self, teacher_stat_url, teacher_name):
+        converted_url = teacher_stat_url.replace(
+            "newdoc.nccu.edu.tw", "140.119.229.20"
+        ).replace("https://", "http://")
+
+        return scrapy.Request(
+            url=converted_url,
+            callback=self.parse_teacher_list,
+            meta={"teacher_name": teacher_name, "original_url": teacher_stat_url},
+            encoding="big5",
+        )
+
     def process_teacher_from_course(self, course):
         """Process teacher information from course data"""
         try:
@@ -97,16 +310,7 @@ class TeacherDeprecatedSpider(scrapy.Spider):
             elif teacher_stat_url.startswith(
                 f"https://newdoc.nccu.edu.tw/teaschm/{self.YEAR_SEM}/set20.jsp"
             ):
-                converted_url = teacher_stat_url.replace(
-                    "newdoc.nccu.edu.tw", "140.119.229.20"
-                ).replace("https://", "http://")
-
-                yield scrapy.Request(
-                    url=converted_url,
-                    callback=self.parse_teacher_list,
-                    meta={"teacher_name": teacher_name, "original_url": teacher_stat_url},
-                    encoding="big5",
-                )
+                yield self.teacher_list_request(teacher_stat_url, teacher_name)
         except Exception as e:
             self.logger.error(f"Error processing teacher from course: {e}")
 
@@ -129,6 +333,11 @@ class TeacherDeprecatedSpider(scrapy.Spider):
 
     def closed(self, reason):
         """Clean up tracks when spider closes"""
+        if self.mode == "mine":
+            # only what this spider added and failed to delete
+            for course_id in sorted(self.added_tracks):
+                self._delete_added_track(course_id)
+            return
         try:
             auth = getattr(self.user, "auth", None)
             token = getattr(auth, "token", None)
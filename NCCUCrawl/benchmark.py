@@ -0,0 +1,371 @@
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import deque
+from operator import itemgetter
+
+from scrapy.http import HtmlResponse, Request, TextResponse
+
+from NCCUCrawl.items import CourseItem
+from NCCUCrawl.pipelines import ETLPipeline, SCSRSQLitePipeline
+from NCCUCrawl.schema import INDEXES, ensure_indexes, rate_rows
+from NCCUCrawl.spiders.courses import CoursesSpider
+from NCCUCrawl.spiders.remain import CourseRemainSpider
+
+
+def synthetic_course_items(n, seed=0):
+    rng = random.Random(seed)
+    langs = list(ETLPipeline.LANGUAGE_MAPPING) + ["未知"]
+    sem_qtys = list(ETLPipeline.SEM_MAPPING) + [""]
+    kinds = list(ETLPipeline.KIND_MAPPING) + [""]
+    credits = ["3", "2.0", 1, None, "", "N/A"]
+
+    items = []
+    for i in range(n):
+        items.append(
+            CourseItem(
+                id=f"1141{i:09d}",
+                year="114",
+                semester="1",
+                sub_num=f"{i:09d}",
+                name=f"課程 {i}",
+                name_en=None if i % 3 else f"Course {i}",
+                teacher_id=None,
+                kind=rng.choice(kinds),
+                time="一234",
+                lang=rng.choice(langs),
+                lang_en="",
+                sem_qty=rng.choice(sem_qtys),
+                sem_qty_en="",
+                classroom_id="",
+                unit="資訊科學系",
+                unit_en="",
+                college="理學院",
+                degree="學士班",
+                department=None,
+                credit=rng.choice(credits),
+                transition_type="",
+                transition_type_en=None,
+                info=None,
+                info_en=None,
+                note=None,
+                note_en=None,
+                syllabus=["http://example.com"] if i % 5 == 0 else None,
+                syllabus_en=None,
+                objective=None,
+                objective_en=None,
+                core=rng.choice([True, False, 0, 1, None]),
+                discipline=None,
+                last_enroll=None,
+                student_limit=None,
+                student_count=None,
+            )
+        )
+    return items
+
+
+def bench_etl(n, batch_size):
+    etl = ETLPipeline()
+
+    items = synthetic_course_items(n)
+    start = time.perf_counter()
+    per_item = [dict(etl.clean_item(item)) for item in items]
+    per_item_secs = time.perf_counter() - start
+
+    items = synthetic_course_items(n)
+    start = time.perf_counter()
+    batched = []
+    for offset in range(0, n, batch_size):
+        batched.extend(etl.clean_course_batch(items[offset : offset + batch_size]))
+    batch_secs = time.perf_counter() - start
+
+    assert per_item == batched, "batch ETL output differs from per-item ETL"
+
+    print(f"{n} CourseItems, batch size {batch_size}")
+    print(f"  per-item ETL: {per_item_secs:.3f}s ({n / per_item_secs:,.0f} items/s)")
+    print(f"  batch ETL:    {batch_secs:.3f}s ({n / batch_secs:,.0f} items/s)")
+    print(f"  speedup:      {per_item_secs / batch_secs:.2f}x")
+
+
+class _BenchSpider:
+    name = "benchmark"
+    logger = logging.getLogger("benchmark")
+
+
+QUERIES = {
+    "by teacher": (
+        "SELECT id, year, semester FROM course WHERE teacher_id = ?",
+        lambda rng, sems: (f"T{rng.randrange(2000):04d}",),
+    ),
+    "by term": (
+        "SELECT id, department FROM course WHERE year = ? AND semester = ?",
+        lambda rng, sems: (lambda s: (s[:3], s[3]))(rng.choice(sems)),
+    ),
+    "by department+term": (
+        "SELECT id FROM course WHERE department = ? AND year = ? AND semester = ?",
+        lambda rng, sems: (lambda s: (f"系所{rng.randrange(60)}", s[:3], s[3]))(
+            rng.choice(sems)
+        ),
+    ),
+    "by sub_num": (
+        "SELECT id FROM course WHERE sub_num = ?",
+        lambda rng, sems: (f"{rng.randrange(4000):09d}",),
+    ),
+    "by college": (
+        "SELECT COUNT(*) FROM course WHERE college = ? AND year = ?",
+        lambda rng, sems: (f"學院{rng.randrange(10)}", rng.choice(sems)[:3]),
+    ),
+    "rate by course": (
+        "SELECT c.content FROM rate r JOIN rate_content c ON c.hash = r.content_hash"
+        " WHERE r.course_id = ?",
+        lambda rng, sems: (f"{rng.choice(sems)}{rng.randrange(4000):09d}",),
+    ),
+}
+
+
+def _time_queries(conn, semesters, repeat):
+    results = {}
+    for label, (sql, make_params) in QUERIES.items():
+        rng = random.Random(label)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(sql, make_params(rng, semesters)).fetchall()
+        results[label] = (time.perf_counter() - start) / repeat * 1000
+    return results
+
+
+def bench_query(n_semesters, per_semester, repeat):
+    semesters = [f"{year}{sem}" for year in range(101, 115) for sem in "12"]
+    semesters = semesters[:n_semesters]
+    rng = random.Random(0)
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            pipeline = SCSRSQLitePipeline()
+            pipeline.open_spider(_BenchSpider())
+            conn = pipeline.conn
+            for name in INDEXES:
+                conn.execute(f"DROP INDEX IF EXISTS {name}")
+
+            courses = []
+            rates = []
+            for sem in semesters:
+                for i in range(per_semester):
+                    course_id = f"{sem}{i:09d}"
+                    teacher_id = f"T{rng.randrange(2000):04d}"
+                    courses.append(
+                        (
+                            course_id,
+                            sem[:3],
+                            sem[3],
+                            f"{i:09d}",
+                            teacher_id,
+                            f"系所{rng.randrange(60)}",
+                            f"學院{rng.randrange(10)}",
+                        )
+                    )
+                    if i % 4 == 0:
+                        rates.append(
+                            rate_rows(course_id, teacher_id, f"評論{i % 50}" * 20)
+                        )
+            conn.executemany(
+                "INSERT INTO course (id, year, semester, sub_num, teacher_id, department, college)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                courses,
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO rate_content (hash, content, content_en)"
+                " VALUES (:hash, :content, :content_en)",
+                [content for content, _ in rates],
+            )
+            conn.executemany(
+                "INSERT INTO rate (id, course_id, teacher_id, content_hash)"
+                " VALUES (:id, :course_id, :teacher_id, :content_hash)",
+                [rate for _, rate in rates],
+            )
+            conn.commit()
+
+            before = _time_queries(conn, semesters, repeat)
+            start = time.perf_counter()
+            ensure_indexes(conn)
+            index_secs = time.perf_counter() - start
+            after = _time_queries(conn, semesters, repeat)
+            pipeline.close_spider(_BenchSpider())
+        finally:
+            os.chdir(cwd)
+
+    print(
+        f"{len(courses)} courses over {len(semesters)} semesters, {len(rates)} rates"
+        f" (indexes + ANALYZE: {index_secs:.2f}s)"
+    )
+    print(f"  {'query':<20} {'before ms':>10} {'after ms':>10}")
+    for label in QUERIES:
+        print(f"  {label:<20} {before[label]:>10.3f} {after[label]:>10.3f}")
+
+
+# recorded pages read from --fixtures DIR; synthetic stand-ins otherwise
+REMAIN_FIXTURES = ("course_list.json", "syllabus.html", "remain.html")
+
+
+def synthetic_remain_fixtures(n_courses):
+    courses = [
+        {
+            "subNum": f"{i:09d}",
+            "subNam": f"課程 {i}",
+            "teaSchmUrl": f"https://newdoc.nccu.edu.tw/teaschm/1141/schmPrv.jsp-yy=114&smt=1&num={i:09d}",
+            "subRemainUrl": f"https://qrysub.nccu.edu.tw/remain.aspx?num={i:09d}",
+        }
+        for i in range(n_courses)
+    ]
+    paragraphs = "".join(
+        f"<p>課程目標與內容說明 {i} " + "教學" * 40 + "</p>" for i in range(60)
+    )
+    syllabus = (
+        '<html><body><span id="CourseNameEn">Course</span>'
+        f'<div class="container sylview-section"><div><div><div>{paragraphs}'
+        "</div></div></div></div></body></html>"
+    )
+    remain = (
+        '<html><body><span id="Open_to_signable_addingL">是</span>'
+        '<table id="tclmtcntGV"><tr><td>限制類別</td><td>全系Dept.</td><td>全校All Colleges</td></tr>'
+        "<tr><td>限制人數 / Maximum limit</td><td>50</td><td>60</td></tr>"
+        "<tr><td>選課人數 / Number Registered</td><td>45</td><td>52</td></tr>"
+        "<tr><td>餘額 / Number of Available Spaces</td><td>5</td><td>8</td></tr>"
+        "</table></body></html>"
+    )
+    return json.dumps(courses).encode(), syllabus.encode(), remain.encode()
+
+
+def load_remain_fixtures(path):
+    bodies = []
+    for name in REMAIN_FIXTURES:
+        with open(os.path.join(path, name), "rb") as f:
+            bodies.append(f.read())
+    return tuple(bodies)
+
+
+class _SyllabusRemainSpider(CourseRemainSpider):
+    """The remain crawl as it ran before the fast path: list -> syllabus -> remain"""
+
+    parse_course_list = CoursesSpider.parse_course_list
+
+
+def _replay_remain(spider, fixtures, n_lists):
+    """Drive the spider's callbacks offline, answering every request from fixtures."""
+    course_list, syllabus, remain = fixtures
+    spider.unit_mapping = {}
+    list_url = (
+        "https://es.nccu.edu.tw/course/zh-TW/:sem=1141%20:dp1=01%20:dp2=A1%20:dp3={}"
+    )
+    queue = deque(
+        (
+            Request(
+                list_url.format(i),
+                callback=spider.parse_course_list,
+                cb_kwargs={"semester": "1141", "dp1": "01", "dp2": "A1", "dp3": str(i)},
+            ),
+            1,
+        )
+        for i in range(n_lists)
+    )
+    result = {"requests": 0, "bytes": 0, "depth": 0, "items": []}
+    start = time.perf_counter()
+    while queue:
+        request, depth = queue.popleft()
+        callback = request.callback
+        if callback == spider.parse_course_list:
+            response = TextResponse(request.url, body=course_list, request=request)
+        elif callback == spider.parse_syllabus:
+            response = HtmlResponse(request.url, body=syllabus, request=request)
+        else:
+            response = HtmlResponse(request.url, body=remain, request=request)
+        result["requests"] += 1
+        result["bytes"] += len(response.body)
+        result["depth"] = max(result["depth"], depth)
+        for output in callback(response, **request.cb_kwargs) or ():
+            if isinstance(output, Request):
+                queue.append((output, depth + 1))
+            else:
+                result["items"].append(dict(output))
+    result["secs"] = time.perf_counter() - start
+    return result
+
+
+def bench_remain(fixtures_dir, n_courses, n_lists, latency_ms, concurrency):
+    if fixtures_dir:
+        fixtures = load_remain_fixtures(fixtures_dir)
+        source = fixtures_dir
+    else:
+        fixtures = synthetic_remain_fixtures(n_courses)
+        source = "synthetic"
+    n_courses = len(json.loads(fixtures[0]))
+
+    before = _replay_remain(_SyllabusRemainSpider(), fixtures, n_lists)
+    after = _replay_remain(CourseRemainSpider(), fixtures, n_lists)
+    key = itemgetter("course_id")
+    assert sorted(before["items"], key=key) == sorted(after["items"], key=key), (
+        "remain fast path yields different items"
+    )
+
+    print(
+        f"{n_lists} course lists x {n_courses} courses ({source} fixtures),"
+        f" {latency_ms:.0f}ms latency, {concurrency} concurrent requests"
+    )
+    print(
+        f"  {'':<18} {'requests':>9} {'MB':>8} {'parse s':>8} {'hops':>5} {'est. crawl s':>13}"
+    )
+    for label, r in (("list+syllabus", before), ("remain-only", after)):
+        # requests at each hop wait for the previous one, so estimate the
+        # crawl as bandwidth-bound by concurrency plus per-hop latency
+        crawl = (
+            r["requests"] / concurrency * latency_ms / 1000
+            + r["depth"] * latency_ms / 1000
+        )
+        print(
+            f"  {label:<18} {r['requests']:>9} {r['bytes'] / 1e6:>8.1f}"
+            f" {r['secs']:>8.3f} {r['depth']:>5} {crawl + r['secs']:>13.1f}"
+        )
+    print(f"  parse speedup: {before['secs'] / after['secs']:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="NCCUCrawl micro benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    etl_parser = sub.add_parser("etl", help="per-item vs batch CourseItem ETL")
+    etl_parser.add_argument("-n", type=int, default=100_000)
+    etl_parser.add_argument("--batch-size", type=int, default=1000)
+
+    query_parser = sub.add_parser("query", help="course lookups before/after indexes")
+    query_parser.add_argument("--semesters", type=int, default=27)
+    query_parser.add_argument("--per-semester", type=int, default=4000)
+    query_parser.add_argument("--repeat", type=int, default=200)
+
+    remain_parser = sub.add_parser(
+        "remain", help="remain crawl with vs without syllabus fetches"
+    )
+    remain_parser.add_argument(
+        "--fixtures",
+        default=None,
+        help="directory with recorded " + ", ".join(REMAIN_FIXTURES),
+    )
+    remain_parser.add_argument("--courses", type=int, default=200)
+    remain_parser.add_argument("--lists", type=int, default=20)
+    remain_parser.add_argument("--latency-ms", type=float, default=150)
+    remain_parser.add_argument("--concurrency", type=int, default=16)
+
+    args = parser.parse_args()
+    if args.command == "etl":
+        bench_etl(args.n, args.batch_size)
+    elif args.command == "query":
+        bench_query(args.semesters, args.per_semester, args.repeat)
+    elif args.command == "remain":
+        bench_remain(
+            args.fixtures, args.courses, args.lists, args.latency_ms, args.concurrency
+        )
@@ -1,59 +1,103 @@
 # filepath: [quick_fix.py](http://_vscodecontentref_/0)
+import argparse
+import fileinput
 import re
+import sys
 
+# 一次比對 unistr('...') 或一般字串常值，一般字串原樣保留
+TOKEN = re.compile(r"unistr\s*\(\s*'((?:[^']|'')*)'\s*\)|'(?:[^']|'')*'", re.DOTALL)
+# unistr 的轉義序列：\uXXXX、\XXXX 與 \\
+UNISTR_ESCAPE = re.compile(r"\\(?:u?([0-9a-fA-F]{4})|(\\))")
+WHITESPACE = re.compile(r"\s+")
+INSERT_INTO = re.compile(r"^INSERT INTO (\S+) VALUES")
 
-def simple_unistr_fix(input_file, output_file):
-    with open(input_file, "r", encoding="utf-8") as f:
-        content = f.read()
 
-    def simple_replace(match):
-        unicode_string = match.group(1)
+def _decode_escape(match):
+    if match.group(2):
+        return "\\"
+    return chr(int(match.group(1), 16))
 
-        # 處理常見的轉義序列，但不轉換換行符
-        result = unicode_string
-        # 將 \u000a (換行) 轉為空格，避免產生實際換行
-        result = result.replace("\\u000a", " ")  # 換行改為空格
-        result = result.replace("\\u000d", " ")  # 回車改為空格
-        result = result.replace("\\u0009", " ")  # Tab改為空格
-        result = result.replace("\\\\", "\\")  # 反斜線
 
-        # 移除多餘的空格
-        result = re.sub(r"\s+", " ", result).strip()
+def _replace_token(match):
+    unicode_string = match.group(1)
+    if unicode_string is None:
+        return match.group(0)
 
-        # 處理 SQL 單引號
-        escaped = result.replace("'", "''")
-        return f"'{escaped}'"
+    result = unicode_string.replace("''", "'")
+    result = UNISTR_ESCAPE.sub(_decode_escape, result)
 
-    # 簡單的替換
-    pattern = r"unistr\s*\(\s*'([^']*(?:''[^']*)*)'\s*\)"
-    fixed_content = re.sub(pattern, simple_replace, content, flags=re.DOTALL)
+    # 換行、回車、Tab 改為空格，避免產生實際換行，並移除多餘的空格
+    result = WHITESPACE.sub(" ", result).strip()
 
-    # 處理可能剩餘的簡單情況
-    fixed_content = re.sub(r"unistr\s*\(\s*'", "'", fixed_content)
-    fixed_content = re.sub(r"'\s*\)", "')", fixed_content)
+    # 處理 SQL 單引號
+    escaped = result.replace("'", "''")
+    return f"'{escaped}'"
 
+
+def iter_statements(lines):
+    """Group dump lines into complete statements (a `;` outside a string literal)."""
+    buf = []
+    in_quote = False
+    for line in lines:
+        buf.append(line)
+        # '' escapes contribute two quotes, so odd counts toggle the state
+        if line.count("'") % 2:
+            in_quote = not in_quote
+        if not in_quote and line.rstrip().endswith(";"):
+            yield "".join(buf)
+            buf = []
+    if buf:
+        yield "".join(buf)
+
+
+def fix_statement(statement):
+    if "'" in statement:
+        statement = TOKEN.sub(_replace_token, statement)
     # 將 INSERT INTO 改為 INSERT OR REPLACE INTO 來處理重複記錄
-    fixed_content = re.sub(
-        r"\bINSERT INTO COURSE VALUES",
-        "INSERT OR REPLACE INTO COURSE VALUES",
-        fixed_content,
-    )
+    return INSERT_INTO.sub(r"INSERT OR REPLACE INTO \1 VALUES", statement, count=1)
 
-    # 如果有其他表格，也一併處理
-    fixed_content = re.sub(
-        r"\bINSERT INTO (\w+) VALUES",
-        r"INSERT OR REPLACE INTO \1 VALUES",
-        fixed_content,
-    )
 
-    with open(output_file, "w", encoding="utf-8", newline="") as f:
-        f.write(fixed_content)
+def simple_unistr_fix(input_files, output_file):
+    """Stream a sqlite3 .dump statement by statement; "-" means stdin/stdout."""
+    if isinstance(input_files, str):
+        input_files = [input_files]
+
+    count = 0
+    with fileinput.input(input_files, encoding="utf-8") as lines:
+        out = (
+            sys.stdout
+            if output_file == "-"
+            else open(output_file, "w", encoding="utf-8", newline="")
+        )
+        try:
+            for statement in iter_statements(lines):
+                out.write(fix_statement(statement))
+                count += 1
+        finally:
+            if out is not sys.stdout:
+                out.close()
 
     print(
-        "Processing complete. Changed INSERT to INSERT OR REPLACE to handle duplicates."
+        f"Processing complete. {count} statements, INSERT changed to INSERT OR REPLACE.",
+        file=sys.stderr,
     )
-    print(f"Output written to {output_file}")
+    if output_file != "-":
+        print(f"Output written to {output_file}", file=sys.stderr)
+
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Rewrite a sqlite3 .dump into portable INSERT OR REPLACE statements"
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="*",
+        default=["output.sql"],
+        help='dump files (or chunks) processed in order, "-" for stdin',
+    )
+    parser.add_argument(
+        "-o", "--output", default="output_fixed.sql", help='"-" for stdout'
+    )
+    args = parser.parse_args()
 
-# 使用簡單版本
-simple_unistr_fix("output.sql", "output_fixed.sql")
+    simple_unistr_fix(args.inputs, args.output)
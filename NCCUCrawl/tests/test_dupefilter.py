@@ -0,0 +1,168 @@
+import math
+
+import pytest
+from scrapy import Request
+
+from NCCUCrawl.dupefilter import (
+    BLOOM_FILE,
+    EXACT_FILE,
+    BloomDupeFilter,
+    BloomSlice,
+    ScalableBloomFilter,
+)
+
+
+def keys(n, prefix="k"):
+    return [f"{prefix}{i}".encode() for i in range(n)]
+
+
+def test_slice_size_follows_capacity_and_error_rate():
+    s = BloomSlice(1000, 0.01)
+    assert s.nbits == math.ceil(-1000 * math.log(0.01) / math.log(2) ** 2)
+    assert s.hashes == round(s.nbits / 1000 * math.log(2))
+    assert len(s.bits) == (s.nbits + 7) // 8
+
+
+def test_add_reports_duplicates():
+    bloom = ScalableBloomFilter(capacity=100)
+    assert bloom.add(b"a") is False
+    assert bloom.add(b"a") is True
+    assert b"a" in bloom
+    assert len(bloom) == 1
+
+
+def test_slices_grow_and_tighten():
+    bloom = ScalableBloomFilter(error_rate=0.01, capacity=100)
+    for key in keys(700):
+        bloom.add(key)
+    # 100 + 200 + 400 items
+    assert [s.capacity for s in bloom.slices] == [100, 200, 400]
+    assert all(not s.full for s in bloom.slices[-1:])
+    # each slice gets half the error rate, so more bits per item
+    per_item = [s.nbits / s.capacity for s in bloom.slices]
+    assert per_item == sorted(per_item)
+    assert len(bloom) == sum(s.count for s in bloom.slices)
+
+
+def test_no_false_negatives():
+    bloom = ScalableBloomFilter(capacity=500)
+    added = keys(3000)
+    for key in added:
+        bloom.add(key)
+    assert all(key in bloom for key in added)
+
+
+def test_false_positive_rate_stays_below_error_rate():
+    error_rate = 0.01
+    bloom = ScalableBloomFilter(error_rate=error_rate, capacity=1000)
+    for key in keys(20_000):
+        bloom.add(key)
+    assert len(bloom.slices) > 1
+    probes = keys(100_000, prefix="absent")
+    false_positives = sum(key in bloom for key in probes)
+    # the slices are sized for 0.97% together; allow for sampling noise
+    assert false_positives / len(probes) < error_rate * 1.2
+
+
+def test_invalid_error_rate():
+    with pytest.raises(ValueError):
+        ScalableBloomFilter(error_rate=1.0)
+
+
+def test_save_load_round_trip(tmp_path):
+    bloom = ScalableBloomFilter(error_rate=0.01, capacity=100)
+    added = keys(350)
+    for key in added:
+        bloom.add(key)
+    path = tmp_path / BLOOM_FILE
+    bloom.save(path)
+
+    loaded = ScalableBloomFilter.load(path)
+    assert (loaded.error_rate, loaded.capacity) == (bloom.error_rate, bloom.capacity)
+    assert len(loaded) == len(bloom)
+    assert [bytes(s.bits) for s in loaded.slices] == [
+        bytes(s.bits) for s in bloom.slices
+    ]
+    assert all(key in loaded for key in added)
+    # keeps growing from where it stopped
+    assert loaded.add(b"new") is False
+    assert len(loaded) == len(bloom) + 1
+
+
+def test_load_rejects_bad_files(tmp_path):
+    path = tmp_path / BLOOM_FILE
+    path.write_bytes(b"not a bloom filter")
+    with pytest.raises(ValueError):
+        ScalableBloomFilter.load(path)
+
+    bloom = ScalableBloomFilter(capacity=100)
+    bloom.add(b"a")
+    bloom.save(path)
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        ScalableBloomFilter.load(path)
+
+
+DETAIL = r"/course/zh-TW/\d"
+
+
+def test_exact_patterns_bypass_the_bloom_filter():
+    dupefilter = BloomDupeFilter(exact_patterns=[DETAIL])
+    detail = Request("https://es.nccu.edu.tw/course/zh-TW/1131000123")
+    other = Request("https://es.nccu.edu.tw/course/zh-TW/:sem=1131")
+    assert dupefilter.request_seen(detail) is False
+    assert dupefilter.request_seen(detail) is True
+    assert dupefilter.request_seen(other) is False
+    assert dupefilter.request_seen(other) is True
+    assert len(dupefilter.exact) == 1
+    assert len(dupefilter.bloom) == 1
+
+
+def test_requests_carrying_an_item_bypass_the_bloom_filter():
+    dupefilter = BloomDupeFilter()
+    syllabus = Request("https://example.com/syllabus", meta={"item": {}})
+    assert dupefilter.request_seen(syllabus) is False
+    assert dupefilter.request_seen(syllabus) is True
+    assert len(dupefilter.exact) == 1
+    assert len(dupefilter.bloom) == 0
+
+
+def test_default_exact_patterns_cover_course_carriers():
+    from NCCUCrawl import settings
+
+    dupefilter = BloomDupeFilter(exact_patterns=settings.DUPEFILTER_EXACT_PATTERNS)
+    for url in (
+        "https://es.nccu.edu.tw/course/zh-TW/1131000123",
+        "https://newdoc.nccu.edu.tw/teaschm/1131/statistic.jsp-tnum=123.htm",
+        "https://newdoc.nccu.edu.tw/teaschm/1141/schmPrv.jsp-yy=114&smt=1&num=1",
+        "https://qrysub.nccu.edu.tw/remain.aspx?num=000000001",
+    ):
+        dupefilter.request_seen(Request(url))
+    dupefilter.request_seen(Request("https://es.nccu.edu.tw/course/zh-TW/:sem=1131"))
+    assert len(dupefilter.exact) == 4
+    assert len(dupefilter.bloom) == 1
+
+
+def test_fingerprints_persist_across_runs(tmp_path):
+    detail = Request("https://es.nccu.edu.tw/course/zh-TW/1131000123")
+    other = Request("https://es.nccu.edu.tw/course/zh-TW/:sem=1131")
+
+    first = BloomDupeFilter(str(tmp_path / "job"), exact_patterns=[DETAIL])
+    first.request_seen(detail)
+    first.request_seen(other)
+    first.close("finished")
+    assert (tmp_path / "job" / BLOOM_FILE).exists()
+    assert (tmp_path / "job" / EXACT_FILE).exists()
+
+    second = BloomDupeFilter(str(tmp_path / "job"), exact_patterns=[DETAIL])
+    assert second.request_seen(detail) is True
+    assert second.request_seen(other) is True
+    assert second.request_seen(Request("https://es.nccu.edu.tw/x")) is False
+    second.close("finished")
+
+
+def test_corrupt_bloom_file_starts_empty(tmp_path):
+    (tmp_path / BLOOM_FILE).write_bytes(b"garbage")
+    dupefilter = BloomDupeFilter(str(tmp_path))
+    assert len(dupefilter.bloom) == 0
+    dupefilter.close("finished")
@@ -0,0 +1,100 @@
+import types
+
+import pytest
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider
+from scrapy.utils.test import get_crawler
+
+from NCCUCrawl.feeder import RequestFeeder, semester_priorities
+
+
+def test_semester_priorities_newest_first():
+    assert semester_priorities(["1121", "1132", "992", "1131"]) == [
+        ("1132", 0),
+        ("1131", -1),
+        ("1121", -2),
+        ("992", -3),
+    ]
+
+
+@pytest.fixture
+def crawler():
+    crawler = get_crawler(settings_dict={"DEPTH_PRIORITY": -100})
+    crawler.crawled = []
+    crawler.engine = types.SimpleNamespace(crawl=crawler.crawled.append)
+    return crawler
+
+
+def make_feeder(crawler, n=5, size=2):
+    requests = (Request(f"https://example.com/{i}") for i in range(n))
+    return RequestFeeder(crawler, requests, size=size, depth=1)
+
+
+def leave(crawler, request, signal=signals.request_left_downloader):
+    crawler.signals.send_catch_log(signal, request=request, spider=None)
+
+
+def test_start_hands_out_one_batch(crawler):
+    feeder = make_feeder(crawler)
+    batch = feeder.start()
+    assert [r.url for r in batch] == ["https://example.com/0", "https://example.com/1"]
+    assert feeder.outstanding == {0, 1}
+    assert not crawler.crawled
+
+
+def test_finished_request_is_replaced(crawler):
+    feeder = make_feeder(crawler)
+    first, _ = feeder.start()
+    leave(crawler, first)
+    assert feeder.outstanding == {1, 2}
+    (request,) = crawler.crawled
+    assert request.url == "https://example.com/2"
+    # DepthMiddleware's part, as engine.crawl() skips the spider middlewares
+    assert request.meta["depth"] == 1
+    assert request.priority == 100
+
+
+def test_dropped_request_is_replaced(crawler):
+    feeder = make_feeder(crawler)
+    first, _ = feeder.start()
+    leave(crawler, first, signal=signals.request_dropped)
+    assert feeder.outstanding == {1, 2}
+
+
+def test_retries_and_foreign_requests_are_not_counted(crawler):
+    feeder = make_feeder(crawler)
+    first, _ = feeder.start()
+    leave(crawler, first)
+    # a retry carries the same feeder key, already released
+    leave(crawler, first.replace(dont_filter=True))
+    leave(crawler, Request("https://example.com/other"))
+    assert feeder.outstanding == {1, 2}
+    assert len(crawler.crawled) == 1
+
+
+def test_exhausted_feeder_stops(crawler):
+    feeder = make_feeder(crawler, n=3)
+    batch = feeder.start()
+    for request in batch:
+        leave(crawler, request)
+    for request in list(crawler.crawled):
+        leave(crawler, request)
+    assert feeder.exhausted
+    assert feeder.outstanding == set()
+    assert feeder.fed == 3
+    assert crawler.stats.get_value("feeder/requests") == 3
+    # nothing left to keep the spider open for
+    assert feeder.spider_idle() is None
+
+
+def test_idle_spider_restarts_a_lost_batch(crawler):
+    feeder = make_feeder(crawler)
+    feeder.start()
+    # both handed-out requests vanished without a signal
+    with pytest.raises(DontCloseSpider):
+        feeder.spider_idle()
+    assert [r.url for r in crawler.crawled] == [
+        "https://example.com/2",
+        "https://example.com/3",
+    ]
+    assert feeder.outstanding == {2, 3}
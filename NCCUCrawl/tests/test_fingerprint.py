@@ -0,0 +1,103 @@
+import pytest
+from scrapy import Request
+from scrapy.utils.test import get_crawler
+
+from NCCUCrawl.fingerprint import NCCURequestFingerprinter, canonicalize_nccu_url
+
+LIST_URL = (
+    "https://es.nccu.edu.tw/course/zh-TW/:dp1=01%20:dp2=A1%20:dp3=105%20:sem=1131"
+)
+DETAIL_URL = "https://es.nccu.edu.tw/course/zh-TW/1131000123"
+STATISTIC_URL = "https://newdoc.nccu.edu.tw/teaschm/1131/statistic.jsp-tnum=123&x=1.htm"
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        (LIST_URL, LIST_URL),
+        # filters in any order, with a trailing slash
+        (
+            "https://es.nccu.edu.tw/course/zh-TW/:sem=1131%20:dp1=01%20:dp2=A1%20:dp3=105%20/",
+            LIST_URL,
+        ),
+        ("http://es.nccu.edu.tw/course/zh-TW/1131000123/", DETAIL_URL),
+        ("https://ES.NCCU.EDU.TW/course/zh-TW/1131000123", DETAIL_URL),
+        # cache-busting markers
+        (f"{DETAIL_URL}/?_spider_req=5", DETAIL_URL),
+        (f"{DETAIL_URL}/?_spider_req=5_en", DETAIL_URL),
+        (f"{DETAIL_URL}/?_direct_17", DETAIL_URL),
+        # host alias and .jsp- parameter order
+        (
+            "https://140.119.229.20/teaschm/1131/statistic.jsp-x=1&tnum=123.htm/",
+            STATISTIC_URL,
+        ),
+        (
+            "http://newdoc.nccu.edu.tw/teaschm/1131/statistic.jsp-x=1&tnum=123.htm",
+            STATISTIC_URL,
+        ),
+    ],
+)
+def test_canonicalize_nccu_url(url, expected):
+    assert canonicalize_nccu_url(url) == expected
+
+
+def test_canonicalize_keeps_other_query_params():
+    assert (
+        canonicalize_nccu_url(f"{DETAIL_URL}?lang=en&_direct_3")
+        == f"{DETAIL_URL}?lang=en"
+    )
+
+
+def test_canonicalize_other_hosts_only_lose_strip_params():
+    assert (
+        canonicalize_nccu_url("http://example.com/a/?b=1&_spider_req=2")
+        == "http://example.com/a/?b=1"
+    )
+
+
+def test_canonicalize_leaves_mixed_path_segments():
+    url = "https://es.nccu.edu.tw/course/zh-TW/x:sem=1131"
+    assert canonicalize_nccu_url(url) == url
+
+
+def test_canonicalize_custom_strip_params():
+    url = f"{DETAIL_URL}?_spider_req=5&t=9"
+    assert (
+        canonicalize_nccu_url(url, strip_params=[r"t"]) == f"{DETAIL_URL}?_spider_req=5"
+    )
+    assert (
+        canonicalize_nccu_url(url, strip_params=[]) == f"{DETAIL_URL}?_spider_req=5&t=9"
+    )
+
+
+def test_fingerprinter_merges_equivalent_urls():
+    fingerprinter = NCCURequestFingerprinter()
+    request = Request("http://es.nccu.edu.tw/course/zh-TW/1131000123/?_spider_req=5")
+    assert fingerprinter.fingerprint(request) == fingerprinter.fingerprint(
+        Request(DETAIL_URL)
+    )
+    # only the fingerprint is canonical
+    assert request.url.startswith("http://")
+
+
+def test_fingerprinter_separates_different_pages():
+    fingerprinter = NCCURequestFingerprinter()
+    other = Request("https://es.nccu.edu.tw/course/zh-TW/1131000124")
+    assert fingerprinter.fingerprint(Request(DETAIL_URL)) != fingerprinter.fingerprint(
+        other
+    )
+    post = Request(DETAIL_URL, method="POST")
+    assert fingerprinter.fingerprint(Request(DETAIL_URL)) != fingerprinter.fingerprint(
+        post
+    )
+
+
+def test_fingerprinter_from_crawler_strip_params():
+    crawler = get_crawler(settings_dict={"FINGERPRINT_STRIP_PARAMS": [r"t"]})
+    fingerprinter = NCCURequestFingerprinter.from_crawler(crawler)
+    assert fingerprinter.fingerprint(
+        Request(f"{DETAIL_URL}?t=1")
+    ) == fingerprinter.fingerprint(Request(DETAIL_URL))
+    assert fingerprinter.fingerprint(
+        Request(f"{DETAIL_URL}?_spider_req=1")
+    ) != fingerprinter.fingerprint(Request(DETAIL_URL))
@@ -0,0 +1,123 @@
+import argparse
+import sqlite3
+
+import pytest
+
+from NCCUCrawl.database import list_shards, merge_shards, shard_path
+from NCCUCrawl.feeder import shard_slice
+from NCCUCrawl.launcher import (
+    Task,
+    _parse_overrides,
+    plan_tasks,
+    semester_weights,
+    staging_path,
+)
+from NCCUCrawl.schema import migrate
+
+
+def test_plan_tasks_largest_first_then_newest():
+    tasks = plan_tasks("data.db", ["1121", "1131", "1132"], 1, {"1121": 500})
+    assert [task.semester for task in tasks] == ["1121", "1132", "1131"]
+    assert [task.db for task in tasks] == [
+        "data.staging/1121.db",
+        "data.staging/1132.db",
+        "data.staging/1131.db",
+    ]
+
+
+def test_plan_tasks_split_semesters():
+    tasks = plan_tasks("out/data.db", ["1131", "1132"], 2, {})
+    assert [(task.semester, task.part, task.db) for task in tasks] == [
+        ("1132", 0, "out/data.staging/1132.0.db"),
+        ("1132", 1, "out/data.staging/1132.1.db"),
+        ("1131", 0, "out/data.staging/1131.0.db"),
+        ("1131", 1, "out/data.staging/1131.1.db"),
+    ]
+    assert {task.parts for task in tasks} == {2}
+
+
+def test_staging_files_are_not_shards(tmp_path):
+    base = str(tmp_path / "data.db")
+    staged = staging_path(base, "1131")
+    (tmp_path / "data.staging").mkdir()
+    for path in (base, staged, shard_path(base, "1132")):
+        sqlite3.connect(path).close()
+    assert list_shards(base) == [shard_path(base, "1132")]
+
+
+def test_merge_keeps_staged_dead_letters(tmp_path):
+    base = str(tmp_path / "data.db")
+    staged = str(tmp_path / "data.1131.db")
+    conn = sqlite3.connect(staged)
+    migrate(conn)
+    conn.executemany(
+        "INSERT INTO dead_letter (id, spider, url, reason, attempts, request, body) "
+        "VALUES (?, 'courses', ?, 'timeout', 3, '{}', x'')",
+        [(7, "https://example.com/a"), (8, "https://example.com/b")],
+    )
+    conn.commit()
+    conn.close()
+    conn = sqlite3.connect(base)
+    migrate(conn)
+    conn.execute("INSERT INTO dead_letter (id, spider, url) VALUES (7, 'remain', 'x')")
+    conn.commit()
+    conn.close()
+
+    assert merge_shards(base, [staged])["dead_letter"] == 2
+    # merging the same file again does not duplicate them
+    assert merge_shards(base, [staged], delete=True)["dead_letter"] == 0
+
+    conn = sqlite3.connect(base)
+    rows = conn.execute("SELECT spider, url FROM dead_letter ORDER BY id").fetchall()
+    conn.close()
+    assert rows == [
+        ("remain", "x"),
+        ("courses", "https://example.com/a"),
+        ("courses", "https://example.com/b"),
+    ]
+
+
+def test_task_label():
+    assert Task("1131", 0, 1, "data.1131.db").label == "1131"
+    assert Task("1131", 1, 3, "data.1131.1.db").label == "1131 2/3"
+
+
+def test_semester_weights(tmp_path):
+    db = str(tmp_path / "data.db")
+    assert semester_weights(db, "courses") == {}
+
+    conn = sqlite3.connect(db)
+    conn.execute("CREATE TABLE course (year TEXT, semester TEXT)")
+    conn.executemany(
+        "INSERT INTO course VALUES (?, ?)",
+        [("113", "1"), ("113", "1"), ("113", "2")],
+    )
+    conn.commit()
+    conn.close()
+
+    assert semester_weights(db, "courses") == {"1131": 2, "1132": 1}
+    # no course_legacy table yet, or no table for the spider at all
+    assert semester_weights(db, "courses_deprecated") == {}
+    assert semester_weights(db, "teacher") == {}
+
+
+def test_parse_overrides():
+    assert _parse_overrides(["A=1", "B=x=y", "C="]) == {"A": "1", "B": "x=y", "C": ""}
+    with pytest.raises(argparse.ArgumentTypeError):
+        _parse_overrides(["DOWNLOAD_DELAY"])
+
+
+def test_shard_slice():
+    items = list(range(7))
+    assert shard_slice(items, None) == items
+    assert shard_slice(items, "0/3") == [0, 3, 6]
+    assert shard_slice(items, "2/3") == [2, 5]
+    # the shards cover every item exactly once
+    covered = [item for i in range(3) for item in shard_slice(items, f"{i}/3")]
+    assert sorted(covered) == items
+
+
+@pytest.mark.parametrize("shard", ["3/3", "-1/3", "1/0"])
+def test_shard_slice_rejects_bad_shards(shard):
+    with pytest.raises(ValueError):
+        shard_slice([1, 2, 3], shard)
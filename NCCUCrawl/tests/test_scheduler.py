@@ -0,0 +1,75 @@
+import time
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.utils.test import get_crawler
+
+from NCCUCrawl.scheduler import HoldingScheduler, set_hold_time
+
+# the downloader-aware default needs a running engine
+SETTINGS = {"SCHEDULER_PRIORITY_QUEUE": "scrapy.pqueues.ScrapyPriorityQueue"}
+
+
+@pytest.fixture
+def scheduler():
+    crawler = get_crawler(Spider, SETTINGS)
+    crawler.holds = {}
+    set_hold_time(crawler, lambda request, now: crawler.holds.get(request.url, 0))
+    scheduler = HoldingScheduler.from_crawler(crawler)
+    scheduler.open(Spider("test"))
+    yield scheduler
+    scheduler.close("finished")
+
+
+def test_held_requests_are_parked(scheduler):
+    scheduler.crawler.holds["https://a/1"] = 60
+    for url in ("https://a/1", "https://b/1"):
+        scheduler.enqueue_request(Request(url))
+    assert scheduler.next_request().url == "https://b/1"
+    assert scheduler.next_request() is None
+    # parked requests keep the spider open
+    assert len(scheduler) == 1
+    assert scheduler.has_pending_requests()
+    assert scheduler.stats.get_value("scheduler/held") == 1
+
+
+def test_parked_request_goes_out_when_its_hold_ends(scheduler, monkeypatch):
+    scheduler.crawler.holds["https://a/1"] = 30
+    scheduler.enqueue_request(Request("https://a/1"))
+    assert scheduler.next_request() is None
+
+    start = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: start + 31)
+    # the hold is asked again on release, e.g. a breaker that reopened
+    assert scheduler.next_request() is None
+    assert len(scheduler) == 1
+
+    scheduler.crawler.holds.clear()
+    monkeypatch.setattr(time, "monotonic", lambda: start + 62)
+    assert scheduler.next_request().url == "https://a/1"
+    assert len(scheduler) == 0
+
+
+def test_without_a_hold_time_nothing_is_parked():
+    scheduler = HoldingScheduler.from_crawler(get_crawler(Spider, SETTINGS))
+    scheduler.open(Spider("test"))
+    scheduler.enqueue_request(Request("https://a/1"))
+    assert scheduler.next_request().url == "https://a/1"
+    scheduler.close("finished")
+
+
+def test_parked_requests_go_back_to_the_disk_queue(tmp_path):
+    crawler = get_crawler(Spider, {**SETTINGS, "JOBDIR": str(tmp_path)})
+    set_hold_time(crawler, lambda request, now: 60)
+    scheduler = HoldingScheduler.from_crawler(crawler)
+    scheduler.open(Spider("test"))
+    scheduler.enqueue_request(Request("https://a/1"))
+    assert scheduler.next_request() is None
+    scheduler.close("shutdown")
+
+    resumed = HoldingScheduler.from_crawler(
+        get_crawler(Spider, {**SETTINGS, "JOBDIR": str(tmp_path)})
+    )
+    resumed.open(Spider("test"))
+    assert resumed.next_request().url == "https://a/1"
+    resumed.close("finished")